@@ -0,0 +1,96 @@
+import functools
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+# Chart aggregations are memoized here; AGGREGATION_CACHE=off recomputes everything
+CACHE_DIR = 'data/cache/aggregations'
+HASH_CHUNK = 1 << 20
+
+def cache_enabled() -> bool:
+    return os.getenv("AGGREGATION_CACHE", "on").lower() not in ("off", "0", "false")
+
+def load_json(path: str, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return default
+
+def save_json(path: str, value):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+def file_hash(path: str, cache_dir=CACHE_DIR) -> str:
+    """
+    SHA-1 of a file's contents. Hashes are remembered by path, size and
+    modification time, so an unchanged input is not read again.
+    """
+    stat = os.stat(path)
+    hashes_path = os.path.join(cache_dir, "hashes.json")
+    hashes = load_json(hashes_path, {})
+    key = os.path.abspath(path)
+    known = hashes.get(key)
+    if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+        return known[2]
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    hashes[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    save_json(hashes_path, hashes)
+    return digest.hexdigest()
+
+def encode(value):
+    if isinstance(value, tuple):
+        return {"tuple": [encode(v) for v in value]}
+    if isinstance(value, defaultdict):
+        return {"defaultdict": dict(value)}
+    return {"value": value}
+
+def decode(value):
+    if "tuple" in value:
+        return tuple(decode(v) for v in value["tuple"])
+    if "defaultdict" in value:
+        return defaultdict(float, value["defaultdict"])
+    return value["value"]
+
+def cached_aggregation(name: str, version: int, scope: str = "all chapters", inputs=None):
+    """
+    Memoizes an aggregation over one output file, or a list of them, on disk.
+    Results are keyed by the content hash of every input file, the
+    aggregator's name and version, and the chapter scope it reads; bump the
+    version whenever the aggregation's logic changes. inputs(path) lists the
+    files a path stands for, if the aggregation reads more than the path itself.
+    Results must be JSON-serializable dicts, or tuples of them.
+    """
+    def decorator(aggregate):
+        @functools.wraps(aggregate)
+        def wrapper(json_path, *args, **kwargs):
+            if not cache_enabled():
+                return aggregate(json_path, *args, **kwargs)
+
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            paths = [json_path] if isinstance(json_path, str) else list(json_path)
+            files = [f for path in paths for f in (inputs(path) if inputs else [path])]
+            key = json.dumps({
+                "aggregator": name,
+                "version": version,
+                "scope": scope,
+                "inputs": [file_hash(f) for f in files],
+                "args": [args, kwargs],
+            }, sort_keys=True, default=str)
+            cache_path = os.path.join(CACHE_DIR, f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json")
+
+            cached = load_json(cache_path, None)
+            if cached is not None:
+                return decode(cached)
+            result = aggregate(json_path, *args, **kwargs)
+            save_json(cache_path, encode(result))
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,55 @@
+import json
+import os
+
+# Drivers classify every chapter unless data/analysis_scope.json narrows it;
+# ANALYSIS_SCOPE=all ignores that file and classifies everything.
+SCOPE_PATH = 'data/analysis_scope.json'
+DEFAULT_SCOPE = {
+    "first_chapter": 1,
+    "last_chapter": None,  # None for every chapter
+    "paragraphs_per_chapter": None,  # Only the first N paragraphs of each chapter, None for all
+}
+
+class AnalysisScope:
+    """
+    The chapters and paragraphs the classifier drivers classify. Paragraphs
+    outside the scope are skipped; widening the scope later only classifies
+    what the drivers' journals do not already hold.
+    """
+
+    def __init__(self, first_chapter=1, last_chapter=None, paragraphs_per_chapter=None):
+        self.first_chapter = first_chapter
+        self.last_chapter = last_chapter
+        self.paragraphs_per_chapter = paragraphs_per_chapter
+
+    def includes(self, chapter: int) -> bool:
+        return chapter >= self.first_chapter and (self.last_chapter is None or chapter <= self.last_chapter)
+
+    def select(self, chapter: int, paragraphs: list) -> dict:
+        """
+        {index: paragraph} for the chapter's paragraphs inside the scope.
+        """
+        if not self.includes(chapter):
+            return {}
+        limit = self.paragraphs_per_chapter
+        return dict(enumerate(paragraphs if limit is None else paragraphs[:limit]))
+
+    def describe(self) -> str:
+        chapters = f"chapters {self.first_chapter}-{self.last_chapter}" if self.last_chapter is not None \
+            else f"chapters {self.first_chapter}+"
+        if self.paragraphs_per_chapter is not None:
+            chapters += f", first {self.paragraphs_per_chapter} paragraphs each"
+        return chapters
+
+    @classmethod
+    def load(cls, path=SCOPE_PATH) -> "AnalysisScope":
+        """
+        DEFAULT_SCOPE, overridden by the scope file.
+        """
+        if os.getenv("ANALYSIS_SCOPE") == "all":
+            return cls()
+        scope = dict(DEFAULT_SCOPE)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                scope.update(json.load(f))
+        return cls(**scope)
@@ -0,0 +1,21 @@
+import re
+
+# Every driver splits books with these, so paragraph positions and IDs line up across outputs
+MIN_CHAPTER_LENGTH = 1000  # Shorter chapters (title pages, contents) are dropped
+MIN_PARAGRAPH_LENGTH = 50
+
+def read_book(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return file.read()
+
+def split_into_chapters(text, min_length=MIN_CHAPTER_LENGTH):
+    chapters = re.split(r'\bCHAPTER\b', text)
+    chapters = [chapter.strip() for chapter in chapters if chapter.strip()]
+    chapters = [chapter for chapter in chapters if len(chapter) >= min_length]
+    return chapters
+
+def split_into_paragraphs(chapter_text):
+    paragraphs = chapter_text.split('\n\n')
+    paragraphs = [para.strip() for para in paragraphs if para.strip()]
+    paragraphs = [para for para in paragraphs if len(para) >= MIN_PARAGRAPH_LENGTH]
+    return paragraphs
@@ -0,0 +1,179 @@
+import importlib
+import json
+import os
+import random
+from collections import defaultdict
+from tqdm import tqdm
+from journal import Journal, journal_path
+from analysis_scope import AnalysisScope
+from retry import DeadLetterFile, dead_letter_path, run_chapter_jobs
+from book_text import read_book, split_into_chapters, split_into_paragraphs
+
+# Cascade settings
+CASCADE_LLM = "gpt"  # "gpt" or "gemini" handles the paragraphs the local model is unsure about
+LLM_BACKENDS = {
+    "gpt": "gpt_classify_emotions",
+    "gemini": "gemini_classify_emotions",
+}
+DEFAULT_THRESHOLD = 0.8  # Used until a calibration file exists
+TARGET_AGREEMENT = 0.9  # Calibrated threshold keeps accepted local labels this close to the LLM
+CALIBRATION_PATH = 'data/emotions/cascade_calibration.json'
+HELD_OUT_FRACTION = 0.5
+CALIBRATION_SEED = 13
+
+def local_predictions(paragraphs: list) -> list:
+    """
+    (emotion, confidence) from the local model for each paragraph. The confidence
+    of an emotion is the summed softmax probability of every classifier label that
+    maps onto it, e.g. joy + surprise for Joy. A paragraph the model fails on
+    gets (None, 0.0), so the cascade sends it to the LLM.
+    """
+    from oss_classify_emotions import get_worker, map_emotion
+
+    predictions = []
+    for scores in get_worker().predict(paragraphs, top_k=None):
+        if scores is None:
+            predictions.append((None, 0.0))
+            continue
+        totals = defaultdict(float)
+        for score in scores:
+            totals[map_emotion(score['label'])] += score['score']
+        emotion = max(totals, key=totals.get)
+        predictions.append((emotion, totals[emotion]))
+    return predictions
+
+def calibrate_threshold(local: list, reference: list, target_agreement=TARGET_AGREEMENT) -> float:
+    """
+    Lowest confidence threshold at which the local labels it accepts still agree
+    with the reference (LLM) labels at least target_agreement of the time.
+    """
+    ranked = sorted(zip(local, reference), key=lambda pair: pair[0][1], reverse=True)
+    threshold = 1.0
+    agreed = 0
+    for accepted, ((emotion, confidence), label) in enumerate(ranked, start=1):
+        agreed += emotion == label
+        if agreed / accepted >= target_agreement:
+            threshold = confidence
+    return threshold
+
+def cascade_report(local: list, reference: list, threshold: float) -> dict:
+    """
+    How a cascade at this threshold would have done against an all-LLM labelling.
+    """
+    cascade = [emotion if confidence >= threshold else label for (emotion, confidence), label in zip(local, reference)]
+    llm_calls = sum(1 for _, confidence in local if confidence < threshold)
+    total = len(reference)
+    return {
+        "paragraphs": total,
+        "threshold": threshold,
+        "llm_calls": llm_calls,
+        "api_call_reduction": 1 - llm_calls / total if total else 0.0,
+        "cascade_agreement": sum(c == r for c, r in zip(cascade, reference)) / total if total else 0.0,
+        "local_only_agreement": sum(e == r for (e, _), r in zip(local, reference)) / total if total else 0.0,
+    }
+
+def calibrate(reference_path: str, calibration_path=CALIBRATION_PATH, target_agreement=TARGET_AGREEMENT) -> dict:
+    """
+    Calibrates the threshold on half of an all-LLM output file and reports the
+    API-call reduction and agreement on the other, held-out half.
+    """
+    with open(reference_path, 'r', encoding='utf-8') as f:
+        entries = [
+            entry for chapter in json.load(f) for entry in chapter.get('emotions', [])
+            if entry.get('emotion') not in (None, "Unknown")
+        ]
+    random.Random(CALIBRATION_SEED).shuffle(entries)
+    split = int(len(entries) * (1 - HELD_OUT_FRACTION))
+    calibration, held_out = entries[:split], entries[split:]
+
+    local = local_predictions([entry['paragraph'] for entry in entries])
+    threshold = calibrate_threshold(local[:split], [entry['emotion'] for entry in calibration], target_agreement)
+    report = cascade_report(local[split:], [entry['emotion'] for entry in held_out], threshold)
+    report["reference"] = reference_path
+
+    with open(calibration_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Calibrated threshold {threshold:.3f} on {len(calibration)} paragraphs; on {len(held_out)} held out:")
+    print(f"  API calls saved: {report['api_call_reduction']:.1%}")
+    print(f"  Agreement with all-LLM labels: {report['cascade_agreement']:.1%} "
+          f"(local model alone: {report['local_only_agreement']:.1%})")
+    return report
+
+def load_threshold(calibration_path=CALIBRATION_PATH) -> float:
+    if os.path.exists(calibration_path):
+        with open(calibration_path, 'r', encoding='utf-8') as f:
+            return json.load(f)["threshold"]
+    return DEFAULT_THRESHOLD
+
+def process_books(input_dir, output_dir, threshold: float = None, scope: AnalysisScope = None):
+    os.makedirs(output_dir, exist_ok=True)
+    scope = scope or AnalysisScope.load()
+    threshold = load_threshold() if threshold is None else threshold
+    llm = importlib.import_module(LLM_BACKENDS[CASCADE_LLM])
+
+    def classify_llm(paragraph):
+        return {**llm.rate_limited_classify(paragraph), "provider": CASCADE_LLM}
+
+    book_files = [f for f in os.listdir(input_dir) if f.endswith('.txt')]
+
+    for book_file in tqdm(book_files, desc="Processing Books"):
+        book_path = os.path.join(input_dir, book_file)
+        journal = Journal(journal_path(output_dir, book_file, "_emotions_cascade"))
+        dead_letters = DeadLetterFile(dead_letter_path(output_dir, book_file, "_emotions_cascade"))
+        chapter_sizes = []
+        local_count = 0
+        llm_count = 0
+
+        book_text = read_book(book_path)
+        chapters = split_into_chapters(book_text)
+
+        for idx, chapter in enumerate(tqdm(chapters, desc=f"Processing {book_file} Chapters", leave=False), start=1):
+            paragraphs = split_into_paragraphs(chapter)
+            chapter_sizes.append((idx, len(paragraphs)))
+
+            # Skip paragraphs outside the analysis scope or already classified by an earlier run
+            pending = dead_letters.select(idx, journal.pending(idx, scope.select(idx, paragraphs)))
+
+            # Accept confident local labels, send the rest to the LLM
+            uncertain = {}
+            for (index, para), (emotion, confidence) in zip(pending.items(), local_predictions(list(pending.values()))):
+                if confidence >= threshold:
+                    journal.record(idx, index, {
+                        "paragraph": para,
+                        "emotion": emotion,
+                        "provider": "oss",
+                        "confidence": confidence
+                    })
+                    local_count += 1
+                else:
+                    uncertain[index] = para
+
+            llm_count += run_chapter_jobs(journal, dead_letters, idx, uncertain, classify_llm, llm.limiter.max_limit,
+                                          llm.breaker, desc=f"Chapter {idx} Uncertain Paragraphs")
+
+        book_output = os.path.join(output_dir, f"{os.path.splitext(book_file)[0]}_emotions_cascade.json")
+        journal.compact(book_output, chapter_sizes, 'emotions')
+        journal.close()
+        dead_letters.close(journal)
+
+        classified = local_count + llm_count
+        if classified:
+            print(f"{book_file}: {local_count}/{classified} paragraphs labelled locally, "
+                  f"{llm_count} sent to {CASCADE_LLM} ({local_count / classified:.1%} fewer API calls)")
+
+    return True
+
+if __name__ == "__main__":
+    input_directory = 'data/sample_texts'
+    output_directory = 'data/emotions'
+    # An all-LLM run of the same label set to calibrate the threshold against
+    reference_output = 'data/emotions/jk_rowling_sample_emotions_gpt.json'
+
+    if os.path.exists(reference_output):
+        calibrate(reference_output)
+
+    success = process_books(input_directory, output_directory)
+
+    if success:
+        print("Successfully processed all books and classified emotions")
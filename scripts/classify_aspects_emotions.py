@@ -0,0 +1,158 @@
+import enum
+from typing_extensions import TypedDict
+import google.generativeai as genai
+import json
+from tqdm import tqdm
+import os
+import time
+from collections import deque
+from threading import Lock
+from providers import get_gemini_model
+from concurrency import AdaptiveLimiter
+from retry import CircuitBreaker, DeadLetterFile, InvalidResponseError, dead_letter_path, run_chapter_jobs
+from journal import Journal, journal_path
+from analysis_scope import AnalysisScope
+from dedup import Deduplicator
+from book_text import read_book, split_into_chapters, split_into_paragraphs
+
+# Same label sets as classify_paragraphs.py and gemini_classify_emotions.py
+class Aspect(enum.Enum):
+    DIALOGUE = "Dialogue"
+    ACTION = "Action"
+    EXPOSITION = "Exposition"
+    DESCRIPTION = "Description"
+    INNER_THOUGHTS = "Inner Thoughts"
+
+class Emotion(enum.Enum):
+    JOY = "Joy"
+    SAD = "Sad"
+    POWERFUL = "Powerful"
+    SCARED = "Scared"
+    MAD = "Mad"
+    NEUTRAL = "Neutral"
+
+# Response schema: both labels come back in one JSON object
+class AspectEmotion(TypedDict):
+    aspect: Aspect
+    emotion: Emotion
+
+# Initialize the Gemini Generative Model
+model = get_gemini_model("gemini-1.5-pro-latest")
+
+# Rate limiting setup
+MAX_REQUESTS_PER_MIN = 500
+request_times = deque()
+request_lock = Lock()
+
+# Adaptive concurrency: in-flight requests grow while the API is healthy and back off on 429s/5xx
+limiter = AdaptiveLimiter("aspects+emotions", initial_limit=10, max_limit=64)
+breaker = CircuitBreaker("aspects+emotions")
+
+# Near-duplicate paragraphs (reprints, repeated passages) are classified once per run
+DEDUPLICATE = True
+
+def rate_limited_classify(paragraph):
+    """
+    Classifies one paragraph's aspect and emotion with a single request. Failures
+    raise so the RetryScheduler can back off and retry, or dead-letter the paragraph.
+    """
+    with request_lock:
+        current_time = time.time()
+        while request_times and current_time - request_times[0] > 60:
+            request_times.popleft()
+
+        if len(request_times) >= MAX_REQUESTS_PER_MIN:
+            sleep_time = 60 - (current_time - request_times[0])
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+                current_time = time.time()
+
+        request_times.append(current_time)
+
+    prompt = [
+        "Classify this paragraph into one of the following aspects: Dialogue, Action, Exposition, Description, or Inner Thoughts.",
+        "Also classify its emotional tone into one of these emotions: Joy, Sad, Powerful, Scared, Neutral, or Mad, "
+        "considering the overall mood, word choice, and context.",
+        paragraph
+    ]
+
+    with limiter.slot():
+        result = model.generate_content(
+            prompt,
+            generation_config=genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=AspectEmotion
+            ),
+        )
+
+    try:
+        labels = json.loads(result.text)
+    except (json.JSONDecodeError, TypeError):
+        raise InvalidResponseError(f"Failed to parse JSON response: {result.text}")
+    aspect = labels.get('aspect')
+    emotion = labels.get('emotion')
+    if not any(aspect == a.value for a in Aspect):
+        raise InvalidResponseError(f"Invalid aspect classification received: {aspect}")
+    if not any(emotion == e.value for e in Emotion):
+        raise InvalidResponseError(f"Invalid emotion classification received: {emotion}")
+
+    return {
+        "paragraph": paragraph,
+        "aspect": aspect,
+        "emotion": emotion
+    }
+
+def process_books(input_dir, output_dir, emotions_output_dir=None, scope: AnalysisScope = None):
+    """
+    Writes <book>_classifications.json to output_dir and <book>_emotions.json to
+    emotions_output_dir (output_dir if not given), the same files
+    classify_paragraphs.py and gemini_classify_emotions.py produce.
+    """
+    emotions_output_dir = emotions_output_dir or output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(emotions_output_dir, exist_ok=True)
+    scope = scope or AnalysisScope.load()
+
+    book_files = [f for f in os.listdir(input_dir) if f.endswith('.txt')]
+    dedup = Deduplicator(enabled=DEDUPLICATE)
+
+    for book_file in tqdm(book_files, desc="Processing Books"):
+        book_path = os.path.join(input_dir, book_file)
+        journal = Journal(journal_path(output_dir, book_file, "_aspects_emotions"))
+        dead_letters = DeadLetterFile(dead_letter_path(output_dir, book_file, "_aspects_emotions"))
+        chapter_sizes = []
+
+        book_text = read_book(book_path)
+        chapters = split_into_chapters(book_text)
+
+        for idx, chapter in enumerate(tqdm(chapters, desc=f"Processing {book_file} Chapters", leave=False), start=1):
+            paragraphs = split_into_paragraphs(chapter)
+            chapter_sizes.append((idx, len(paragraphs)))
+
+            # Skip paragraphs outside the analysis scope or already classified by an earlier run
+            pending = journal.pending(idx, scope.select(idx, paragraphs))
+
+            # Classify one representative per near-duplicate cluster, reusing labels already known
+            run_chapter_jobs(journal, dead_letters, idx, pending, rate_limited_classify, limiter.max_limit, breaker,
+                             dedup=dedup, postfix=lambda: {"limit": limiter.current_limit})
+
+        base_name = os.path.splitext(book_file)[0]
+        journal.compact(os.path.join(output_dir, f"{base_name}_classifications.json"),
+                        chapter_sizes, 'classifications', fields=['paragraph', 'aspect'])
+        journal.compact(os.path.join(emotions_output_dir, f"{base_name}_emotions.json"),
+                        chapter_sizes, 'emotions', fields=['paragraph', 'emotion'])
+        journal.close()
+        dead_letters.close(journal)
+
+    print(dedup.report())
+    return True
+
+if __name__ == "__main__":
+    input_directory = 'data/sample_texts'
+    aspects_output_directory = 'data/stylometry'
+    emotions_output_directory = 'data/emotions'
+
+    success = process_books(input_directory, aspects_output_directory, emotions_output_directory)
+
+    if success:
+        print("Successfully classified aspects and emotions for all books")
@@ -1,14 +1,18 @@
 import enum
 from typing_extensions import TypedDict
-from hume.client import AsyncHumeClient
-import re
-import json
 from tqdm import tqdm
 import os
 import time
 from collections import deque
 import asyncio
-from datetime import datetime
+from journal import Journal, journal_path
+from analysis_scope import AnalysisScope
+from dedup import Deduplicator
+from providers import get_hume_client, use_fake_backend
+from concurrency import AsyncAdaptiveLimiter
+from emotion_matrix import score_vector, write_matrix
+from retry import CircuitBreaker, DeadLetterFile, RetriesExhausted, backoff_delay, dead_letter_path, is_provider_failure
+from book_text import read_book, split_into_chapters, split_into_paragraphs
 
 # Define emotion response structure
 class EmotionClassification(TypedDict):
@@ -16,155 +20,346 @@ class EmotionClassification(TypedDict):
     emotions: dict  # Will store emotion scores from Hume
 
 # Rate limiting setup
-MAX_CONCURRENT_BATCHES = 5
+INITIAL_CONCURRENT_BATCHES = 5  # Starting point for the adaptive limit on outstanding jobs
+MAX_CONCURRENT_BATCHES = 20
+breaker = CircuitBreaker("hume")
+
+# Near-duplicate paragraphs (reprints, repeated passages) are classified once per run
+DEDUPLICATE = True
 MAX_REQUESTS_PER_SECOND = 50
 request_times = deque()
 request_lock = asyncio.Lock()
 
-# Checkpointing settings
-CHECKPOINT_INTERVAL = 10  # Save after every 10 chapters
+# Batching settings
+PARAGRAPHS_PER_JOB = None  # None submits each chapter as one job, N > 0 submits N paragraphs per job
+JOB_TIMEOUT = 120  # Base polling timeout per job in seconds
+JOB_TIMEOUT_PER_PARAGRAPH = 2  # Extra polling time allowed for each paragraph in a job
+MAX_JOB_ATTEMPTS = 3  # Submissions per batch before giving up
+
+# Job polling settings
+POLL_INTERVAL = 2  # Seconds between polls of all outstanding jobs
+MAX_POLL_ERRORS = 5  # Consecutive status errors before a job is treated as failed
+USE_LIST_JOBS = True  # Fetch statuses with one list_jobs call when the client supports it
+LIST_JOBS_SLACK = 20  # Extra jobs to list in case others were started in the meantime
+
+# Output settings
+SENTENCE_ROWS = False  # Also keep each sentence's scores, written as <book>_emotions_hume.sentences.npy
+WRITE_JSON = True  # Also write the <book>_emotions_hume.json read by feeling_wheel_v3 and load_test
 
-async def poll_for_completion(client: AsyncHumeClient, job_id: str, timeout=120):
+async def wait_for_rate_limit():
     """
-    Polls for the completion of a job with a specified timeout (in seconds).
+    Blocks until another request fits within MAX_REQUESTS_PER_SECOND.
     """
-    try:
-        await asyncio.wait_for(poll_until_complete(client, job_id), timeout=timeout)
-    except asyncio.TimeoutError:
-        print(f"Polling timed out after {timeout} seconds.")
+    async with request_lock:
+        current_time = time.time()
+        # Remove requests older than 1 second
+        while request_times and current_time - request_times[0] > 1:
+            request_times.popleft()
+
+        # If we've hit the rate limit, wait until we can make another request
+        if len(request_times) >= MAX_REQUESTS_PER_SECOND:
+            sleep_time = 1 - (current_time - request_times[0])
+            if sleep_time > 0:
+                await asyncio.sleep(sleep_time)
+                current_time = time.time()
+
+        request_times.append(current_time)
+
+class JobFailedError(Exception):
+    """Raised when a Hume job finishes in the FAILED state."""
 
-async def poll_until_complete(client: AsyncHumeClient, job_id: str):
+class JobTimeoutError(Exception):
+    """Raised when a Hume job does not finish before its deadline."""
+
+class JobTracker:
     """
-    Continuously polls job status until completion with exponential backoff.
+    Owns every outstanding Hume job and polls them all on one shared schedule.
+    Each tracked job gets a future that resolves as soon as a poll sees it finish.
     """
-    delay = 1  # Start with 1-second delay
 
-    while True:
-        await asyncio.sleep(delay)
-        job_details = await client.expression_measurement.batch.get_job_details(job_id)
-        status = job_details.state.status
+    def __init__(self, client, poll_interval=POLL_INTERVAL, max_poll_errors=MAX_POLL_ERRORS):
+        self.client = client
+        self.poll_interval = poll_interval
+        self.max_poll_errors = max_poll_errors
+        self.jobs = {}  # job_id -> {"future", "deadline", "timeout", "poll_errors"}
+        self.task = None
 
-        if status == "COMPLETED":
-            break
-        elif status == "FAILED":
-            raise Exception(f"Job failed: {job_details.state.message}")
+    def track(self, job_id: str, timeout: float) -> asyncio.Future:
+        """
+        Registers a job and returns a future resolved with its job details.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.jobs[job_id] = {
+            "future": future,
+            "deadline": loop.time() + timeout,
+            "timeout": timeout,
+            "poll_errors": 0,
+        }
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+        return future
+
+    async def wait(self, job_id: str, timeout: float):
+        return await self.track(job_id, timeout)
+
+    async def run(self):
+        while self.jobs:
+            await asyncio.sleep(self.poll_interval)
+            await self.poll()
+
+    async def poll(self):
+        """
+        Fetches the status of every outstanding job and resolves finished ones.
+        """
+        statuses = await self.fetch_statuses(list(self.jobs))
+        now = asyncio.get_running_loop().time()
 
-        delay = min(delay * 2, 16)  # Exponential backoff, max 16 seconds
+        for job_id, job in list(self.jobs.items()):
+            future = job["future"]
+            details = statuses.get(job_id)
 
-async def classify_emotions(paragraph: str, client, sem: asyncio.Semaphore):
-    async with sem:
-        async with request_lock:
-            current_time = time.time()
-            # Remove requests older than 1 second
-            while request_times and current_time - request_times[0] > 1:
-                request_times.popleft()
+            if future.done():
+                pass  # The waiter went away, nothing left to resolve
+            elif isinstance(details, Exception):
+                job["poll_errors"] += 1
+                if job["poll_errors"] >= self.max_poll_errors:
+                    future.set_exception(JobFailedError(
+                        f"Job {job_id} status could not be fetched after {job['poll_errors']} attempts: {details}"
+                    ))
+            elif details is not None:
+                job["poll_errors"] = 0
+                status = details.state.status
+                if status == "COMPLETED":
+                    future.set_result(details)
+                elif status == "FAILED":
+                    message = getattr(details.state, "message", "")
+                    future.set_exception(JobFailedError(f"Job {job_id} failed: {message}"))
 
-            # If we've hit the rate limit, wait until we can make another request
-            if len(request_times) >= MAX_REQUESTS_PER_SECOND:
-                sleep_time = 1 - (current_time - request_times[0])
-                if sleep_time > 0:
-                    await asyncio.sleep(sleep_time)
-                    current_time = time.time()
+            if not future.done() and now >= job["deadline"]:
+                future.set_exception(JobTimeoutError(f"Job {job_id} did not finish within {job['timeout']} seconds"))
 
-            request_times.append(current_time)
+            if future.done():
+                del self.jobs[job_id]
 
+    async def fetch_statuses(self, job_ids: list) -> dict:
+        """
+        Returns job details keyed by job ID, or the exception raised fetching them.
+        Uses a single list_jobs call when the client supports it and falls back to
+        get_job_details for any job the listing did not include.
+        """
+        batch = self.client.expression_measurement.batch
+        statuses = {}
+
+        if USE_LIST_JOBS and hasattr(batch, "list_jobs"):
+            try:
+                await wait_for_rate_limit()
+                wanted = set(job_ids)
+                for details in await batch.list_jobs(limit=len(job_ids) + LIST_JOBS_SLACK):
+                    if details.job_id in wanted:
+                        statuses[details.job_id] = details
+            except Exception as e:
+                print(f"Warning: list_jobs failed, polling jobs individually: {str(e)}")
+
+        async def get_details(job_id):
+            await wait_for_rate_limit()
+            return await batch.get_job_details(job_id)
+
+        missing = [job_id for job_id in job_ids if job_id not in statuses]
+        results = await asyncio.gather(*(get_details(job_id) for job_id in missing), return_exceptions=True)
+        statuses.update(zip(missing, results))
+        return statuses
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        for job in self.jobs.values():
+            job["future"].cancel()
+        self.jobs.clear()
+
+def chunk_paragraphs(paragraphs: list, paragraphs_per_job):
+    """
+    Splits a chapter's paragraphs (or their cluster IDs) into the batches submitted as single jobs.
+    """
+    if not paragraphs_per_job:
+        return [paragraphs] if paragraphs else []
+    return [paragraphs[i:i + paragraphs_per_job] for i in range(0, len(paragraphs), paragraphs_per_job)]
+
+def sentence_scores(prediction) -> list:
+    """
+    Every sentence's {emotion: score} dict from a single text's prediction.
+    """
+    language_predictions = prediction.models.language
+    if not language_predictions or not language_predictions.grouped_predictions:
+        return []
+    return [
+        {emotion.name: emotion.score for emotion in sentence.emotions}
+        for group in language_predictions.grouped_predictions
+        for sentence in group.predictions
+    ]
+
+def parse_emotions(prediction) -> dict:
+    """
+    Extracts a paragraph's emotion scores: each emotion's mean over its sentences.
+    """
+    sentences = sentence_scores(prediction)
+    totals = {}
+    for sentence in sentences:
+        for name, score in sentence.items():
+            totals[name] = totals.get(name, 0.0) + score
+    return {name: total / len(sentences) for name, total in totals.items()}
+
+def source_prediction(source):
+    """
+    The prediction for one submitted text, or None if its source failed or came back empty.
+    """
+    results = getattr(source, "results", None)
+    if getattr(source, "error", None) or results is None or getattr(results, "errors", None):
+        return None
+    predictions = results.predictions or []
+    return predictions[0] if predictions else None
+
+async def wait_for_circuit():
+    """
+    Pauses while the Hume circuit breaker is open.
+    """
+    while (delay := breaker.time_until_closed()) > 0:
+        await asyncio.sleep(delay)
+
+async def classify_emotions(paragraphs: list, client, limiter: AsyncAdaptiveLimiter, tracker: JobTracker):
+    """
+    Classifies a batch of paragraphs with a single inference job.
+    The job returns one source per text in submission order, so source i is
+    paragraph i's prediction; a paragraph whose source failed comes back as None,
+    and so does every paragraph if the source count does not match.
+    Failed or timed out jobs are resubmitted with jittered backoff, honoring Retry-After,
+    and RetriesExhausted is raised after MAX_JOB_ATTEMPTS.
+    """
+    for attempt in range(1, MAX_JOB_ATTEMPTS + 1):
+        await wait_for_circuit()
         try:
-            # Start the inference job with text in a list
-            job = await client.expression_measurement.batch.start_inference_job(
-                text=[paragraph],
-                models={
-                    "language": {
-                        "granularity": "sentence"
+            # Each job holds one slot of the adaptive limit from submission until its predictions arrive;
+            # only the submit and fetch calls are timed, since the job's runtime grows with its size
+            # and the rate limit waits are our own
+            async with limiter.slot() as clock:
+                with clock.excluding():
+                    await wait_for_rate_limit()
+
+                # Start one inference job for the whole batch of texts
+                job = await client.expression_measurement.batch.start_inference_job(
+                    text=paragraphs,
+                    models={
+                        "language": {
+                            "granularity": "sentence"
+                        }
                     }
-                }
-            )
-            
-            await poll_for_completion(client, job, timeout=120)
-            
-            # Get predictions after job completes
-            result = await client.expression_measurement.batch.get_job_predictions(id=job)
-            emotions = {}
-            
-            # Updated parsing logic for Hume API response
-            if result and len(result) > 0:
-                predictions = result[0].results.predictions
-                if predictions and len(predictions) > 0:
-                    language_predictions = predictions[0].models.language
-                    if language_predictions and language_predictions.grouped_predictions:
-                        for prediction in language_predictions.grouped_predictions[0].predictions:
-                            for emotion in prediction.emotions:
-                                emotions[emotion.name] = emotion.score
-
-            return {
-                "paragraph": paragraph,
-                "emotions": emotions
-            }
+                )
+
+                timeout = JOB_TIMEOUT + JOB_TIMEOUT_PER_PARAGRAPH * len(paragraphs)
+                with clock.excluding():
+                    await tracker.wait(job, timeout)
+                    await wait_for_rate_limit()
+
+                # Get predictions after job completes
+                result = await client.expression_measurement.batch.get_job_predictions(id=job)
+            breaker.record_success()
+            break
         except Exception as e:
-            print(f"Warning: Emotion classification failed for paragraph: {str(e)}")
-            return {
-                "paragraph": paragraph,
-                "emotions": {}
-            }
+            if is_provider_failure(e):
+                breaker.record_failure()
+            print(f"Warning: Attempt {attempt}/{MAX_JOB_ATTEMPTS} failed with {type(e).__name__}: {str(e)}")
+            if attempt == MAX_JOB_ATTEMPTS:
+                raise RetriesExhausted(e, attempt)
+            await asyncio.sleep(backoff_delay(attempt, e))
 
-def save_checkpoint(book_file: str, book_emotions: list, output_dir: str, final: bool = False):
-    """
-    Save the current progress to a checkpoint file
-    """
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    base_name = os.path.splitext(book_file)[0]
-    
-    if final:
-        output_file = os.path.join(output_dir, f"{base_name}_emotions.json")
-    else:
-        output_file = os.path.join(output_dir, f"{base_name}_checkpoint_{timestamp}.json")
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(book_emotions, f, indent=2)
-    
-    if not final:
-        print(f"Checkpoint saved: {output_file}")
+    # The job returns one source per submitted text, in submission order
+    if len(result) != len(paragraphs):
+        print(f"Warning: Expected {len(paragraphs)} sources, received {len(result)}; failing the batch")
+        return [None] * len(paragraphs)
+
+    classifications = [None] * len(paragraphs)
+    for index, source in enumerate(result):
+        prediction = source_prediction(source)
+        if prediction is None:
+            continue
+        classifications[index] = {
+            "paragraph": paragraphs[index],
+            "emotions": parse_emotions(prediction)
+        }
+        if SENTENCE_ROWS:
+            classifications[index]["sentences"] = [score_vector(s) for s in sentence_scores(prediction)]
+    return classifications
 
 # Main function to process books
-async def process_books(input_dir: str, output_dir: str, hume_api_key: str):
+async def process_books(input_dir: str, output_dir: str, hume_api_key: str, scope: AnalysisScope = None):
     os.makedirs(output_dir, exist_ok=True)
+    scope = scope or AnalysisScope.load()
 
     # Initialize Hume client with AsyncHumeBatchClient
-    client = client = AsyncHumeClient(api_key=hume_api_key)
+    client = get_hume_client(hume_api_key)
+    tracker = JobTracker(client)
+    limiter = AsyncAdaptiveLimiter("hume", initial_limit=INITIAL_CONCURRENT_BATCHES, max_limit=MAX_CONCURRENT_BATCHES)
 
     book_files = [f for f in os.listdir(input_dir) if f.endswith('.txt')]
+    dedup = Deduplicator(enabled=DEDUPLICATE)
 
     for book_file in tqdm(book_files, desc="Processing Books"):
         book_path = os.path.join(input_dir, book_file)
-        book_emotions = []
+        journal = Journal(journal_path(output_dir, book_file, "_emotions_hume"))
+        dead_letters = DeadLetterFile(dead_letter_path(output_dir, book_file, "_emotions_hume"))
+        chapter_sizes = []
 
-        with open(book_path, 'r', encoding='utf-8') as file:
-            book_text = file.read()
-
-        chapters = re.split(r'\bCHAPTER\b', book_text)
-        chapters = [chapter.strip() for chapter in chapters if chapter.strip()]
+        # Hume has always kept the short chapters the other drivers drop, so its chapter numbers differ
+        chapters = split_into_chapters(read_book(book_path), min_length=0)
 
         for idx, chapter in enumerate(tqdm(chapters, desc=f"Processing {book_file} Chapters"), start=1):
-            paragraphs = [p.strip() for p in chapter.split('\n\n') if len(p.strip()) >= 50]
-            chapter_emotions = []
+            paragraphs = split_into_paragraphs(chapter)
+            chapter_sizes.append((idx, len(paragraphs)))
+
+            # Skip paragraphs outside the analysis scope or already classified by an earlier run
+            pending = dead_letters.select(idx, journal.pending(idx, scope.select(idx, paragraphs)))
 
-            # Update semaphore to use MAX_CONCURRENT_BATCHES
-            sem = asyncio.Semaphore(MAX_CONCURRENT_BATCHES)
-            tasks = [classify_emotions(para, client, sem) for para in paragraphs]
-            chapter_emotions = await asyncio.gather(*tasks)
+            # Classify one representative per near-duplicate cluster, reusing results already known
+            clusters = dedup.group(pending)
+            for cluster in [c for c in clusters if dedup.known(c)]:
+                for index in clusters.pop(cluster):
+                    journal.record(idx, index, dedup.fan_out(cluster, pending[index]))
 
-            chapter_data = {
-                'chapter': idx,
-                'emotions': chapter_emotions
-            }
-            book_emotions.append(chapter_data)
+            async def classify_batch(batch):
+                representatives = [pending[clusters[cluster][0]] for cluster in batch]
+                try:
+                    results = await classify_emotions(representatives, client, limiter, tracker)
+                except RetriesExhausted as e:
+                    results = [e] * len(batch)
+                # Journal each batch as soon as it completes; failed paragraphs are dead-lettered
+                for cluster, classification in zip(batch, results):
+                    if isinstance(classification, dict):
+                        dedup.resolve(cluster, classification)
+                        for index in clusters[cluster]:
+                            journal.record(idx, index, dedup.fan_out(cluster, pending[index]))
+                    else:
+                        error = classification or ValueError("No prediction returned")
+                        for index in clusters[cluster]:
+                            dead_letters.add(idx, index, pending[index], error)
 
-            # Save checkpoint every CHECKPOINT_INTERVAL chapters
-            if idx % CHECKPOINT_INTERVAL == 0:
-                save_checkpoint(book_file, book_emotions, output_dir)
+            batches = chunk_paragraphs(list(clusters), PARAGRAPHS_PER_JOB)
+            await asyncio.gather(*(classify_batch(batch) for batch in batches))
+            print(f"Chapter {idx}: adaptive job limit {limiter.current_limit}")
 
-        # Save final emotion classifications
-        save_checkpoint(book_file, book_emotions, output_dir, final=True)
+        # Save final emotion classifications as a score matrix, plus the JSON layout if wanted
+        book_output = os.path.join(output_dir, f"{os.path.splitext(book_file)[0]}_emotions_hume.json")
+        write_matrix(book_output, journal.records, chapter_sizes)
+        if WRITE_JSON:
+            journal.compact(book_output, chapter_sizes, 'emotions', fields=['paragraph', 'emotions'])
+        journal.close()
+        dead_letters.close(journal)
 
+    await tracker.close()
+    print(dedup.report())
     return True
 
 if __name__ == "__main__":
@@ -172,7 +367,7 @@ if __name__ == "__main__":
     output_directory = 'data/emotions'
     hume_api_key = os.environ.get('HUME_API_KEY')
     
-    if not hume_api_key:
+    if not hume_api_key and not use_fake_backend():
         raise ValueError("HUME_API_KEY environment variable is not set")
 
     asyncio.run(process_books(input_directory, output_directory, hume_api_key))
@@ -1,14 +1,18 @@
 import enum
 from typing_extensions import TypedDict
 import google.generativeai as genai
-import re
-import json
 from tqdm import tqdm
 import os
-import concurrent.futures
 import time
 from collections import deque
 from threading import Lock
+from providers import get_gemini_model
+from concurrency import AdaptiveLimiter
+from retry import CircuitBreaker, DeadLetterFile, InvalidResponseError, dead_letter_path, run_chapter_jobs
+from journal import Journal, journal_path
+from analysis_scope import AnalysisScope
+from dedup import Deduplicator
+from book_text import read_book, split_into_chapters, split_into_paragraphs
 
 # Define the five aspects as an Enum
 class Aspect(enum.Enum):
@@ -23,13 +27,20 @@ class ParagraphClassification(TypedDict):
     aspect: str  # Changed to str since we'll store the enum value as string
 
 # Initialize the Gemini Generative Model
-model = genai.GenerativeModel("gemini-1.5-pro-latest")
+model = get_gemini_model("gemini-1.5-pro-latest")
 
 # Rate limiting setup
 MAX_REQUESTS_PER_MIN = 500
 request_times = deque()
 request_lock = Lock()
 
+# Adaptive concurrency: in-flight requests grow while the API is healthy and back off on 429s/5xx
+limiter = AdaptiveLimiter("aspects", initial_limit=10, max_limit=64)
+breaker = CircuitBreaker("aspects")
+
+# Near-duplicate paragraphs (reprints, repeated passages) are classified once per run
+DEDUPLICATE = True
+
 def rate_limited_classify(paragraph):
     with request_lock:
         current_time = time.time()
@@ -47,7 +58,9 @@ def rate_limited_classify(paragraph):
         # Add current request timestamp
         request_times.append(current_time)
     
-    try:
+    # Failures (including blocked paragraphs, which raise ValueError) propagate to the
+    # RetryScheduler, which retries or dead-letters them instead of recording "Unknown"
+    with limiter.slot():
         result = model.generate_content(
             ["Classify this paragraph into one of the following aspects:", paragraph],
             generation_config=genai.GenerationConfig(
@@ -55,53 +68,29 @@ def rate_limited_classify(paragraph):
                 response_schema=Aspect
             ),
         )
-        return {
-            "paragraph": paragraph,
-            "aspect": result.text
-        }
-    except ValueError as e:
-        print(f"Warning: Classification failed for paragraph: {str(e)}")
-        return {
-            "paragraph": paragraph,
-            "aspect": "Unknown"  # Default classification when blocked
-        }
-
-# Function to read the book from a text file
-def read_book(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return file.read()
-
-# Function to split the book into chapters
-def split_into_chapters(text):
-    # Assuming chapters are separated by "Chapter" headings
-    chapters = re.split(r'\bCHAPTER\b', text)
-    # Remove any empty strings and strip whitespace
-    chapters = [chapter.strip() for chapter in chapters if chapter.strip()]
-    # Filter out chapters that are too short (less than 1000 characters)
-    chapters = [chapter for chapter in chapters if len(chapter) >= 1000]
-    return chapters
-
-# Function to split a chapter into paragraphs
-def split_into_paragraphs(chapter_text):
-    # Split by double newline, assuming paragraphs are separated by blank lines
-    paragraphs = chapter_text.split('\n\n')
-    # Remove empty strings and strip whitespace
-    paragraphs = [para.strip() for para in paragraphs if para.strip()]
-    # Filter out paragraphs that are too short (less than 50 characters)
-    paragraphs = [para for para in paragraphs if len(para) >= 50]
-    return paragraphs
+    if not any(result.text == a.value for a in Aspect):
+        raise InvalidResponseError(f"Invalid aspect classification received: {result.text}")
+    return {
+        "paragraph": paragraph,
+        "aspect": result.text
+    }
 
 # Main function to process books
-def process_books(input_dir, output_dir):
+def process_books(input_dir, output_dir, scope: AnalysisScope = None):
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
+    scope = scope or AnalysisScope.load()
     
     # Get all text files in the input directory
     book_files = [f for f in os.listdir(input_dir) if f.endswith('.txt')]
+    dedup = Deduplicator(enabled=DEDUPLICATE)
     
     for book_file in tqdm(book_files, desc="Processing Books"):
         book_path = os.path.join(input_dir, book_file)
-        book_classifications = []
+        # Completed paragraphs are journaled so an interrupted run can resume
+        journal = Journal(journal_path(output_dir, book_file, "_classifications"))
+        dead_letters = DeadLetterFile(dead_letter_path(output_dir, book_file, "_classifications"))
+        chapter_sizes = []
         
         book_text = read_book(book_path)
         chapters = split_into_chapters(book_text)
@@ -109,34 +98,22 @@ def process_books(input_dir, output_dir):
         # Process each chapter
         for idx, chapter in enumerate(tqdm(chapters, desc=f"Processing {book_file} Chapters", leave=False), start=1):
             paragraphs = split_into_paragraphs(chapter)
-            chapter_classifications = []
+            chapter_sizes.append((idx, len(paragraphs)))
             
-            # Process paragraphs in parallel with ThreadPoolExecutor
-            with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-                future_to_para = {executor.submit(rate_limited_classify, para): para 
-                                for para in paragraphs}
-                
-                for future in tqdm(
-                    concurrent.futures.as_completed(future_to_para),
-                    total=len(paragraphs),
-                    desc=f"Chapter {idx} Paragraphs",
-                    unit="para",
-                    leave=False
-                ):
-                    classification = future.result()
-                    chapter_classifications.append(classification)
+            # Skip paragraphs outside the analysis scope or already classified by an earlier run
+            pending = journal.pending(idx, scope.select(idx, paragraphs))
             
-            chapter_data = {
-                'chapter': idx,
-                'classifications': chapter_classifications
-            }
-            book_classifications.append(chapter_data)
+            # Classify one representative per near-duplicate cluster, reusing labels already known
+            run_chapter_jobs(journal, dead_letters, idx, pending, rate_limited_classify, limiter.max_limit, breaker,
+                             dedup=dedup, postfix=lambda: {"limit": limiter.current_limit})
         
         # Save classifications for each book
         book_output = os.path.join(output_dir, f"{os.path.splitext(book_file)[0]}_classifications.json")
-        with open(book_output, 'w', encoding='utf-8') as f:
-            json.dump(book_classifications, f, indent=2)
+        journal.compact(book_output, chapter_sizes, 'classifications')
+        journal.close()
+        dead_letters.close(journal)
     
+    print(dedup.report())
     return True
 
 # Example usage
@@ -0,0 +1,178 @@
+import asyncio
+import concurrent.futures
+import time
+from contextlib import asynccontextmanager, contextmanager
+from threading import Condition, Lock
+
+# Adaptive concurrency defaults
+INITIAL_LIMIT = 10
+MIN_LIMIT = 1
+MAX_LIMIT = 64
+BACKOFF_FACTOR = 0.5  # Multiplicative decrease on overload
+LATENCY_SPIKE_FACTOR = 3.0  # A request this many times slower than baseline counts as overload
+LATENCY_ALPHA = 0.05  # Smoothing for the baseline latency estimate
+
+def classify_failure(error: Exception) -> str:
+    """
+    Sorts a failed request into "throttled" (429), "overloaded" (5xx or timeout)
+    or "ignored" (a client-side problem that says nothing about provider load).
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        if status == 429:
+            return "throttled"
+        if status >= 500:
+            return "overloaded"
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, concurrent.futures.TimeoutError)):
+        return "overloaded"
+    if "Timeout" in type(error).__name__:
+        return "overloaded"
+    return "ignored"
+
+class SlotClock:
+    """
+    Times one slot. Work wrapped in excluding() is left out of the latency
+    sample, e.g. waiting for a batch job to run, which says nothing about load.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.excluded = 0.0
+
+    @contextmanager
+    def excluding(self):
+        paused = time.monotonic()
+        try:
+            yield
+        finally:
+            self.excluded += time.monotonic() - paused
+
+    def latency(self) -> float:
+        return time.monotonic() - self.started - self.excluded
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit.
+
+    The limit grows by one after a full window of healthy requests while the
+    limiter is saturated, and is cut by BACKOFF_FACTOR on a 429, a 5xx, a timeout
+    or a latency spike. Requests that started before the last cut cannot cut it
+    again, so one burst of failures only backs off once.
+    """
+
+    def __init__(self, name: str = "", initial_limit=INITIAL_LIMIT, min_limit=MIN_LIMIT, max_limit=MAX_LIMIT,
+                 backoff_factor=BACKOFF_FACTOR, latency_spike_factor=LATENCY_SPIKE_FACTOR):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_factor = backoff_factor
+        self.latency_spike_factor = latency_spike_factor
+        self.lock = Lock()
+
+        self.in_flight = 0
+        self.healthy_streak = 0
+        self.baseline_latency = None
+        self.last_decrease = 0.0
+        self.counts = {"success": 0, "throttled": 0, "overloaded": 0, "slow": 0, "ignored": 0}
+
+    @property
+    def current_limit(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def record(self, started: float, latency: float, outcome: str):
+        """
+        Updates the limit for one finished request. Call with self.lock held.
+        """
+        if outcome == "success" and self.baseline_latency is not None \
+                and latency > self.latency_spike_factor * self.baseline_latency:
+            outcome = "slow"
+        self.counts[outcome] += 1
+
+        if outcome in ("success", "slow"):
+            if self.baseline_latency is None:
+                self.baseline_latency = latency
+            else:
+                self.baseline_latency += LATENCY_ALPHA * (latency - self.baseline_latency)
+
+        if outcome == "success":
+            # Only grow while the limit is actually what holds requests back
+            if self.in_flight + 1 >= self.current_limit:
+                self.healthy_streak += 1
+                if self.healthy_streak >= self.current_limit:
+                    self.limit = min(self.max_limit, self.limit + 1)
+                    self.healthy_streak = 0
+        elif outcome in ("throttled", "overloaded", "slow"):
+            self.healthy_streak = 0
+            if started >= self.last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.backoff_factor)
+                self.last_decrease = time.monotonic()
+
+    def metrics(self) -> dict:
+        return {
+            "limit": self.current_limit,
+            "in_flight": self.in_flight,
+            "baseline_latency": self.baseline_latency,
+            **self.counts,
+        }
+
+class AdaptiveLimiter(AIMDController):
+    """
+    AIMD limiter for thread pools. Wrap each API call in `with limiter.slot():`;
+    the slot yields its SlotClock.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.condition = Condition(self.lock)
+
+    @contextmanager
+    def slot(self):
+        with self.condition:
+            while self.in_flight >= self.current_limit:
+                self.condition.wait()
+            self.in_flight += 1
+
+        clock = SlotClock()
+        outcome = "success"
+        try:
+            yield clock
+        except Exception as e:
+            outcome = classify_failure(e)
+            raise
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.record(clock.started, clock.latency(), outcome)
+                self.condition.notify_all()
+
+class AsyncAdaptiveLimiter(AIMDController):
+    """
+    AIMD limiter for asyncio tasks. Wrap each API call in `async with limiter.slot():`;
+    the slot yields its SlotClock.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.current_limit)
+            with self.lock:
+                self.in_flight += 1
+
+        clock = SlotClock()
+        outcome = "success"
+        try:
+            yield clock
+        except Exception as e:
+            outcome = classify_failure(e)
+            raise
+        finally:
+            async with self.condition:
+                with self.lock:
+                    self.in_flight -= 1
+                    self.record(clock.started, clock.latency(), outcome)
+                self.condition.notify_all()
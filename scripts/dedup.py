@@ -0,0 +1,160 @@
+import re
+import zlib
+from collections import OrderedDict
+import numpy as np
+
+# MinHash / LSH settings
+NUM_PERM = 128
+BANDS = 16  # 16 bands of 8 rows: pairs above ~0.7 Jaccard almost always share a bucket
+SHINGLE_SIZE = 5  # Words per shingle
+SIMILARITY_THRESHOLD = 0.8  # Estimated Jaccard needed to join an existing cluster
+MAX_CLUSTERS = 20000  # Clusters remembered at once (~2 KB each); the least recently seen are forgotten
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+def shingle_hashes(text: str, size=SHINGLE_SIZE) -> np.ndarray:
+    """
+    32-bit hashes of the word shingles of a paragraph, ignoring case and punctuation.
+    """
+    words = re.findall(r"\w+", text.lower())
+    size = max(1, min(size, len(words)))
+    shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+class MinHashLSH:
+    """
+    Streaming near-duplicate clustering. Each paragraph's MinHash signature is
+    split into bands; a paragraph joins the first cluster it shares a band with
+    whose representative's signature agrees on at least SIMILARITY_THRESHOLD of
+    its positions, otherwise it starts a new cluster. Only representatives are
+    stored, and at most max_clusters of them: past that, the least recently
+    matched cluster's signature and bucket entries are dropped and on_evict is
+    called with its ID. A later near-duplicate of it starts a new cluster.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, bands=BANDS, threshold=SIMILARITY_THRESHOLD, seed=1,
+                 max_clusters=MAX_CLUSTERS, on_evict=None):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, MAX_HASH, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, MAX_HASH, size=num_perm, dtype=np.uint64)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.max_clusters = max_clusters
+        self.on_evict = on_evict
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = np.empty((min(1024, max_clusters), num_perm), dtype=np.uint32)
+        self.live = OrderedDict()  # cluster -> (signature row, band keys), least recently matched first
+        self.free_rows = []
+        self.clusters = 0
+        self.evicted = 0
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingle_hashes(text)
+        permuted = (hashes[:, None] * self.a + self.b) % MERSENNE_PRIME
+        return (permuted & MAX_HASH).min(axis=0).astype(np.uint32)
+
+    def assign(self, text: str) -> int:
+        """
+        Cluster ID for a paragraph, creating a new cluster if it has no near-duplicate.
+        """
+        signature = self.signature(text)
+        keys = [hash(signature[i * self.rows:(i + 1) * self.rows].tobytes()) for i in range(self.bands)]
+
+        checked = set()
+        for bucket, key in zip(self.buckets, keys):
+            cluster = bucket.get(key)
+            if cluster is None or cluster in checked:
+                continue
+            checked.add(cluster)
+            if np.mean(self.signatures[self.live[cluster][0]] == signature) >= self.threshold:
+                self.live.move_to_end(cluster)
+                return cluster
+
+        if len(self.live) >= self.max_clusters:
+            self.evict()
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            row = len(self.live)
+            if row == len(self.signatures):
+                size = min(2 * len(self.signatures), self.max_clusters)
+                self.signatures = np.resize(self.signatures, (size, self.signatures.shape[1]))
+        cluster = self.clusters
+        self.signatures[row] = signature
+        self.live[cluster] = (row, keys)
+        self.clusters += 1
+        for bucket, key in zip(self.buckets, keys):
+            bucket.setdefault(key, cluster)
+        return cluster
+
+    def evict(self):
+        """
+        Forgets the least recently matched cluster.
+        """
+        cluster, (row, keys) = self.live.popitem(last=False)
+        for bucket, key in zip(self.buckets, keys):
+            if bucket.get(key) == cluster:
+                del bucket[key]
+        self.free_rows.append(row)
+        self.evicted += 1
+        if self.on_evict is not None:
+            self.on_evict(cluster)
+
+class Deduplicator:
+    """
+    Groups paragraphs into near-duplicate clusters so each cluster is classified
+    once and its label fanned out to every member. With enabled=False every
+    paragraph is its own cluster, so drivers can use it unconditionally.
+    Results are kept for at most max_clusters clusters, dropped together with
+    the cluster's signature, so a long run's memory stays bounded.
+    """
+
+    def __init__(self, enabled=True, max_clusters=MAX_CLUSTERS, **lsh_options):
+        self.max_clusters = max_clusters
+        self.lsh = MinHashLSH(max_clusters=max_clusters, on_evict=self.forget, **lsh_options) if enabled else None
+        self.next_cluster = 0
+        self.results = OrderedDict()  # cluster -> classification fields other than the paragraph
+        self.paragraphs = 0
+
+    def group(self, pending: dict) -> dict:
+        """
+        Maps each cluster among the pending {index: paragraph} items to its member indices.
+        """
+        clusters = {}
+        for index, paragraph in pending.items():
+            if self.lsh is not None:
+                cluster = self.lsh.assign(paragraph)
+            else:
+                cluster = self.next_cluster
+                self.next_cluster += 1
+            clusters.setdefault(cluster, []).append(index)
+            self.paragraphs += 1
+        return clusters
+
+    def known(self, cluster: int) -> bool:
+        if cluster not in self.results:
+            return False
+        self.results.move_to_end(cluster)
+        return True
+
+    def resolve(self, cluster: int, result: dict):
+        self.results[cluster] = {k: v for k, v in result.items() if k != "paragraph"}
+        self.results.move_to_end(cluster)
+        # Only older results are dropped, so fan_out() right after resolve() always finds this one
+        while len(self.results) > self.max_clusters:
+            self.results.popitem(last=False)
+
+    def forget(self, cluster: int):
+        self.results.pop(cluster, None)
+
+    def fan_out(self, cluster: int, paragraph: str) -> dict:
+        return {"paragraph": paragraph, **self.results[cluster]}
+
+    def report(self) -> str:
+        clusters = self.lsh.clusters if self.lsh is not None else self.next_cluster
+        saved = self.paragraphs - clusters
+        report = f"{self.paragraphs} paragraphs in {clusters} clusters, {saved} duplicate classifications skipped"
+        if self.lsh is not None and self.lsh.evicted:
+            report += f" ({self.lsh.evicted} least recently seen clusters forgotten)"
+        return report
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import numpy as np
+from tqdm import tqdm
+from book_text import read_book, split_into_chapters, split_into_paragraphs
+
+# Embedding settings
+ENCODER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIR = 'data/embeddings'
+ENCODE_BATCH_SIZE = 64
+
+def paragraph_id(paragraph: str) -> str:
+    """
+    Stable ID for a paragraph's text, so labels from any output file can be
+    joined to its embedding regardless of book, chapter or position.
+    """
+    return hashlib.sha1(paragraph.strip().encode('utf-8')).hexdigest()
+
+class EmbeddingStore:
+    """
+    Paragraph embeddings stored once and shared by every task.
+
+    Vectors live in a float16 file of shape (rows, dim) that is read back as a
+    memmap; ids.log lists one paragraph ID per row, in row order, and
+    index.json records the encoder and dimension. New paragraphs are appended,
+    vectors first and their IDs second, so an existing store only encodes
+    what it has not seen. Opening a store trims both files back to the rows
+    they both hold, which undoes a run interrupted half way through an append.
+    """
+
+    def __init__(self, directory=EMBEDDING_DIR, encoder_name=ENCODER_NAME):
+        self.directory = directory
+        self.encoder_name = encoder_name
+        self.encoder = None
+        self.vectors_path = os.path.join(directory, "vectors.f16")
+        self.index_path = os.path.join(directory, "index.json")
+        self.ids_path = os.path.join(directory, "ids.log")
+        os.makedirs(directory, exist_ok=True)
+
+        self.index = {}
+        self.dim = None
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta["encoder"] != encoder_name:
+                raise ValueError(f"{directory} holds {meta['encoder']} embeddings, not {encoder_name}")
+            self.dim = meta["dim"]
+        self.load_ids()
+
+    def write_ids_log(self, keys: list):
+        tmp_path = self.ids_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(f"{key}\n" for key in keys)
+        os.replace(tmp_path, self.ids_path)
+
+    def load_ids(self):
+        """
+        Reads ids.log and truncates it and the vectors file to the rows both hold in full.
+        """
+        keys = []
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path, 'r', encoding='utf-8') as f:
+                keys = [line[:-1] for line in f if line.endswith('\n')]
+        row_bytes = 2 * self.dim if self.dim else 0
+        stored = os.path.getsize(self.vectors_path) // row_bytes if row_bytes and os.path.exists(self.vectors_path) else 0
+        rows = min(len(keys), stored)
+
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) != rows * row_bytes:
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(rows * row_bytes)
+        if os.path.exists(self.ids_path) and os.path.getsize(self.ids_path) != sum(len(k) + 1 for k in keys[:rows]):
+            self.write_ids_log(keys[:rows])
+        self.index = {key: row for row, key in enumerate(keys[:rows])}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, paragraph: str) -> bool:
+        return paragraph_id(paragraph) in self.index
+
+    def encode(self, paragraphs: list) -> np.ndarray:
+        if self.encoder is None:
+            from sentence_transformers import SentenceTransformer
+            self.encoder = SentenceTransformer(self.encoder_name)
+        return self.encoder.encode(paragraphs, batch_size=ENCODE_BATCH_SIZE,
+                                   normalize_embeddings=True, show_progress_bar=False)
+
+    def add(self, paragraphs: list) -> int:
+        """
+        Encodes and appends the paragraphs not already stored. Returns how many were added.
+        """
+        new = {}
+        for paragraph in paragraphs:
+            key = paragraph_id(paragraph)
+            if key not in self.index:
+                new.setdefault(key, paragraph)
+        if not new:
+            return 0
+
+        vectors = self.encode(list(new.values())).astype(np.float16)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self.save_index()
+        with open(self.vectors_path, 'ab') as f:
+            f.write(vectors.tobytes())
+        # IDs go in only once their vectors are written; load_ids() drops vectors without one
+        with open(self.ids_path, 'a', encoding='utf-8') as f:
+            f.writelines(f"{key}\n" for key in new)
+        for key in new:
+            self.index[key] = len(self.index)
+        return len(new)
+
+    def save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"encoder": self.encoder_name, "dim": self.dim}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def vectors(self) -> np.ndarray:
+        """
+        All stored vectors as a read-only float16 memmap.
+        """
+        return np.memmap(self.vectors_path, dtype=np.float16, mode='r', shape=(len(self.index), self.dim))
+
+    def get(self, paragraphs: list) -> np.ndarray:
+        """
+        float32 embeddings for the paragraphs, in order. Every paragraph must already be stored.
+        """
+        rows = [self.index[paragraph_id(p)] for p in paragraphs]
+        return np.asarray(self.vectors()[rows], dtype=np.float32)
+
+def embed_books(input_dir, store: EmbeddingStore = None) -> EmbeddingStore:
+    store = store or EmbeddingStore()
+    book_files = [f for f in os.listdir(input_dir) if f.endswith('.txt')]
+
+    for book_file in tqdm(book_files, desc="Embedding Books"):
+        chapters = split_into_chapters(read_book(os.path.join(input_dir, book_file)))
+        added = sum(store.add(split_into_paragraphs(chapter)) for chapter in chapters)
+        print(f"{book_file}: {added} new paragraphs embedded, {len(store)} in the store")
+    return store
+
+if __name__ == "__main__":
+    embed_books('data/sample_texts')
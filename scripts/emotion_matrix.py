@@ -0,0 +1,166 @@
+import json
+import os
+from collections import defaultdict
+import numpy as np
+from embeddings import paragraph_id
+from json_stream import iter_entries
+
+# Column order of every Hume score matrix: the emotions the Hume language model scores
+HUME_EMOTIONS = [
+    'Admiration', 'Adoration', 'Aesthetic Appreciation', 'Amusement', 'Anger', 'Annoyance',
+    'Anxiety', 'Awe', 'Awkwardness', 'Boredom', 'Calmness', 'Concentration', 'Confusion',
+    'Contemplation', 'Contempt', 'Contentment', 'Craving', 'Desire', 'Determination',
+    'Disappointment', 'Disapproval', 'Disgust', 'Distress', 'Doubt', 'Ecstasy', 'Embarrassment',
+    'Empathic Pain', 'Enthusiasm', 'Entrancement', 'Envy', 'Excitement', 'Fear', 'Gratitude',
+    'Guilt', 'Horror', 'Interest', 'Joy', 'Love', 'Nostalgia', 'Pain', 'Pride', 'Realization',
+    'Relief', 'Romance', 'Sadness', 'Sarcasm', 'Satisfaction', 'Shame', 'Surprise (negative)',
+    'Surprise (positive)', 'Sympathy', 'Tiredness', 'Triumph',
+]
+EMOTION_COLUMNS = {name: column for column, name in enumerate(HUME_EMOTIONS)}
+
+MATRIX_DTYPE = np.float16  # Scores are in [0, 1]; float16 keeps ~3 significant digits at 2 bytes each
+
+def matrix_paths(base_path: str) -> tuple:
+    """
+    (scores .npy, index .json, sentence scores .npy) for an output path such as
+    data/emotions/jk_rowling_sample_emotions_hume.json, with or without its extension.
+    """
+    base = os.path.splitext(base_path)[0]
+    return f"{base}.npy", f"{base}.index.json", f"{base}.sentences.npy"
+
+def score_vector(emotions: dict, unknown: set = None) -> list:
+    """
+    A {name: score} dict as a row in HUME_EMOTIONS order. Names outside the
+    header are collected into `unknown` instead of being stored.
+    """
+    row = [0.0] * len(HUME_EMOTIONS)
+    for name, score in emotions.items():
+        column = EMOTION_COLUMNS.get(name)
+        if column is None:
+            if unknown is not None:
+                unknown.add(name)
+        else:
+            row[column] = score
+    return row
+
+def atomic_save(path: str, array: np.ndarray):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+def write_matrix(base_path: str, records: dict, chapter_sizes: list, dtype=MATRIX_DTYPE) -> int:
+    """
+    Writes a book's Hume scores from its journal records as an (N, emotions)
+    matrix in paragraph order, with an index of (chapter, index, paragraph ID)
+    per row. Records carrying per-sentence rows also get a sentence matrix,
+    whose rows for paragraph i are sentence_offsets[i]:sentence_offsets[i + 1].
+    Returns the number of paragraph rows.
+    """
+    scores_path, index_path, sentences_path = matrix_paths(base_path)
+    unknown = set()
+    rows, paragraphs, sentence_rows, sentence_offsets = [], [], [], [0]
+
+    for chapter, size in chapter_sizes:
+        for i in range(size):
+            record = records.get((chapter, i))
+            if record is None:
+                continue
+            rows.append(score_vector(record.get('emotions') or {}, unknown))
+            paragraphs.append([chapter, i, paragraph_id(record['paragraph'])])
+            sentence_rows.extend(record.get('sentences') or [])
+            sentence_offsets.append(len(sentence_rows))
+
+    scores = np.array(rows, dtype=dtype).reshape(len(rows), len(HUME_EMOTIONS))
+    atomic_save(scores_path, scores)
+
+    index = {
+        "emotions": HUME_EMOTIONS,
+        "dtype": np.dtype(dtype).name,
+        "paragraphs": paragraphs,
+    }
+    if sentence_rows:
+        atomic_save(sentences_path, np.array(sentence_rows, dtype=dtype))
+        index["sentence_offsets"] = sentence_offsets
+    elif os.path.exists(sentences_path):
+        os.remove(sentences_path)
+
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+    if unknown:
+        print(f"Warning: dropped scores for emotions outside the header: {', '.join(sorted(unknown))}")
+    return len(rows)
+
+class EmotionMatrix:
+    """
+    A book's Hume scores loaded from write_matrix() output. The score
+    matrices are memory-mapped, so opening one reads only the index.
+    """
+
+    def __init__(self, scores: np.ndarray, emotions: list, paragraphs: list,
+                 sentences: np.ndarray = None, sentence_offsets: list = None):
+        self.scores = scores
+        self.emotions = emotions
+        self.paragraphs = paragraphs
+        self.sentences = sentences
+        self.sentence_offsets = sentence_offsets
+
+    @classmethod
+    def load(cls, base_path: str) -> "EmotionMatrix":
+        scores_path, index_path, sentences_path = matrix_paths(base_path)
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        sentences = None
+        if "sentence_offsets" in index and os.path.exists(sentences_path):
+            sentences = np.load(sentences_path, mmap_mode='r')
+        return cls(np.load(scores_path, mmap_mode='r'), index["emotions"], index["paragraphs"],
+                   sentences, index.get("sentence_offsets"))
+
+    @staticmethod
+    def exists(base_path: str) -> bool:
+        scores_path, index_path, _ = matrix_paths(base_path)
+        return os.path.exists(scores_path) and os.path.exists(index_path)
+
+    def chapter_rows(self, first_chapter=1, last_chapter=None) -> np.ndarray:
+        """
+        Boolean mask of the rows whose chapter falls within the given range.
+        """
+        chapters = np.array([chapter for chapter, _, _ in self.paragraphs], dtype=np.int32)
+        mask = chapters >= first_chapter
+        if last_chapter is not None:
+            mask &= chapters <= last_chapter
+        return mask
+
+    def totals(self, rows=None) -> dict:
+        """
+        Summed score per emotion over all paragraphs (or the given rows),
+        accumulated in float64.
+        """
+        scores = self.scores if rows is None else self.scores[rows]
+        return dict(zip(self.emotions, scores.sum(axis=0, dtype=np.float64).tolist()))
+
+def input_files(json_path: str) -> list:
+    """
+    The files emotion_totals() may read for an output path: the JSON output
+    and, when present, the score matrix and its index.
+    """
+    scores_path, index_path, _ = matrix_paths(json_path)
+    return [path for path in (json_path, scores_path, index_path) if os.path.exists(path)]
+
+def emotion_totals(json_path: str) -> dict:
+    """
+    Summed intensity per emotion over the whole book. Reads the book's score
+    matrix when classify_emotions.py wrote one, which is a single column sum,
+    and falls back to streaming the JSON output otherwise.
+    """
+    if EmotionMatrix.exists(json_path):
+        return EmotionMatrix.load(json_path).totals()
+
+    totals = defaultdict(float)
+    for _, _, emotion_entry in iter_entries(json_path, 'emotions'):
+        for emotion, intensity in emotion_entry.get('emotions', {}).items():
+            totals[emotion] += intensity
+    return totals
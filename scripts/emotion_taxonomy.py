@@ -0,0 +1,109 @@
+import numpy as np
+from scipy import sparse
+
+class EmotionTaxonomy:
+    """
+    A feeling wheel's tertiary -> secondary -> primary mappings compiled into
+    index maps and one sparse membership matrix per set of score columns.
+
+    Column j of a score matrix adds its intensity to every wheel node it
+    belongs to: a tertiary emotion to itself, its secondary and that
+    secondary's primary; a secondary emotion to itself and its primary.
+    Summing any number of paragraphs, chapters or books therefore takes a
+    single sparse product, and emotions with no node are reported as unmapped.
+    """
+
+    def __init__(self, primaries: list, secondary_to_primary: dict, tertiary_to_secondary: dict = None):
+        self.secondary_to_primary = dict(secondary_to_primary)
+        self.tertiary_to_secondary = dict(tertiary_to_secondary or {})
+
+        self.primaries = list(dict.fromkeys(list(primaries) + list(self.secondary_to_primary.values())))
+        self.secondaries = list(dict.fromkeys(list(self.secondary_to_primary) + list(self.tertiary_to_secondary.values())))
+        self.tertiaries = list(self.tertiary_to_secondary)
+        self.primary_index = {name: i for i, name in enumerate(self.primaries)}
+        self.secondary_index = {name: i for i, name in enumerate(self.secondaries)}
+        self.tertiary_index = {name: i for i, name in enumerate(self.tertiaries)}
+
+        # Node layout of the membership matrix's columns: primaries, then secondaries, then tertiaries
+        self.nodes = self.primaries + self.secondaries + self.tertiaries
+        self.secondary_offset = len(self.primaries)
+        self.tertiary_offset = self.secondary_offset + len(self.secondaries)
+        self.compiled = {}
+
+    def node_columns(self, emotion: str) -> list:
+        """
+        Membership-matrix columns of every node an emotion contributes to.
+        """
+        if emotion in self.tertiary_index:
+            secondary = self.tertiary_to_secondary[emotion]
+            columns = [self.tertiary_offset + self.tertiary_index[emotion],
+                       self.secondary_offset + self.secondary_index[secondary]]
+            primary = self.secondary_to_primary.get(secondary)
+        elif emotion in self.secondary_to_primary:
+            columns = [self.secondary_offset + self.secondary_index[emotion]]
+            primary = self.secondary_to_primary[emotion]
+        else:
+            return []
+        if primary is not None:
+            columns.append(self.primary_index[primary])
+        return columns
+
+    def membership(self, emotions: list) -> tuple:
+        """
+        (sparse (emotions x nodes) matrix, names with no node) for the given
+        score columns, compiled once per column order.
+        """
+        key = tuple(emotions)
+        if key not in self.compiled:
+            rows, columns, unmapped = [], [], []
+            for row, emotion in enumerate(emotions):
+                nodes = self.node_columns(emotion)
+                if not nodes:
+                    unmapped.append(emotion)
+                rows.extend([row] * len(nodes))
+                columns.extend(nodes)
+            matrix = sparse.csr_matrix(
+                (np.ones(len(rows)), (rows, columns)), shape=(len(emotions), len(self.nodes))
+            )
+            self.compiled[key] = (matrix, unmapped)
+        return self.compiled[key]
+
+    def node_totals(self, scores, emotions: list) -> tuple:
+        """
+        Summed intensity per wheel node and the unmapped emotions that carry any
+        intensity. scores is an (N, emotions) matrix or an already summed vector
+        of per-emotion totals, such as the sum over a whole corpus.
+        """
+        matrix, unmapped = self.membership(emotions)
+        scores = np.asarray(scores)
+        totals = scores.sum(axis=0, dtype=np.float64) if scores.ndim == 2 else scores.astype(np.float64)
+        present = dict(zip(emotions, totals))
+        return matrix.T @ totals, [emotion for emotion in unmapped if present[emotion]]
+
+    def aggregate(self, scores, emotions: list) -> tuple:
+        """
+        (primary, secondary, tertiary, unmapped) for a score matrix or vector of
+        per-emotion totals. Each level is a {name: intensity} dict of the nodes
+        that received any intensity.
+        """
+        totals, unmapped = self.node_totals(scores, emotions)
+        levels = (
+            (self.primaries, totals[:self.secondary_offset]),
+            (self.secondaries, totals[self.secondary_offset:self.tertiary_offset]),
+            (self.tertiaries, totals[self.tertiary_offset:]),
+        )
+        counts = [
+            {name: value for name, value in zip(names, values.tolist()) if value}
+            for names, values in levels
+        ]
+        return counts[0], counts[1], counts[2], unmapped
+
+    def label_counts(self, labels) -> np.ndarray:
+        """
+        Occurrences of each primary emotion among single-label classifications,
+        in self.primaries order. Labels that are not primaries are ignored.
+        """
+        indices = np.fromiter(
+            (self.primary_index.get(label, -1) for label in labels), dtype=np.int64
+        )
+        return np.bincount(indices[indices >= 0], minlength=len(self.primaries)).astype(np.float64)
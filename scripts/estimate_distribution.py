@@ -0,0 +1,197 @@
+import importlib
+import json
+import os
+import random
+import sys
+import concurrent.futures
+from collections import Counter
+from math import sqrt
+from statistics import NormalDist
+from tqdm import tqdm
+from journal import Journal, journal_path
+from analysis_scope import AnalysisScope
+from retry import DeadLetterFile, RetriesExhausted, RetryScheduler, dead_letter_path
+from book_text import read_book, split_into_chapters, split_into_paragraphs
+
+# Estimation settings
+TARGET_WIDTH = 0.05  # Stop once every category's interval is narrower than this (5 percentage points)
+CONFIDENCE = 0.95  # Simultaneous coverage across all categories
+MIN_SAMPLES = 30  # Never stop before this many paragraphs are classified
+SAMPLE_SEED = 13
+
+# task -> (module, classify function, label Enum, label field, output key, output suffix, output dir)
+TASKS = {
+    "gpt": ("gpt_classify_emotions", "rate_limited_classify", "Emotion", "emotion", "emotions",
+            "_emotions_gpt", 'data/emotions'),
+    "gemini": ("gemini_classify_emotions", "rate_limited_classify", "Emotion", "emotion", "emotions",
+               "_emotions", 'data/emotions'),
+    "aspects": ("classify_paragraphs", "rate_limited_classify", "Aspect", "aspect", "classifications",
+                "_classifications", 'data/stylometry'),
+}
+
+def stratified_order(chapter_sizes: list, seed=SAMPLE_SEED) -> list:
+    """
+    Every (chapter, index) in a random order in which each prefix samples the
+    chapters in proportion to their size. Each chapter is shuffled, and its
+    i-th paragraph is placed at a jittered fraction (i + u) / size of the way through.
+    """
+    rng = random.Random(seed)
+    keyed = []
+    for chapter, size in chapter_sizes:
+        indices = list(range(size))
+        rng.shuffle(indices)
+        keyed.extend(((rank + rng.random()) / size, chapter, index) for rank, index in enumerate(indices))
+    keyed.sort()
+    return [(chapter, index) for _, chapter, index in keyed]
+
+def multinomial_intervals(counts: Counter, labels: list, population: int, confidence=CONFIDENCE) -> dict:
+    """
+    Wilson score interval for each label's share, Bonferroni-adjusted so all
+    labels are covered together, with a finite population correction since
+    paragraphs are drawn without replacement.
+    """
+    n = sum(counts.values())
+    if n == 0:
+        return {label: (0.0, 0.0, 1.0) for label in labels}
+
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / (2 * max(2, len(labels))))
+    fpc = (population - n) / (population - 1) if population > n else 0.0
+    z2 = z * z * fpc
+    intervals = {}
+    for label in labels:
+        p = counts.get(label, 0) / n
+        denominator = 1 + z2 / n
+        center = (p + z2 / (2 * n)) / denominator
+        half_width = sqrt(z2 * p * (1 - p) / n + z2 * z2 / (4 * n * n)) / denominator
+        intervals[label] = (p, max(0.0, center - half_width), min(1.0, center + half_width))
+    return intervals
+
+def max_width(intervals: dict) -> float:
+    return max(high - low for _, low, high in intervals.values())
+
+def estimate_book(book_path, output_dir, task, target_width=TARGET_WIDTH, confidence=CONFIDENCE,
+                  scope: AnalysisScope = None):
+    """
+    Classifies a random, chapter-stratified sample of the book's paragraphs until
+    every label's confidence interval is narrower than target_width. Writes the
+    sampled paragraphs in the usual per-chapter output format, so analyze_aspects
+    and process_emotion_data_v2 read it unchanged, and the intervals alongside it.
+    """
+    module_name, function_name, enum_name, field, key, suffix, _ = TASKS[task]
+    scope = scope or AnalysisScope.load()
+    module = importlib.import_module(module_name)
+    classify = getattr(module, function_name)
+    labels = [e.value for e in getattr(module, enum_name)]
+
+    book_file = os.path.basename(book_path)
+    sampled_suffix = f"{suffix}_sampled"
+    chapters = [split_into_paragraphs(c) for c in split_into_chapters(read_book(book_path))]
+    chapter_sizes = [(idx, len(paragraphs)) for idx, paragraphs in enumerate(chapters, start=1)]
+    # Only paragraphs inside the analysis scope are sampled; its paragraph limit keeps each chapter's prefix
+    scoped_sizes = [(idx, len(scope.select(idx, chapters[idx - 1]))) for idx, _ in chapter_sizes]
+    scoped_sizes = [(idx, size) for idx, size in scoped_sizes if size]
+    population = sum(size for _, size in scoped_sizes)
+    if population == 0:
+        print(f"{book_file}: no paragraphs inside the analysis scope ({scope.describe()}), skipping")
+        return None
+
+    journal = Journal(journal_path(output_dir, book_file, sampled_suffix))
+    dead_letters = DeadLetterFile(dead_letter_path(output_dir, book_file, sampled_suffix))
+
+    # Paragraphs sampled by an earlier run count towards the estimate
+    counts = Counter()
+    order = []
+    for chapter, index in stratified_order(scoped_sizes):
+        paragraph = chapters[chapter - 1][index]
+        if journal.has(chapter, index, paragraph):
+            counts[journal.records[(chapter, index)][field]] += 1
+        else:
+            order.append((chapter, index))
+    remaining = iter(order)
+
+    def converged():
+        intervals = multinomial_intervals(counts, labels, population, confidence)
+        return sum(counts.values()) >= MIN_SAMPLES and max_width(intervals) <= target_width
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=module.limiter.max_limit) as executor:
+        scheduler = RetryScheduler(executor, module.breaker)
+        in_flight = {}
+
+        def submit_next():
+            for chapter, index in remaining:
+                future = scheduler.submit(classify, chapters[chapter - 1][index])
+                in_flight[future] = (chapter, index)
+                return
+
+        # Keep about as many requests in flight as the limiter allows; stop adding once converged
+        for _ in range(module.limiter.max_limit):
+            if converged():
+                break
+            submit_next()
+
+        progress = tqdm(total=population, initial=sum(counts.values()), desc=f"Sampling {book_file}", unit="para")
+        while in_flight:
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                chapter, index = in_flight.pop(future)
+                try:
+                    result = future.result()
+                    journal.record(chapter, index, result)
+                    counts[result[field]] += 1
+                except RetriesExhausted as e:
+                    dead_letters.add(chapter, index, chapters[chapter - 1][index], e)
+                progress.update(1)
+                if not converged():
+                    submit_next()
+            width = max_width(multinomial_intervals(counts, labels, population, confidence))
+            progress.set_postfix(width=f"{width:.3f}")
+        progress.close()
+        scheduler.close()
+
+    base_name = os.path.splitext(book_file)[0]
+    journal.compact(os.path.join(output_dir, f"{base_name}{sampled_suffix}.json"), chapter_sizes, key)
+    journal.close()
+    dead_letters.close(journal)
+
+    sampled = sum(counts.values())
+    intervals = multinomial_intervals(counts, labels, population, confidence)
+    estimate = {
+        "task": task,
+        "paragraphs": population,
+        "sampled": sampled,
+        "confidence": confidence,
+        "target_width": target_width,
+        "proportions": {
+            label: {"estimate": p, "low": low, "high": high}
+            for label, (p, low, high) in intervals.items()
+        },
+    }
+    with open(os.path.join(output_dir, f"{base_name}{sampled_suffix}.ci.json"), 'w', encoding='utf-8') as f:
+        json.dump(estimate, f, indent=2)
+
+    print(f"{book_file}: {sampled}/{population} paragraphs classified ({sampled / population:.1%}), "
+          f"widest {confidence:.0%} interval {max_width(intervals):.3f}")
+    for label, (p, low, high) in sorted(intervals.items(), key=lambda item: -item[1][0]):
+        print(f"  {label:<15} {p:6.1%}  [{low:6.1%}, {high:6.1%}]")
+    return estimate
+
+def process_books(input_dir, output_dir=None, task="gpt", target_width=TARGET_WIDTH, confidence=CONFIDENCE,
+                  scope: AnalysisScope = None):
+    output_dir = output_dir or TASKS[task][-1]
+    os.makedirs(output_dir, exist_ok=True)
+    scope = scope or AnalysisScope.load()
+
+    book_files = [f for f in os.listdir(input_dir) if f.endswith('.txt')]
+    for book_file in book_files:
+        estimate_book(os.path.join(input_dir, book_file), output_dir, task, target_width, confidence, scope)
+    return True
+
+if __name__ == "__main__":
+    input_directory = 'data/sample_texts'
+    # e.g. python scripts/estimate_distribution.py aspects
+    task = sys.argv[1] if len(sys.argv) > 1 else "gpt"
+
+    success = process_books(input_directory, task=task)
+
+    if success:
+        print("Successfully estimated label distributions for all books")
@@ -0,0 +1,223 @@
+import asyncio
+import enum
+import hashlib
+import json
+import os
+import random
+import time
+from threading import Lock
+from types import SimpleNamespace
+from emotion_matrix import HUME_EMOTIONS
+
+# Labels the fake OpenAI backend answers with (the set gpt_classify_emotions accepts)
+OPENAI_EMOTIONS = ["Joy", "Sad", "Powerful", "Neutral", "Scared", "Mad"]
+
+class FakeAPIError(Exception):
+    """
+    Error raised by the fakes. Carries the same status_code / code / response.headers
+    attributes that the OpenAI and Google client errors expose.
+    """
+
+    def __init__(self, status_code: int, message: str, retry_after: float = None):
+        super().__init__(f"Error code: {status_code} - {message}")
+        self.status_code = status_code
+        self.code = status_code
+        headers = {}
+        if retry_after is not None:
+            headers["retry-after"] = f"{retry_after:.2f}"
+        self.response = SimpleNamespace(status_code=status_code, headers=headers)
+
+class FakeTimeoutError(TimeoutError):
+    """Raised when a fake request hangs past the caller's timeout."""
+
+class FakeBackendConfig:
+    """
+    Behaviour of a fake backend. Latency is log-normal around latency_ms; each
+    request independently fails with a 429, a 500 or a hang at the given rates,
+    and requests beyond max_rps are rejected with a 429 like a real quota.
+    """
+
+    def __init__(self, latency_ms=400, latency_sigma=0.5, rate_limit_rate=0.0, error_rate=0.0,
+                 timeout_rate=0.0, hang_seconds=60, max_rps=None, job_latency_ms=3000, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.max_rps = max_rps
+        self.job_latency_ms = job_latency_ms
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls):
+        max_rps = os.getenv("FAKE_MAX_RPS")
+        seed = os.getenv("FAKE_SEED")
+        return cls(
+            latency_ms=float(os.getenv("FAKE_LATENCY_MS", 400)),
+            latency_sigma=float(os.getenv("FAKE_LATENCY_SIGMA", 0.5)),
+            rate_limit_rate=float(os.getenv("FAKE_RATE_LIMIT_RATE", 0)),
+            error_rate=float(os.getenv("FAKE_ERROR_RATE", 0)),
+            timeout_rate=float(os.getenv("FAKE_TIMEOUT_RATE", 0)),
+            hang_seconds=float(os.getenv("FAKE_HANG_SECONDS", 60)),
+            max_rps=float(max_rps) if max_rps else None,
+            job_latency_ms=float(os.getenv("FAKE_JOB_LATENCY_MS", 3000)),
+            seed=int(seed) if seed else None,
+        )
+
+class FakeBehaviour:
+    """
+    Shared request gate for one fake client: samples latency, injects failures
+    and enforces the throughput cap with a token bucket.
+    """
+
+    def __init__(self, config: FakeBackendConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = Lock()
+        self.tokens = config.max_rps or 0
+        self.last_refill = time.monotonic()
+        self.requests = 0
+
+    def sample_latency(self, median_ms=None) -> float:
+        median_ms = self.config.latency_ms if median_ms is None else median_ms
+        with self.lock:
+            return median_ms / 1000 * self.random.lognormvariate(0, self.config.latency_sigma)
+
+    def admit(self) -> str:
+        """
+        Decides the fate of one request: "ok", "hang", or raises a FakeAPIError.
+        """
+        with self.lock:
+            self.requests += 1
+            if self.config.max_rps:
+                now = time.monotonic()
+                self.tokens = min(self.config.max_rps, self.tokens + (now - self.last_refill) * self.config.max_rps)
+                self.last_refill = now
+                if self.tokens < 1:
+                    raise FakeAPIError(429, "Throughput cap exceeded", retry_after=(1 - self.tokens) / self.config.max_rps)
+                self.tokens -= 1
+
+            roll = self.random.random()
+        if roll < self.config.rate_limit_rate:
+            raise FakeAPIError(429, "Rate limit exceeded", retry_after=1)
+        roll -= self.config.rate_limit_rate
+        if roll < self.config.error_rate:
+            raise FakeAPIError(500, "Internal server error")
+        roll -= self.config.error_rate
+        if roll < self.config.timeout_rate:
+            return "hang"
+        return "ok"
+
+    def call(self, timeout=None):
+        """
+        Blocks like a synchronous HTTP call would.
+        """
+        if self.admit() == "hang":
+            wait = self.config.hang_seconds if timeout is None else min(timeout, self.config.hang_seconds)
+            time.sleep(wait)
+            raise FakeTimeoutError(f"Request timed out after {wait:.1f} seconds")
+        time.sleep(self.sample_latency())
+
+def pick_label(text: str, labels: list) -> str:
+    """
+    Deterministic label for a text, so repeated runs and duplicates agree.
+    """
+    digest = hashlib.md5(text.encode('utf-8')).digest()
+    return labels[digest[0] % len(labels)]
+
+class FakeOpenAIClient:
+    """
+    Imitates AzureOpenAI's chat.completions.create with a JSON {"emotion": ...} answer.
+    """
+
+    def __init__(self, config: FakeBackendConfig, labels=OPENAI_EMOTIONS):
+        self.behaviour = FakeBehaviour(config)
+        self.labels = labels
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model=None, messages=(), timeout=None, **kwargs):
+        self.behaviour.call(timeout=timeout)
+        paragraph = messages[-1]["content"] if messages else ""
+        content = json.dumps({"emotion": pick_label(paragraph, self.labels)})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+class FakeGeminiModel:
+    """
+    Imitates GenerativeModel.generate_content for text/x.enum responses and
+    application/json responses whose schema is a TypedDict of enums.
+    """
+
+    def __init__(self, config: FakeBackendConfig):
+        self.behaviour = FakeBehaviour(config)
+
+    def generate_content(self, contents, generation_config=None, request_options=None, **kwargs):
+        self.behaviour.call(timeout=(request_options or {}).get("timeout"))
+        schema = getattr(generation_config, "response_schema", None)
+        if schema is None and isinstance(generation_config, dict):
+            schema = generation_config.get("response_schema")
+        paragraph = contents[-1] if isinstance(contents, (list, tuple)) else contents
+        if isinstance(schema, type) and not issubclass(schema, enum.Enum):
+            # application/json with a TypedDict of enum fields
+            return SimpleNamespace(text=json.dumps({
+                field: pick_label(f"{field}:{paragraph}", [e.value for e in field_type])
+                for field, field_type in schema.__annotations__.items()
+            }))
+        labels = [e.value for e in schema] if schema is not None else OPENAI_EMOTIONS
+        return SimpleNamespace(text=pick_label(str(paragraph), labels))
+
+class FakeHumeBatch:
+    """
+    Imitates the Hume expression_measurement.batch endpoints for text jobs.
+    Jobs finish job_latency_ms (log-normal) after submission.
+    """
+
+    def __init__(self, config: FakeBackendConfig):
+        self.behaviour = FakeBehaviour(config)
+        self.jobs = {}
+
+    async def request(self):
+        if self.behaviour.admit() == "hang":
+            await asyncio.sleep(self.behaviour.config.hang_seconds)
+            raise FakeTimeoutError("Request timed out")
+        await asyncio.sleep(self.behaviour.sample_latency())
+
+    async def start_inference_job(self, text=(), models=None, **kwargs):
+        await self.request()
+        job_id = f"fake-job-{len(self.jobs) + 1}"
+        ready_at = time.monotonic() + self.behaviour.sample_latency(self.behaviour.config.job_latency_ms)
+        self.jobs[job_id] = {"texts": list(text), "ready_at": ready_at}
+        return job_id
+
+    def details(self, job_id: str):
+        status = "COMPLETED" if time.monotonic() >= self.jobs[job_id]["ready_at"] else "IN_PROGRESS"
+        return SimpleNamespace(job_id=job_id, state=SimpleNamespace(status=status, message=""))
+
+    async def get_job_details(self, job_id: str):
+        await self.request()
+        return self.details(job_id)
+
+    async def list_jobs(self, limit=None, **kwargs):
+        await self.request()
+        job_ids = list(self.jobs)[-limit:] if limit else list(self.jobs)
+        return [self.details(job_id) for job_id in job_ids]
+
+    async def get_job_predictions(self, id: str):
+        await self.request()
+        sources = []
+        for text in self.jobs[id]["texts"]:
+            rng = random.Random(text)
+            sentences = [
+                SimpleNamespace(emotions=[SimpleNamespace(name=name, score=rng.random()) for name in HUME_EMOTIONS])
+                for _ in range(max(1, text.count('.')))
+            ]
+            language = SimpleNamespace(grouped_predictions=[SimpleNamespace(predictions=sentences)])
+            prediction = SimpleNamespace(models=SimpleNamespace(language=language))
+            # One source per submitted text, like the real API
+            sources.append(SimpleNamespace(source=SimpleNamespace(type="text"), error=None,
+                                           results=SimpleNamespace(predictions=[prediction], errors=[])))
+        return sources
+
+class FakeHumeClient:
+    def __init__(self, config: FakeBackendConfig):
+        self.expression_measurement = SimpleNamespace(batch=FakeHumeBatch(config))
@@ -1,11 +1,13 @@
 import enum
-import json
 from collections import defaultdict
 import pandas as pd
 import plotly.graph_objects as go
 import matplotlib.pyplot as plt
 from scipy.cluster.hierarchy import dendrogram
 import numpy as np
+from emotion_matrix import emotion_totals, input_files
+from emotion_taxonomy import EmotionTaxonomy
+from aggregation_cache import cached_aggregation
 
 # Define Primary, Secondary, and Tertiary Emotions
 class PrimaryEmotion(enum.Enum):
@@ -136,41 +138,28 @@ SECONDARY_TO_PRIMARY = {
     'Concentration': PrimaryEmotion.NEUTRAL.value,
 }
 
-def process_emotion_data(json_path: str):
-    # Add at start of function
-    unmapped_emotions = set()
-    
-    # Load the JSON file
-    with open(json_path, 'r', encoding='utf-8') as f:
-        emotion_data = json.load(f)
-    
-    # Initialize emotion counts
-    primary_counts = defaultdict(float)
-    secondary_counts = defaultdict(float)
-    tertiary_counts = defaultdict(float)
+# The wheel compiled for vectorized aggregation
+TAXONOMY = EmotionTaxonomy([e.value for e in PrimaryEmotion], SECONDARY_TO_PRIMARY, TERTIARY_TO_SECONDARY)
+
+@cached_aggregation("feeling_wheel", version=1, inputs=input_files)
+def process_emotion_data(json_path):
+    """
+    Feeling-wheel intensities for one book, or for a whole corpus when given a
+    list of paths. Per-emotion totals are mapped onto the wheel with one
+    product against the compiled taxonomy.
+    """
+    json_paths = [json_path] if isinstance(json_path, str) else json_path
+    corpus_totals = defaultdict(float)
+    for path in json_paths:
+        for emotion, intensity in emotion_totals(path).items():
+            corpus_totals[emotion] += intensity
     
-    # Process the emotion data
-    for chapter in emotion_data:
-        for emotion_entry in chapter.get('emotions', []):
-            if 'emotions' in emotion_entry:
-                for emotion, intensity in emotion_entry['emotions'].items():
-                    # First check if it's a Tertiary emotion
-                    if emotion in TERTIARY_TO_SECONDARY:
-                        secondary = TERTIARY_TO_SECONDARY[emotion]
-                        tertiary_counts[emotion] += intensity
-                        secondary_counts[secondary] += intensity
-                        primary = SECONDARY_TO_PRIMARY.get(secondary)
-                        if primary:
-                            primary_counts[primary] += intensity
-                    
-                    # Then check if it's a Secondary emotion
-                    elif emotion in SECONDARY_TO_PRIMARY:
-                        secondary_counts[emotion] += intensity
-                        primary = SECONDARY_TO_PRIMARY[emotion]
-                        primary_counts[primary] += intensity
-                    
-                    else:
-                        unmapped_emotions.add(emotion)
+    primary, secondary, tertiary, unmapped_emotions = TAXONOMY.aggregate(
+        np.fromiter(corpus_totals.values(), dtype=np.float64, count=len(corpus_totals)), list(corpus_totals)
+    )
+    primary_counts = defaultdict(float, primary)
+    secondary_counts = defaultdict(float, secondary)
+    tertiary_counts = defaultdict(float, tertiary)
     
     # Normalize the counts by total intensity
     total_intensity = sum(primary_counts.values())
@@ -318,7 +307,7 @@ def create_dendrogram(primary_counts, secondary_counts, tertiary_counts):
 
 
 if __name__ == "__main__":
-    json_path = "data/emotions/jk_rowling_sample_checkpoint_20241125_184726.json"
+    json_path = "data/emotions/jk_rowling_sample_emotions_hume.json"
     primary_counts, secondary_counts, tertiary_counts = process_emotion_data(json_path)
     
     # Display aggregated counts
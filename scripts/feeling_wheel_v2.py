@@ -1,11 +1,12 @@
 import enum
-import json
 from collections import defaultdict
 import pandas as pd
 import plotly.graph_objects as go
 import matplotlib.pyplot as plt
 from scipy.cluster.hierarchy import dendrogram
 import numpy as np
+from json_stream import iter_entries
+from aggregation_cache import cached_aggregation
 
 # Define Primary Emotions
 class PrimaryEmotion(enum.Enum):
@@ -18,22 +19,20 @@ class PrimaryEmotion(enum.Enum):
     NEUTRAL = "neutral" # Added neutral emotion
 
 
+@cached_aggregation("feeling_wheel_v2", version=1, scope="first 10 chapters")
 def process_emotion_data(json_path: str):
-    # Load the JSON file
-    with open(json_path, 'r', encoding='utf-8') as f:
-        emotion_data = json.load(f)
-    
     # Initialize emotion counts
     primary_counts = defaultdict(float)
     
-    # Process only the first 10 chapters
-    for chapter in emotion_data[:10]:
-        for emotion_entry in chapter.get('emotions', []):
-            if 'emotion' in emotion_entry:
-                emotion = emotion_entry['emotion'].lower() # Convert to lowercase
-                # Check if the emotion is a valid primary emotion
-                if any(emotion == e.value for e in PrimaryEmotion):
-                    primary_counts[emotion] += 1.0
+    # Stream the entries, stopping after the first 10 chapters
+    for position, _, emotion_entry in iter_entries(json_path, 'emotions'):
+        if position >= 10:
+            break
+        if 'emotion' in emotion_entry:
+            emotion = emotion_entry['emotion'].lower() # Convert to lowercase
+            # Check if the emotion is a valid primary emotion
+            if any(emotion == e.value for e in PrimaryEmotion):
+                primary_counts[emotion] += 1.0
     
     # Normalize the counts by total intensity
     total_intensity = sum(primary_counts.values())
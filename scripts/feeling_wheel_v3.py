@@ -1,8 +1,13 @@
 import enum
-import json
 from collections import defaultdict
+from itertools import takewhile
 import plotly.graph_objects as go
 from pathlib import Path
+import numpy as np
+from emotion_matrix import emotion_totals, input_files
+from emotion_taxonomy import EmotionTaxonomy
+from json_stream import iter_entries
+from aggregation_cache import cached_aggregation
 
 class PrimaryEmotion(enum.Enum):
     MAD = 'Mad'
@@ -144,11 +149,17 @@ SECONDARY_TO_PRIMARY = {
     SecondaryEmotion.DETERMINED.value: PrimaryEmotion.NEUTRAL.value,
 }
 
+# Primary emotions compiled for vectorized aggregation
+TAXONOMY = EmotionTaxonomy([e.value for e in PrimaryEmotion], SECONDARY_TO_PRIMARY)
+
 # Display name mapping
 DISPLAY_NAMES = {
     "emotions_oss": "Open Source",
     "emotions_gpt": "GPT-4o",
+    "emotions_routed": "Routed",
+    "emotions_cascade": "Cascade",
     "emotions": "Gemini",
+    "emotions_hume": "Hume AI",
     "checkpoint_20241125_184726": "Hume AI",
 }
 
@@ -164,42 +175,24 @@ def process_emotion_data(json_path: str):
     filename = Path(json_path).stem
     suffix = '_'.join(filename.split('_')[2:])
     
-    # Use v1 processing for checkpoint files
-    if 'checkpoint' in suffix:
-        print(process_emotion_data_v1(json_path))
-        return process_emotion_data_v1(json_path)
+    # Use v1 processing for Hume score files
+    if 'hume' in suffix or 'checkpoint' in suffix:
+        primary_counts = process_emotion_data_v1(json_path)
+        print(primary_counts)
+        return primary_counts
     # Use v2 processing for all other files
     else:
         return process_emotion_data_v2(json_path)
 
+@cached_aggregation("feeling_wheel_v3.v1", version=1, inputs=input_files)
 def process_emotion_data_v1(json_path: str):
     """Process emotion data using the method from feeling_wheel.py."""
-    unmapped_emotions = set()
-    
-    with open(json_path, 'r', encoding='utf-8') as f:
-        emotion_data = json.load(f)
-    
-    # Initialize emotion counts
-    primary_counts = defaultdict(float)
-    paragraph_count = 0
-    
-    # Process the emotion data
-    for chapter in emotion_data:
-        for emotion_entry in chapter.get('emotions', []):
-            if 'emotions' in emotion_entry:
-                paragraph_count += 1
-                emotions_dict = emotion_entry['emotions']
-                if not emotions_dict:
-                    continue
-                
-                # For each emotion in the paragraph, add its contribution to primary emotions
-                for emotion, intensity in emotions_dict.items():
-                    # Check if the emotion maps to a primary emotion
-                    primary = SECONDARY_TO_PRIMARY.get(emotion)
-                    if primary:
-                        primary_counts[primary] += intensity
-                    else:
-                        unmapped_emotions.add(emotion)
+    # Per-emotion totals for the book, then one product against the compiled taxonomy
+    totals = emotion_totals(json_path)
+    primary, _, _, unmapped_emotions = TAXONOMY.aggregate(
+        np.fromiter(totals.values(), dtype=np.float64, count=len(totals)), list(totals)
+    )
+    primary_counts = defaultdict(float, primary)
     
     # Normalize by total intensity instead of paragraph count
     total_intensity = sum(primary_counts.values())
@@ -214,21 +207,20 @@ def process_emotion_data_v1(json_path: str):
     
     return primary_counts
 
+@cached_aggregation("feeling_wheel_v3.v2", version=1, scope="first 10 chapters")
 def process_emotion_data_v2(json_path: str):
     """Process emotion data using the method from feeling_wheel_v2.py."""
-    with open(json_path, 'r', encoding='utf-8') as f:
-        emotion_data = json.load(f)
-    
-    primary_counts = defaultdict(float)
-    
-    # Process only the first 10 chapters
-    for chapter in emotion_data[:10]:
-        for emotion_entry in chapter.get('emotions', []):
-            if 'emotion' in emotion_entry:
-                emotion = emotion_entry['emotion']
-                # Check if the emotion is a valid primary emotion
-                if any(emotion == e.value for e in PrimaryEmotion):
-                    primary_counts[emotion] += 1.0
+    # Stream only the first 10 chapters; labels that are not primary emotions are ignored
+    entries = iter_entries(json_path, 'emotions')
+    labels = (
+        emotion_entry['emotion']
+        for _, _, emotion_entry in takewhile(lambda item: item[0] < 10, entries)
+        if 'emotion' in emotion_entry
+    )
+    counts = TAXONOMY.label_counts(labels)
+    primary_counts = defaultdict(float, {
+        emotion: count for emotion, count in zip(TAXONOMY.primaries, counts.tolist()) if count
+    })
     
     # This part is already correct, as it normalizes by total_intensity
     total_intensity = sum(primary_counts.values())
@@ -283,7 +275,7 @@ if __name__ == "__main__":
         "data/emotions/jk_rowling_sample_emotions_oss.json",
         "data/emotions/jk_rowling_sample_emotions_gpt.json",
         "data/emotions/jk_rowling_sample_emotions_gemini.json",
-        "data/emotions/jk_rowling_sample_checkpoint_20241125_184726_hume.json",
+        "data/emotions/jk_rowling_sample_emotions_hume.json",
     ]
     
     # Process all files
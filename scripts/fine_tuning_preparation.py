@@ -1,100 +1,243 @@
 import os
-from openai import AzureOpenAI
+import re
+import sys
 from tqdm import tqdm
 import time
 import json
 import nltk
+import concurrent.futures
+from collections import deque
+from itertools import islice
 from pathlib import Path
+from threading import Lock
+from providers import get_openai_client
+from concurrency import AdaptiveLimiter
+from retry import CircuitBreaker, DeadLetterFile, InvalidResponseError, RetriesExhausted, RetryScheduler
+from journal import Journal
 
 # Create required directories if they don't exist
 Path("data/fine_tuning").mkdir(parents=True, exist_ok=True)
 
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version="2023-03-15-preview", 
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-)
+client = get_openai_client(api_version="2023-03-15-preview")
+
+# Rate limiting setup
+MAX_REQUESTS_PER_MIN = 300
+request_times = deque()
+request_lock = Lock()
+
+# Adaptive concurrency: in-flight requests grow while the API is healthy and back off on 429s/5xx
+limiter = AdaptiveLimiter("summaries", initial_limit=8, max_limit=32)
+breaker = CircuitBreaker("summaries")
+
+SYSTEM_PROMPT = "You are a skilled summarizer. Create a brief, clear summary of the given paragraph."
+PARAGRAPHS_PER_AUTHOR = 2000
+SUBSET_SIZES = [300, 600, 800]
+OUTPUT_DIR = 'data/fine_tuning'
+TERMINAL_PUNCTUATION = re.compile(r'[.?!]')  # Punkt's sentence-ending characters
 
 # Read sample texts from data/sample_texts directory
 sample_texts = {
     'J.K. Rowling': 'data/sample_texts/jk_rowling_sample.txt',
-    'Tade Thompson': 'data/sample_texts/tade_thompson_sample.txt', 
+    'Tade Thompson': 'data/sample_texts/tade_thompson_sample.txt',
     'Andre Agassi': 'data/sample_texts/andre_agassi_sample.txt'
 }
 
-texts = []
-for author, filepath in sample_texts.items():
-    with open(filepath, 'r', encoding='utf-8') as file:
-        texts.append(file.read())
-
 # Split and filter paragraphs
 def split_into_paragraphs(text):
     paragraphs = text.strip().split('\n\n')
     return [p.replace('\n', ' ').strip() for p in paragraphs if p.strip()]
 
+def max_sentences(paragraph):
+    """
+    Upper bound on the sentences Punkt can find: it only splits right after a
+    terminal punctuation character, so there is at most one more sentence than
+    there are such characters.
+    """
+    return len(TERMINAL_PUNCTUATION.findall(paragraph)) + 1
+
 def has_min_sentences(paragraph, min_sentences=4):
+    # Paragraphs that cannot reach min_sentences skip the (much slower) Punkt tokenizer
+    if max_sentences(paragraph) < min_sentences:
+        return False
     sentences = nltk.sent_tokenize(paragraph)
     return len(sentences) >= min_sentences
 
-all_paragraphs = []
-for text in texts:
-    paragraphs = split_into_paragraphs(text)
-    filtered_paragraphs = [p for p in paragraphs if has_min_sentences(p)]
-    all_paragraphs.extend(filtered_paragraphs[:2000])
+def select_paragraphs(sample_texts=sample_texts, limit=PARAGRAPHS_PER_AUTHOR) -> dict:
+    """
+    Up to `limit` paragraphs of at least four sentences per author, in text order.
+    Paragraphs are checked lazily, so nothing after the limit-th match is tokenized.
+    """
+    selected = {}
+    for author, filepath in sample_texts.items():
+        with open(filepath, 'r', encoding='utf-8') as file:
+            paragraphs = split_into_paragraphs(file.read())
+        selected[author] = list(islice((p for p in paragraphs if has_min_sentences(p)), limit))
+    return selected
 
 # Generate summaries
-def generate_summary(paragraph):
-    try:
+def generate_summary(paragraph, timeout=60):
+    """
+    Summarizes one paragraph with a single request. Failures raise so the
+    RetryScheduler can back off and retry, or dead-letter the paragraph.
+    """
+    with request_lock:
+        current_time = time.time()
+        while request_times and current_time - request_times[0] > 60:
+            request_times.popleft()
+
+        if len(request_times) >= MAX_REQUESTS_PER_MIN:
+            sleep_time = 60 - (current_time - request_times[0])
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+                current_time = time.time()
+
+        request_times.append(current_time)
+
+    with limiter.slot():
         response = client.chat.completions.create(
             model="gpt-35-turbo",
             messages=[
-                {"role": "system", "content": "You are a skilled summarizer. Create a brief, clear summary of the given paragraph."},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": paragraph}
             ],
             max_tokens=150,
-            temperature=0.7
+            temperature=0.7,
+            timeout=timeout
         )
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"\nError generating summary: {str(e)}")
-        return None
-
-# Process paragraphs and save results
-training_data = []
-pbar = tqdm(all_paragraphs, desc="Processing paragraphs")
-last_save = time.time()
-save_interval = 300  # Save every 5 minutes
-
-for paragraph in pbar:
-    summary = generate_summary(paragraph)
-    
-    if summary is not None:
-        training_data.append({
-            "messages": [
-                {"role": "system", "content": "You are a skilled summarizer. Create a brief, clear summary of the given paragraph."},
-                {"role": "user", "content": paragraph},
-                {"role": "assistant", "content": summary}
-            ]
-        })
-
-    # Save periodically to data/fine_tuning directory
-    if time.time() - last_save > save_interval:
-        for size in [300, 600, 800]:
-            if len(training_data) >= size:
-                data_subset = training_data[:size]
-                output_path = Path(f'data/fine_tuning/paragraph_summary_pairs_{size}.json')
-                with open(output_path, 'w') as f:
-                    json.dump(data_subset, f, indent=2)
-        
-        last_save = time.time()
-        print("\nProgress saved!")
-
-# Final save to data/fine_tuning directory
-for size in [300, 600, 800]:
-    if len(training_data) >= size:
-        data_subset = training_data[:size]
-        output_path = Path(f'data/fine_tuning/paragraph_summary_pairs_{size}.json')
-        with open(output_path, 'w') as f:
-            json.dump(data_subset, f, indent=2)
-
-print("\nProcessing complete. Results saved to data/fine_tuning/")
+
+    summary = response.choices[0].message.content
+    if not summary or not summary.strip():
+        raise InvalidResponseError("Empty summary received")
+    return {"paragraph": paragraph, "summary": summary}
+
+class ExampleWriter:
+    """
+    Append-only JSONL file of training examples. Remembers the byte offset at
+    which each example ends, so the first N examples are a byte prefix of the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.offsets = []
+
+    def write(self, example: dict):
+        self.file.write((json.dumps(example, ensure_ascii=False) + '\n').encode('utf-8'))
+        self.offsets.append(self.file.tell())
+
+    def close(self):
+        self.file.close()
+
+def to_example(record: dict) -> dict:
+    return {
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": record["paragraph"]},
+            {"role": "assistant", "content": record["summary"]}
+        ]
+    }
+
+def generate_summaries(paragraphs_by_author: dict, output_dir=OUTPUT_DIR) -> ExampleWriter:
+    """
+    Summarizes every paragraph concurrently, journaling each result so an
+    interrupted run picks up where it stopped. Training examples are streamed
+    to paragraph_summary_pairs.jsonl in author and paragraph order, whatever
+    order the summaries finish in.
+    """
+    journal = Journal(os.path.join(output_dir, "paragraph_summary_pairs.journal.jsonl"))
+    dead_letters = DeadLetterFile(os.path.join(output_dir, "paragraph_summary_pairs.deadletter.jsonl"))
+    writer = ExampleWriter(os.path.join(output_dir, "paragraph_summary_pairs.jsonl"))
+    if journal.resumed:
+        print(f"Resuming with {journal.resumed} summaries already generated")
+
+    # The journal's chapter slot holds the author's position in sample_texts
+    order = [
+        ((author_idx, i), paragraph)
+        for author_idx, paragraphs in enumerate(paragraphs_by_author.values(), start=1)
+        for i, paragraph in enumerate(paragraphs)
+    ]
+    pending = {key: paragraph for key, paragraph in order if not journal.has(*key, paragraph)}
+    failed = set()
+    cursor = 0
+
+    def write_ready():
+        # Write every example up to the first paragraph still in flight
+        nonlocal cursor
+        while cursor < len(order):
+            key, paragraph = order[cursor]
+            if key in failed:
+                cursor += 1
+            elif journal.has(*key, paragraph):
+                writer.write(to_example(journal.records[key]))
+                cursor += 1
+            else:
+                return
+
+    write_ready()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=limiter.max_limit) as executor:
+        scheduler = RetryScheduler(executor, breaker)
+        future_to_key = {scheduler.submit(generate_summary, paragraph): key
+                         for key, paragraph in pending.items()}
+
+        progress = tqdm(concurrent.futures.as_completed(future_to_key), total=len(pending), desc="Processing paragraphs")
+        for future in progress:
+            author_idx, i = future_to_key[future]
+            try:
+                journal.record(author_idx, i, future.result())
+            except RetriesExhausted as e:
+                dead_letters.add(author_idx, i, pending[(author_idx, i)], e)
+                failed.add((author_idx, i))
+            write_ready()
+            progress.set_postfix(limit=limiter.current_limit)
+        scheduler.close()
+
+    writer.close()
+    journal.close()
+    dead_letters.close(journal)
+    return writer
+
+def copy_prefix(source_path: str, output_path: str, length: int):
+    """
+    Copies the first `length` bytes of a file, in the kernel where os.sendfile allows it.
+    """
+    with open(source_path, 'rb') as source, open(output_path, 'wb') as output:
+        try:
+            sent = 0
+            while sent < length:
+                count = os.sendfile(output.fileno(), source.fileno(), sent, length - sent)
+                if count == 0:
+                    break
+                sent += count
+        except (AttributeError, OSError):
+            source.seek(0)
+            output.seek(0)
+            output.truncate()
+            remaining = length
+            while remaining:
+                chunk = source.read(min(remaining, 1 << 20))
+                if not chunk:
+                    break
+                output.write(chunk)
+                remaining -= len(chunk)
+
+def save_subsets(writer: ExampleWriter, sizes=SUBSET_SIZES, output_dir=OUTPUT_DIR):
+    """
+    Writes paragraph_summary_pairs_{size}.jsonl holding the first `size` examples
+    for each requested size the run produced enough examples for.
+    """
+    for size in sizes:
+        if len(writer.offsets) >= size:
+            output_path = Path(f'{output_dir}/paragraph_summary_pairs_{size}.jsonl')
+            copy_prefix(writer.path, output_path, writer.offsets[size - 1])
+        else:
+            print(f"Skipping {size}-example subset: only {len(writer.offsets)} examples generated")
+
+if __name__ == "__main__":
+    # Subset sizes can be given on the command line, e.g. fine_tuning_preparation.py 300 600 800 1500
+    sizes = [int(size) for size in sys.argv[1:]] or SUBSET_SIZES
+
+    paragraphs_by_author = select_paragraphs()
+    writer = generate_summaries(paragraphs_by_author)
+    save_subsets(writer, sizes)
+
+    print("\nProcessing complete. Results saved to data/fine_tuning/")
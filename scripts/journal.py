@@ -0,0 +1,114 @@
+import json
+import os
+import time
+
+# Durability settings
+FSYNC_EVERY = 50  # fsync after this many appended paragraphs
+FSYNC_INTERVAL = 5  # ...or after this many seconds, whichever comes first
+
+class Journal:
+    """
+    Append-only JSONL journal of classified paragraphs for one book.
+
+    Every line holds one paragraph result keyed by its chapter number and its
+    index within the chapter. Re-opening an existing journal loads the results
+    already recorded so a restarted run only classifies what is missing, and
+    compact() turns the journal into the usual per-chapter JSON output.
+    """
+
+    def __init__(self, path: str, fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.records = self.load()
+        self.resumed = len(self.records)
+        self.file = open(path, 'a', encoding='utf-8')
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+    def load(self) -> dict:
+        """
+        Reads previously journaled results, dropping a torn trailing line left by a crash.
+        """
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+
+        for line in data[:end].decode('utf-8').splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            chapter = entry.pop('chapter')
+            index = entry.pop('index')
+            records[(chapter, index)] = entry
+        return records
+
+    def has(self, chapter: int, index: int, paragraph: str) -> bool:
+        """
+        Whether this exact paragraph already has a result.
+        """
+        record = self.records.get((chapter, index))
+        return record is not None and record.get('paragraph') == paragraph
+
+    def pending(self, chapter: int, paragraphs: dict) -> dict:
+        """
+        The {index: paragraph} items that have no result yet.
+        """
+        return {i: para for i, para in paragraphs.items() if not self.has(chapter, i, para)}
+
+    def record(self, chapter: int, index: int, result: dict):
+        """
+        Appends a paragraph result, fsyncing once a batch has accumulated.
+        """
+        self.records[(chapter, index)] = result
+        self.file.write(json.dumps({'chapter': chapter, 'index': index, **result}) + '\n')
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every or time.time() - self.last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.time()
+
+    def compact(self, output_path: str, chapter_sizes: list, key: str, fields: list = None):
+        """
+        Writes the per-chapter output file from the journal, in paragraph order.
+        chapter_sizes lists (chapter number, paragraph count) for every chapter;
+        fields, if given, limits each entry to those keys.
+        """
+        self.sync()
+        book = []
+        for chapter, size in chapter_sizes:
+            entries = [self.records[(chapter, i)] for i in range(size) if (chapter, i) in self.records]
+            if fields is not None:
+                entries = [{f: entry[f] for f in fields if f in entry} for entry in entries]
+            book.append({
+                'chapter': chapter,
+                key: entries
+            })
+
+        tmp_path = output_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(book, f, indent=2)
+        os.replace(tmp_path, output_path)
+        return book
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+def journal_path(output_dir: str, book_file: str, suffix: str) -> str:
+    """
+    Journal location for a book's output, e.g. jk_rowling_sample_emotions_gpt.journal.jsonl.
+    """
+    return os.path.join(output_dir, f"{os.path.splitext(book_file)[0]}{suffix}.journal.jsonl")
@@ -0,0 +1,185 @@
+import json
+import re
+
+# Streaming settings
+CHUNK_SIZE = 1 << 20  # Characters read from the file at a time
+SKIP_FIELDS = ('paragraph',)  # Entry fields stepped over without being decoded
+
+WHITESPACE = ' \t\n\r'
+NON_WHITESPACE = re.compile(r'\S')
+STRUCTURAL = re.compile(r'[\[\]{}"]')
+DELIMITER = re.compile(r'[\s,:\]}]')
+
+class JsonStream:
+    """
+    Incremental reader over a JSON file. Holds one chunk of the file at a
+    time: strings can be stepped over without decoding them, and small values
+    are decoded with the standard decoder once they are fully buffered.
+    """
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self) -> bool:
+        """
+        Drops the consumed part of the buffer and appends the next chunk.
+        """
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        The next non-whitespace character, without consuming it.
+        """
+        if self.pos < len(self.buf) and self.buf[self.pos] not in WHITESPACE:
+            return self.buf[self.pos]
+        while True:
+            match = NON_WHITESPACE.search(self.buf, self.pos)
+            if match:
+                self.pos = match.start()
+                return self.buf[self.pos]
+            self.pos = len(self.buf)
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON input")
+
+    def take(self) -> str:
+        char = self.peek()
+        self.pos += 1
+        return char
+
+    def expect(self, expected: str):
+        char = self.take()
+        if char != expected:
+            raise ValueError(f"Expected {expected!r} but found {char!r}")
+
+    def read_value(self):
+        """
+        Decodes the next value. Meant for keys, labels and score dicts, which
+        are small enough to hold in the buffer whole.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number cut off by the end of the buffer may continue in the next chunk
+            if not self.eof and not DELIMITER.match(self.buf, end) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def skip_string(self):
+        self.expect('"')
+        while True:
+            end = self.buf.find('"', self.pos)
+            if end == -1:
+                # Keep a trailing run of backslashes, which may escape the next chunk's first quote
+                self.pos = max(self.pos, len(self.buf.rstrip('\\')))
+            else:
+                # The quote is escaped if an odd number of backslashes precede it
+                start = end
+                while start > self.pos and self.buf[start - 1] == '\\':
+                    start -= 1
+                self.pos = end + 1
+                if (end - start) % 2 == 0:
+                    return
+                continue
+            if not self.fill():
+                raise ValueError("Unterminated string in JSON input")
+
+    def skip_value(self):
+        """
+        Steps over the next value, however large, without decoding it.
+        """
+        char = self.peek()
+        if char == '"':
+            self.skip_string()
+        elif char not in '[{':
+            self.read_value()
+        else:
+            depth = 0
+            while True:
+                match = STRUCTURAL.search(self.buf, self.pos)
+                if match is None:
+                    self.pos = len(self.buf)
+                    if not self.fill():
+                        raise ValueError("Unexpected end of JSON input")
+                    continue
+                char = match.group()
+                if char == '"':
+                    self.pos = match.start()
+                    self.skip_string()
+                    continue
+                self.pos = match.end()
+                depth += 1 if char in '[{' else -1
+                if depth == 0:
+                    return
+
+    def items(self, container_end: str):
+        """
+        Yields once per element of the array or object just opened, with the
+        stream positioned at that element, and consumes the separators.
+        """
+        if self.peek() == container_end:
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.take()
+            if char == container_end:
+                return
+            if char != ',':
+                raise ValueError(f"Expected ',' or {container_end!r} but found {char!r}")
+
+    def read_entry(self, skip_fields) -> dict:
+        self.expect('{')
+        entry = {}
+        for _ in self.items('}'):
+            field = self.read_value()
+            self.expect(':')
+            if field in skip_fields:
+                self.skip_value()
+            else:
+                entry[field] = self.read_value()
+        return entry
+
+def iter_entries(json_path: str, key: str, skip_fields=SKIP_FIELDS, chunk_size=CHUNK_SIZE):
+    """
+    Streams the paragraph entries of a per-chapter output file such as
+    <book>_emotions.json or <book>_classifications.json, i.e.
+    [{"chapter": 1, key: [{...}, ...]}, ...]. Yields (position, chapter, entry)
+    where position is the chapter's 0-based place in the file and chapter its
+    "chapter" value (None if it comes after the entries). Fields in
+    skip_fields, the paragraph text by default, are never decoded, and memory
+    use stays at about one chunk however large the file is.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        stream = JsonStream(f, chunk_size)
+        stream.expect('[')
+        for position, _ in enumerate(stream.items(']')):
+            stream.expect('{')
+            chapter = None
+            for _ in stream.items('}'):
+                field = stream.read_value()
+                stream.expect(':')
+                if field == key:
+                    stream.expect('[')
+                    for _ in stream.items(']'):
+                        yield position, chapter, stream.read_entry(skip_fields)
+                elif field == 'chapter':
+                    chapter = stream.read_value()
+                else:
+                    stream.skip_value()
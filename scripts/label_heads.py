@@ -0,0 +1,218 @@
+import json
+import os
+import sys
+import time
+import numpy as np
+from tqdm import tqdm
+from book_text import read_book, split_into_chapters, split_into_paragraphs
+from embeddings import EmbeddingStore, embed_books
+from label_store import OUTPUT_DIRS, identify
+
+# Head settings
+HIDDEN_UNITS = 0  # 0 trains a linear (softmax regression) head, otherwise a one-hidden-layer MLP
+EPOCHS = 300
+LEARNING_RATE = 0.01
+WEIGHT_DECAY = 1e-4
+HELD_OUT_FRACTION = 0.2
+SEED = 13
+HEADS_DIR = 'models/heads'
+
+# task -> (LLM whose outputs are the training labels, output key, label field, output dir, output suffix)
+TASKS = {
+    "aspect": ('gemini', 'classifications', 'aspect', 'data/stylometry', '_classifications_head.json'),
+    "emotion": ('gpt', 'emotions', 'emotion', 'data/emotions', '_emotions_head.json'),
+}
+
+class LabelHead:
+    """
+    Small classifier over stored paragraph embeddings, trained in NumPy with
+    full-batch Adam on cross-entropy. hidden=0 is a linear head; otherwise a
+    single ReLU hidden layer sits in front of the output layer.
+    """
+
+    def __init__(self, labels: list, dim: int, hidden=HIDDEN_UNITS, seed=SEED):
+        rng = np.random.default_rng(seed)
+        self.labels = list(labels)
+        sizes = [dim, hidden, len(labels)] if hidden else [dim, len(labels)]
+        self.params = {}
+        for layer, (fan_in, fan_out) in enumerate(zip(sizes, sizes[1:])):
+            self.params[f"W{layer}"] = rng.normal(0, np.sqrt(2 / fan_in), (fan_in, fan_out)).astype(np.float32)
+            self.params[f"b{layer}"] = np.zeros(fan_out, dtype=np.float32)
+        self.layers = len(sizes) - 1
+
+    def forward(self, X: np.ndarray):
+        activations = [X]
+        for layer in range(self.layers):
+            out = activations[-1] @ self.params[f"W{layer}"] + self.params[f"b{layer}"]
+            if layer < self.layers - 1:
+                out = np.maximum(out, 0)
+            activations.append(out)
+        return activations
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        logits = self.forward(X)[-1]
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def predict(self, X: np.ndarray) -> list:
+        """
+        (label, confidence) for each row of X.
+        """
+        probabilities = self.predict_proba(X)
+        best = probabilities.argmax(axis=1)
+        return [(self.labels[i], float(p)) for i, p in zip(best, probabilities[np.arange(len(best)), best])]
+
+    def fit(self, X: np.ndarray, y: np.ndarray, epochs=EPOCHS, learning_rate=LEARNING_RATE, weight_decay=WEIGHT_DECAY):
+        onehot = np.eye(len(self.labels), dtype=np.float32)[y]
+        moments = {k: (np.zeros_like(v), np.zeros_like(v)) for k, v in self.params.items()}
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+
+        for step in range(1, epochs + 1):
+            activations = self.forward(X)
+            logits = activations[-1] - activations[-1].max(axis=1, keepdims=True)
+            probabilities = np.exp(logits)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+            # Backpropagate the mean cross-entropy
+            delta = (probabilities - onehot) / len(X)
+            grads = {}
+            for layer in reversed(range(self.layers)):
+                grads[f"W{layer}"] = activations[layer].T @ delta + weight_decay * self.params[f"W{layer}"]
+                grads[f"b{layer}"] = delta.sum(axis=0)
+                if layer:
+                    delta = (delta @ self.params[f"W{layer}"].T) * (activations[layer] > 0)
+
+            for key, grad in grads.items():
+                m, v = moments[key]
+                m[:] = beta1 * m + (1 - beta1) * grad
+                v[:] = beta2 * v + (1 - beta2) * grad ** 2
+                m_hat = m / (1 - beta1 ** step)
+                v_hat = v / (1 - beta2 ** step)
+                self.params[key] -= learning_rate * m_hat / (np.sqrt(v_hat) + eps)
+        return self
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, labels=np.array(self.labels), **self.params)
+
+    @classmethod
+    def load(cls, path: str) -> "LabelHead":
+        data = np.load(path)
+        head = cls.__new__(cls)
+        head.labels = [str(label) for label in data["labels"]]
+        head.params = {k: data[k] for k in data.files if k != "labels"}
+        head.layers = len(head.params) // 2
+        return head
+
+def load_labelled(path: str, key: str, field: str):
+    """
+    (paragraphs, labels) from a classifier output file, skipping missing or Unknown labels.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = [entry for chapter in json.load(f) for entry in chapter.get(key, [])]
+    entries = [e for e in entries if e.get(field) not in (None, "Unknown")]
+    return [e['paragraph'] for e in entries], [e[field] for e in entries]
+
+def find_label_files(paths=None, output_dirs=OUTPUT_DIRS) -> dict:
+    """
+    task -> the output files to train its head on: the given paths, or else
+    every output of the task's LLM found in output_dirs.
+    """
+    files = {}
+    if paths:
+        for path in paths:
+            found = identify(path)
+            if found is None or found[1] not in TASKS or found[4] is None:
+                raise ValueError(f"{path} is not an aspect or emotion label file")
+            files.setdefault(found[1], []).append(path)
+        return files
+
+    for output_dir in output_dirs:
+        if not os.path.isdir(output_dir):
+            continue
+        for name in sorted(os.listdir(output_dir)):
+            path = os.path.join(output_dir, name)
+            found = identify(path) if name.endswith('.json') else None
+            if found is not None and found[1] in TASKS and TASKS[found[1]][0] == found[2]:
+                files.setdefault(found[1], []).append(path)
+    return files
+
+def head_path(task: str) -> str:
+    return os.path.join(HEADS_DIR, f"{task}_head.npz")
+
+def train_head(task: str, store: EmbeddingStore, label_files: list, hidden=HIDDEN_UNITS) -> LabelHead:
+    """
+    Trains a head on LLM output files and reports its held-out agreement with the LLM.
+    """
+    paragraphs, labels = [], []
+    for path in label_files:
+        _, _, _, key, field = identify(path)
+        file_paragraphs, file_labels = load_labelled(path, key, field)
+        paragraphs += file_paragraphs
+        labels += file_labels
+    store.add(paragraphs)
+    X = store.get(paragraphs)
+    classes = sorted(set(labels))
+    y = np.array([classes.index(label) for label in labels])
+
+    order = np.random.default_rng(SEED).permutation(len(X))
+    split = int(len(X) * (1 - HELD_OUT_FRACTION))
+    train, held_out = order[:split], order[split:]
+
+    head = LabelHead(classes, X.shape[1], hidden=hidden).fit(X[train], y[train])
+    if len(held_out):
+        predicted = head.predict_proba(X[held_out]).argmax(axis=1)
+        print(f"{task} head: {np.mean(predicted == y[held_out]):.1%} agreement with {', '.join(label_files)} "
+              f"on {len(held_out)} held-out paragraphs")
+
+    # Refit on everything before saving
+    head = LabelHead(classes, X.shape[1], hidden=hidden).fit(X, y)
+    head.save(head_path(task))
+    return head
+
+def label_books(input_dir, store: EmbeddingStore, heads: dict):
+    """
+    Labels every paragraph with each head, writing the usual per-chapter output files.
+    """
+    book_files = [f for f in os.listdir(input_dir) if f.endswith('.txt')]
+
+    for book_file in tqdm(book_files, desc="Labelling Books"):
+        chapters = [split_into_paragraphs(c) for c in split_into_chapters(read_book(os.path.join(input_dir, book_file)))]
+        for chapter in chapters:
+            store.add(chapter)
+
+        for task, head in heads.items():
+            _, key, field, output_dir, suffix = TASKS[task]
+            os.makedirs(output_dir, exist_ok=True)
+            start = time.perf_counter()
+            book = []
+            for idx, paragraphs in enumerate(chapters, start=1):
+                predictions = head.predict(store.get(paragraphs)) if paragraphs else []
+                book.append({
+                    'chapter': idx,
+                    key: [{"paragraph": p, field: label, "provider": "head", "confidence": confidence}
+                          for p, (label, confidence) in zip(paragraphs, predictions)]
+                })
+            elapsed = time.perf_counter() - start
+            total = sum(len(paragraphs) for paragraphs in chapters)
+            print(f"{book_file}: {task} for {total} paragraphs in {elapsed * 1000:.0f}ms")
+
+            with open(os.path.join(output_dir, f"{os.path.splitext(book_file)[0]}{suffix}"), 'w', encoding='utf-8') as f:
+                json.dump(book, f, indent=2)
+
+if __name__ == "__main__":
+    input_directory = 'data/sample_texts'
+
+    label_files = find_label_files(sys.argv[1:])
+    store = embed_books(input_directory)
+    heads = {}
+    for task, (model, *_) in TASKS.items():
+        if task in label_files:
+            heads[task] = train_head(task, store, label_files[task])
+        elif os.path.exists(head_path(task)):
+            heads[task] = LabelHead.load(head_path(task))
+        else:
+            print(f"Skipping {task}: no {model} labels in {', '.join(OUTPUT_DIRS)} and no trained head")
+
+    label_books(input_directory, store, heads)
@@ -0,0 +1,218 @@
+import json
+import os
+import re
+import numpy as np
+from tqdm import tqdm
+from embeddings import paragraph_id
+from emotion_matrix import HUME_EMOTIONS, EmotionMatrix, matrix_paths, score_vector
+from json_stream import iter_entries
+
+# Columnar store of every classifier's labels (pip install pyarrow):
+#   labels/task=<task>/model=<model>/<book>.parquet  book, chapter, paragraph_id, label, scores
+#   paragraphs/<book>.parquet                        paragraph_id, paragraph (each text stored once)
+STORE_DIR = 'data/label_store'
+OUTPUT_DIRS = ['data/emotions', 'data/stylometry']
+
+# Output file suffix -> (task, model, entry list key, label field); None labels with the top Hume score
+SOURCES = {
+    "_classifications": ("aspect", "gemini", "classifications", "aspect"),
+    "_classifications_head": ("aspect", "head", "classifications", "aspect"),
+    "_classifications_sampled": ("aspect", "gemini_sampled", "classifications", "aspect"),
+    "_emotions": ("emotion", "gemini", "emotions", "emotion"),
+    "_emotions_gemini": ("emotion", "gemini", "emotions", "emotion"),
+    "_emotions_sampled": ("emotion", "gemini_sampled", "emotions", "emotion"),
+    "_emotions_gpt": ("emotion", "gpt", "emotions", "emotion"),
+    "_emotions_gpt_sampled": ("emotion", "gpt_sampled", "emotions", "emotion"),
+    "_emotions_oss": ("emotion", "oss", "emotions", "emotion"),
+    "_emotions_routed": ("emotion", "routed", "emotions", "emotion"),
+    "_emotions_cascade": ("emotion", "cascade", "emotions", "emotion"),
+    "_emotions_head": ("emotion", "head", "emotions", "emotion"),
+    "_emotions_hume": ("emotion", "hume", "emotions", None),
+}
+CHECKPOINT = re.compile(r'^(?P<book>.+)_checkpoint_\d+_\d+$')  # Older Hume runs saved as checkpoints
+
+def identify(path: str):
+    """
+    (book, task, model, key, field) for a classifier output file, or None if
+    the file is not one.
+    """
+    stem = os.path.splitext(os.path.basename(path))[0]
+    match = CHECKPOINT.match(stem)
+    if match:
+        return (match.group('book'),) + SOURCES["_emotions_hume"]
+    for suffix in sorted(SOURCES, key=len, reverse=True):
+        if stem.endswith(suffix) and len(stem) > len(suffix):
+            return (stem[:-len(suffix)],) + SOURCES[suffix]
+    return None
+
+def label_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("book", pa.string()),
+        ("chapter", pa.int32()),
+        ("paragraph_id", pa.string()),
+        ("label", pa.string()),
+        ("scores", pa.list_(pa.float32())),
+    ], metadata={"emotions": json.dumps(HUME_EMOTIONS)})
+
+def label_path(store_dir: str, task: str, model: str, book: str) -> str:
+    return os.path.join(store_dir, "labels", f"task={task}", f"model={model}", f"{book}.parquet")
+
+def write_labels(store_dir: str, task: str, model: str, book: str, columns: dict):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    path = label_path(store_dir, task, model, book)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pydict(columns, schema=label_schema())
+    pq.write_table(table, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return table.num_rows
+
+def write_paragraphs(store_dir: str, book: str, texts: dict):
+    """
+    Adds paragraph texts to the book's text table, keeping the ones already stored.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    path = os.path.join(store_dir, "paragraphs", f"{book}.parquet")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        existing = pq.read_table(path)
+        known = set(existing.column("paragraph_id").to_pylist())
+        texts = {pid: text for pid, text in texts.items() if pid not in known}
+        if not texts:
+            return
+        table = pa.concat_tables([existing, pa.table({"paragraph_id": list(texts), "paragraph": list(texts.values())})])
+    else:
+        table = pa.table({"paragraph_id": list(texts), "paragraph": list(texts.values())})
+    pq.write_table(table, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+def convert_file(path: str, store_dir=STORE_DIR) -> int:
+    """
+    Converts one per-chapter JSON output into the store, replacing whatever
+    the store held for that book, task and model. Returns the rows written.
+    """
+    book, task, model, key, field = identify(path)
+    columns = {"book": [], "chapter": [], "paragraph_id": [], "label": [], "scores": []}
+    texts = {}
+    for position, chapter, entry in iter_entries(path, key, skip_fields=()):
+        paragraph = entry.get('paragraph')
+        if not paragraph:
+            continue
+        pid = paragraph_id(paragraph)
+        texts[pid] = paragraph
+        if field is None:
+            emotions = entry.get('emotions') or {}
+            label = max(emotions, key=emotions.get) if emotions else None
+            scores = score_vector(emotions) if emotions else None
+        else:
+            label, scores = entry.get(field), None
+        columns["book"].append(book)
+        columns["chapter"].append(chapter if chapter is not None else position + 1)
+        columns["paragraph_id"].append(pid)
+        columns["label"].append(label)
+        columns["scores"].append(scores)
+
+    write_paragraphs(store_dir, book, texts)
+    return write_labels(store_dir, task, model, book, columns)
+
+def convert_matrix(path: str, store_dir=STORE_DIR) -> int:
+    """
+    Converts a Hume score matrix written by classify_emotions.py. The matrix
+    holds no paragraph text, so only the labels and scores are stored.
+    """
+    import pyarrow as pa
+    book, task, model, _, _ = identify(path)
+    matrix = EmotionMatrix.load(path)
+    header = [matrix.emotions.index(name) for name in HUME_EMOTIONS]
+    scores = np.asarray(matrix.scores, dtype=np.float32)[:, header]
+    has_scores = scores.any(axis=1)
+    labels = np.array(HUME_EMOTIONS, dtype=object)[scores.argmax(axis=1)]
+    offsets = np.arange(len(scores) + 1, dtype=np.int32) * len(HUME_EMOTIONS)
+    columns = {
+        "book": [book] * len(scores),
+        "chapter": [chapter for chapter, _, _ in matrix.paragraphs],
+        "paragraph_id": [pid for _, _, pid in matrix.paragraphs],
+        "label": np.where(has_scores, labels, None).tolist(),
+        "scores": pa.ListArray.from_arrays(offsets, pa.array(scores.ravel()), mask=pa.array(~has_scores)),
+    }
+    return write_labels(store_dir, task, model, book, columns)
+
+def convert_outputs(output_dirs=OUTPUT_DIRS, store_dir=STORE_DIR) -> int:
+    """
+    Converts every classifier output in output_dirs. Hume books are read from
+    their JSON output when there is one, for the paragraph text, and from the
+    score matrix otherwise.
+    """
+    paths = []
+    for output_dir in output_dirs:
+        if not os.path.isdir(output_dir):
+            continue
+        for name in sorted(os.listdir(output_dir)):
+            path = os.path.join(output_dir, name)
+            if name.endswith('.json') and identify(path):
+                paths.append((convert_file, path))
+            elif name.endswith('.npy') and not name.endswith('.sentences.npy') and identify(path):
+                json_path = os.path.splitext(path)[0] + '.json'
+                if not os.path.exists(json_path) and os.path.exists(matrix_paths(path)[1]):
+                    paths.append((convert_matrix, path))
+
+    rows = 0
+    for convert, path in tqdm(paths, desc="Converting outputs"):
+        rows += convert(path, store_dir)
+    return rows
+
+def open_labels(store_dir=STORE_DIR):
+    """
+    The label store as a pyarrow dataset, with task and model as partition columns.
+    """
+    import pyarrow.dataset as ds
+    return ds.dataset(os.path.join(store_dir, "labels"), format="parquet", partitioning="hive")
+
+def load_labels(store_dir=STORE_DIR, columns=None, **equals):
+    """
+    Reads the labels, e.g. load_labels(task="emotion", model="gpt"). Only the
+    partitions and columns asked for are read.
+    """
+    import pyarrow.dataset as ds
+    condition = None
+    for name, value in equals.items():
+        term = ds.field(name) == value
+        condition = term if condition is None else condition & term
+    return open_labels(store_dir).to_table(columns=columns, filter=condition)
+
+def label_shares(table, by=("task", "model", "book")):
+    """
+    Count and share of each label within every `by` group, as one grouped
+    aggregation over the whole table.
+    """
+    import pyarrow.compute as pc
+    by = list(by)
+    table = table.filter(pc.is_valid(table.column("label")))
+    counts = table.group_by(by + ["label"]).aggregate([("paragraph_id", "count")])
+    counts = counts.rename_columns(by + ["label", "count"])
+    totals = counts.group_by(by).aggregate([("count", "sum")])
+    shares = counts.join(totals, keys=by)
+    shares = shares.append_column("share", pc.divide(pc.cast(shares.column("count"), "float64"),
+                                                     pc.cast(shares.column("count_sum"), "float64")))
+    return shares.drop_columns(["count_sum"]).sort_by([(name, "ascending") for name in by + ["label"]])
+
+def paragraph_texts(paragraph_ids, store_dir=STORE_DIR) -> dict:
+    """
+    {paragraph_id: text} for the given IDs, from the text tables.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    paragraphs = ds.dataset(os.path.join(store_dir, "paragraphs"), format="parquet")
+    table = paragraphs.to_table(filter=ds.field("paragraph_id").isin(pa.array(list(paragraph_ids), pa.string())))
+    return dict(zip(table.column("paragraph_id").to_pylist(), table.column("paragraph").to_pylist()))
+
+if __name__ == "__main__":
+    rows = convert_outputs()
+    print(f"Stored {rows} labels in {STORE_DIR}")
+
+    shares = label_shares(load_labels(columns=["book", "paragraph_id", "label", "task", "model"]))
+    for row in shares.to_pylist():
+        print(f"{row['task']:<8} {row['model']:<15} {row['book']:<25} {row['label']:<25} "
+              f"{row['count']:>6} {row['share']:6.1%}")
@@ -0,0 +1,145 @@
+import os
+# Pipelines pick their backend when imported, so this has to come first
+os.environ.setdefault("CLASSIFIER_BACKEND", "fake")
+
+import asyncio
+import functools
+import importlib
+import json
+import random
+import sys
+import tempfile
+import time
+from threading import Lock
+import numpy as np
+
+# Synthetic corpus settings
+NUM_CHAPTERS = 5
+PARAGRAPHS_PER_CHAPTER = 40
+CORPUS_SEED = 7
+
+# pipeline name -> (module, per-request function, output suffix, output key)
+PIPELINES = {
+    "gpt": ("gpt_classify_emotions", "rate_limited_classify", "_emotions_gpt.json", "emotions"),
+    "gemini": ("gemini_classify_emotions", "rate_limited_classify", "_emotions.json", "emotions"),
+    "aspects": ("classify_paragraphs", "rate_limited_classify", "_classifications.json", "classifications"),
+    "aspects+emotions": ("classify_aspects_emotions", "rate_limited_classify", "_classifications.json", "classifications"),
+    "hume": ("classify_emotions", "classify_emotions", "_emotions_hume.json", "emotions"),
+    "routed": ("routed_classify_emotions", "HedgedRouter.classify", "_emotions_routed.json", "emotions"),
+}
+
+WORDS = (
+    "the a wand castle night storm quiet letter owl door stair window candle forest river "
+    "whispered shouted ran waited laughed trembled remembered watched opened closed "
+    "slowly suddenly never always again almost cold bright dark old small strange"
+).split()
+
+def make_corpus(input_dir: str, num_chapters=NUM_CHAPTERS, paragraphs_per_chapter=PARAGRAPHS_PER_CHAPTER, seed=CORPUS_SEED):
+    """
+    Writes a synthetic book split into CHAPTERs of paragraphs long enough to be classified.
+    """
+    rng = random.Random(seed)
+    chapters = []
+    for _ in range(num_chapters):
+        paragraphs = []
+        for _ in range(paragraphs_per_chapter):
+            sentences = [
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 15))).capitalize() + "."
+                for _ in range(rng.randint(3, 6))
+            ]
+            paragraphs.append(" ".join(sentences))
+        chapters.append("\n\n".join(paragraphs))
+
+    with open(os.path.join(input_dir, "load_test_book.txt"), 'w', encoding='utf-8') as f:
+        f.write("CHAPTER\n\n" + "\n\nCHAPTER\n\n".join(chapters))
+
+def instrument(module, function_name: str, latencies: list):
+    """
+    Wraps a pipeline's request function to record the latency seen by each paragraph.
+    """
+    # Dotted names like "HedgedRouter.classify" patch a method on a class
+    owner = module
+    *owners, function_name = function_name.split(".")
+    for name in owners:
+        owner = getattr(owner, name)
+    function = getattr(owner, function_name)
+    lock = Lock()
+
+    if asyncio.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            results = await function(*args, **kwargs)
+            with lock:
+                latencies.extend([time.perf_counter() - start] * len(results))
+            return results
+    else:
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = function(*args, **kwargs)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+            return result
+
+    setattr(owner, function_name, timed)
+
+def count_results(output_path: str, key: str):
+    with open(output_path, 'r', encoding='utf-8') as f:
+        book = json.load(f)
+    entries = [entry for chapter in book for entry in chapter.get(key, [])]
+    failed = sum(
+        1 for entry in entries
+        if entry.get('emotion') == "Unknown" or entry.get('aspect') == "Unknown" or entry.get('emotions') == {}
+    )
+    return len(entries), failed
+
+def run_pipeline(name: str, input_dir: str):
+    module_name, function_name, suffix, key = PIPELINES[name]
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError as e:
+        print(f"{name:<8} skipped: {str(e)}")
+        return None
+
+    latencies = []
+    instrument(module, function_name, latencies)
+    output_dir = tempfile.mkdtemp(prefix=f"load_test_{name}_")
+
+    start = time.perf_counter()
+    try:
+        if asyncio.iscoroutinefunction(module.process_books):
+            asyncio.run(module.process_books(input_dir, output_dir, os.getenv("HUME_API_KEY")))
+        else:
+            module.process_books(input_dir, output_dir)
+    except Exception as e:
+        print(f"{name:<8} crashed after {time.perf_counter() - start:.1f}s: {type(e).__name__}: {str(e)}")
+        return None
+    wall_time = time.perf_counter() - start
+
+    paragraphs, failed = count_results(os.path.join(output_dir, "load_test_book" + suffix), key)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (0.0, 0.0, 0.0)
+    report = {
+        "pipeline": name,
+        "paragraphs": paragraphs,
+        "failed": failed,
+        "wall_time": wall_time,
+        "paragraphs_per_sec": paragraphs / wall_time if wall_time > 0 else 0.0,
+        "p50": p50,
+        "p95": p95,
+        "p99": p99,
+    }
+    print(f"{name:<8} paragraphs={paragraphs} failed={failed} wall={wall_time:.1f}s "
+          f"throughput={report['paragraphs_per_sec']:.1f} para/s "
+          f"p50={p50:.2f}s p95={p95:.2f}s p99={p99:.2f}s")
+    return report
+
+if __name__ == "__main__":
+    # Backend behaviour is configured through FAKE_* environment variables, see fake_backends.py
+    pipelines = sys.argv[1:] or list(PIPELINES)
+
+    input_directory = tempfile.mkdtemp(prefix="load_test_input_")
+    make_corpus(input_directory)
+
+    for name in pipelines:
+        run_pipeline(name, input_directory)
@@ -0,0 +1,196 @@
+import json
+import os
+import sys
+from itertools import combinations
+import numpy as np
+from label_store import STORE_DIR, load_labels
+
+# The emotion backends compared by default; Hume's top emotion is mapped to a primary first
+MODELS = ["gpt", "gemini", "oss", "hume"]
+MISSING_LABELS = {"Unknown"}  # Labels treated as "no label"
+WORST_CHAPTERS = 10  # Chapters listed in the report, lowest agreement first
+
+def hume_primaries(labels):
+    """
+    Maps Hume emotion names to the primary emotions feeling_wheel_v3 uses,
+    one lookup per distinct name rather than per paragraph.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from feeling_wheel_v3 import SECONDARY_TO_PRIMARY
+    names = pc.unique(labels)
+    primaries = pa.array([SECONDARY_TO_PRIMARY.get(name) for name in names.to_pylist()], pa.string())
+    return pc.take(primaries, pc.index_in(labels, value_set=names))
+
+def label_matrix(table, models: list) -> dict:
+    """
+    Joins the models' labels per paragraph into an (N, models) int16 matrix of
+    label codes, -1 where a model has no label. Paragraphs are keyed by
+    (book, paragraph_id) only, since the drivers number chapters differently
+    (Hume keeps the short front-matter chapters the others drop).
+    chapter_codes gives each row's (book, chapter), taken from the first model
+    in `models` that labelled the paragraph.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    table = table.filter(pc.is_in(table.column("model"), value_set=pa.array(models))).combine_chunks()
+    column = lambda name: table.column(name).combine_chunks()
+    model_codes = pc.index_in(column("model"), value_set=pa.array(models)).to_numpy()
+
+    labels = column("label")
+    if "hume" in models:
+        labels = pc.if_else(pc.equal(column("model"), "hume"), hume_primaries(labels), labels)
+    labels = pc.if_else(pc.is_in(labels, value_set=pa.array(sorted(MISSING_LABELS), pa.string())),
+                        pa.scalar(None, pa.string()), labels)
+    encoded = labels.dictionary_encode()
+    label_codes = pc.fill_null(encoded.indices, -1).to_numpy()
+
+    chapter_keys = pc.binary_join_element_wise(column("book"), pc.cast(column("chapter"), pa.string()), "|")
+    paragraph_keys = pc.binary_join_element_wise(column("book"), column("paragraph_id"), "|")
+    rows = paragraph_keys.dictionary_encode()
+    chapters = chapter_keys.dictionary_encode()
+    row_codes = rows.indices.to_numpy()
+
+    matrix = np.full((len(rows.dictionary), len(models)), -1, dtype=np.int16)
+    matrix[row_codes, model_codes] = label_codes
+    # Later writes win, so write the preferred models' chapters last
+    order = np.argsort(-model_codes, kind='stable')
+    chapter_codes = np.empty(len(rows.dictionary), dtype=np.int64)
+    chapter_codes[row_codes[order]] = chapters.indices.to_numpy()[order]
+
+    return {
+        "matrix": matrix,
+        "labels": encoded.dictionary.to_pylist(),
+        "models": list(models),
+        "chapter_codes": chapter_codes,
+        "chapters": [tuple(key.rsplit("|", 1)) for key in chapters.dictionary.to_pylist()],
+    }
+
+def confusion_matrix(matrix: np.ndarray, a: int, b: int, n_labels: int) -> np.ndarray:
+    """
+    Counts of (model a's label, model b's label) over paragraphs both labelled.
+    """
+    both = (matrix[:, a] >= 0) & (matrix[:, b] >= 0)
+    pairs = matrix[both, a].astype(np.int64) * n_labels + matrix[both, b]
+    return np.bincount(pairs, minlength=n_labels * n_labels).reshape(n_labels, n_labels)
+
+def cohens_kappa(confusion: np.ndarray) -> float:
+    n = confusion.sum()
+    if n == 0:
+        return float('nan')
+    observed = np.trace(confusion) / n
+    expected = (confusion.sum(axis=1) @ confusion.sum(axis=0)) / (n * n)
+    return float((observed - expected) / (1 - expected)) if expected < 1 else 1.0
+
+def category_counts(matrix: np.ndarray, n_labels: int) -> np.ndarray:
+    """
+    (N, labels) matrix of how many models gave each paragraph each label.
+    """
+    rows, columns = np.nonzero(matrix >= 0)
+    cells = rows * n_labels + matrix[rows, columns]
+    return np.bincount(cells, minlength=len(matrix) * n_labels).reshape(len(matrix), n_labels)
+
+def fleiss_kappa(counts: np.ndarray) -> float:
+    """
+    Fleiss' kappa over paragraphs labelled by every rater (equal rater counts per row).
+    """
+    raters = counts.sum(axis=1)
+    if len(counts) == 0 or raters[0] < 2:
+        return float('nan')
+    m = raters[0]
+    per_paragraph = ((counts * counts).sum(axis=1) - m) / (m * (m - 1))
+    observed = per_paragraph.mean()
+    shares = counts.sum(axis=0) / counts.sum()
+    expected = (shares * shares).sum()
+    return float((observed - expected) / (1 - expected)) if expected < 1 else 1.0
+
+def chapter_agreement(counts: np.ndarray, chapter_codes: np.ndarray, n_chapters: int) -> dict:
+    """
+    Per chapter: the share of agreeing model pairs among all model pairs over
+    paragraphs with at least two labels, and the share of those paragraphs all
+    models agree on.
+    """
+    raters = counts.sum(axis=1)
+    rated = raters >= 2
+    counts, raters, codes = counts[rated], raters[rated], chapter_codes[rated]
+    agreeing_pairs = (counts * (counts - 1)).sum(axis=1) / 2
+    pairs = raters * (raters - 1) / 2
+    unanimous = (counts.max(axis=1) == raters).astype(np.float64)
+    paragraphs = np.bincount(codes, minlength=n_chapters)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            "paragraphs": paragraphs,
+            "pairwise": np.bincount(codes, weights=agreeing_pairs, minlength=n_chapters)
+                        / np.bincount(codes, weights=pairs, minlength=n_chapters),
+            "unanimous": np.bincount(codes, weights=unanimous, minlength=n_chapters) / paragraphs,
+        }
+
+def agreement_report(store_dir=STORE_DIR, task="emotion", models=MODELS) -> dict:
+    """
+    Pairwise confusion matrices and Cohen's kappa, Fleiss' kappa over the
+    paragraphs every model labelled, and per-chapter agreement, for one task
+    across the whole label store.
+    """
+    table = load_labels(store_dir, columns=["book", "chapter", "paragraph_id", "label", "model"], task=task)
+    present = set(table.column("model").unique().to_pylist())
+    models = [model for model in (models or sorted(present)) if model in present]
+    joined = label_matrix(table, models)
+    matrix, labels = joined["matrix"], joined["labels"]
+    n_labels = len(labels)
+
+    pairwise = []
+    for a, b in combinations(range(len(models)), 2):
+        confusion = confusion_matrix(matrix, a, b, n_labels)
+        n = int(confusion.sum())
+        pairwise.append({
+            "models": [models[a], models[b]],
+            "paragraphs": n,
+            "agreement": float(np.trace(confusion) / n) if n else float('nan'),
+            "cohens_kappa": cohens_kappa(confusion),
+            "confusion": confusion.tolist(),
+        })
+
+    counts = category_counts(matrix, n_labels)
+    complete = (matrix >= 0).all(axis=1)
+    by_chapter = chapter_agreement(counts, joined["chapter_codes"], len(joined["chapters"]))
+    chapters = [
+        {"book": book, "chapter": int(chapter), "paragraphs": int(n),
+         "pairwise_agreement": float(pairwise_share), "unanimous": float(unanimous)}
+        for (book, chapter), n, pairwise_share, unanimous
+        in zip(joined["chapters"], by_chapter["paragraphs"], by_chapter["pairwise"], by_chapter["unanimous"])
+        if n
+    ]
+
+    return {
+        "task": task,
+        "models": models,
+        "labels": labels,
+        "paragraphs": int(len(matrix)),
+        "fully_labelled": int(complete.sum()),
+        "fleiss_kappa": fleiss_kappa(counts[complete]),
+        "pairwise": pairwise,
+        "chapters": chapters,
+    }
+
+if __name__ == "__main__":
+    # e.g. python scripts/model_agreement.py emotion gpt gemini hume
+    task = sys.argv[1] if len(sys.argv) > 1 else "emotion"
+    models = sys.argv[2:] or MODELS
+
+    report = agreement_report(task=task, models=models)
+    output_path = os.path.join(STORE_DIR, f"agreement_{task}.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{report['paragraphs']} paragraphs, {report['fully_labelled']} labelled by all of {', '.join(report['models'])}")
+    print(f"Fleiss' kappa: {report['fleiss_kappa']:.3f}")
+    for pair in report["pairwise"]:
+        a, b = pair["models"]
+        print(f"  {a:>8} vs {b:<8} kappa {pair['cohens_kappa']:6.3f}  agreement {pair['agreement']:6.1%}  "
+              f"({pair['paragraphs']} paragraphs)")
+    print("Lowest-agreement chapters:")
+    for chapter in sorted(report["chapters"], key=lambda c: c["pairwise_agreement"])[:WORST_CHAPTERS]:
+        print(f"  {chapter['book']} chapter {chapter['chapter']}: {chapter['pairwise_agreement']:.1%} of model pairs agree, "
+              f"{chapter['unanimous']:.1%} unanimous ({chapter['paragraphs']} paragraphs)")
+    print(f"Full report written to {output_path}")
@@ -0,0 +1,187 @@
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+# Daemon settings
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = 8765
+IDLE_TIMEOUT = 15 * 60  # Seconds without a request before the daemon exits and frees the model
+HEALTH_TIMEOUT = 0.5  # How long clients wait for /health before loading the model themselves
+REQUEST_TIMEOUT = 300
+CHUNK_SIZE = 256  # Paragraphs per /classify request from DaemonClient.stream()
+
+class ModelDaemon:
+    """
+    Keeps one InferenceWorker loaded and serves it over HTTP on localhost:
+
+      POST /classify  {"paragraphs": [...], "top_k": 1}  ->  {"scores": [...]}
+      GET  /health    ->  status, model, backend, load time and request/latency metrics
+
+    Requests run one at a time on the worker, which batches each of them.
+    The daemon exits once it has been idle for idle_timeout seconds.
+    """
+
+    def __init__(self, host=DAEMON_HOST, port=DAEMON_PORT, idle_timeout=IDLE_TIMEOUT, **worker_options):
+        from oss_classify_emotions import InferenceWorker
+
+        start = time.monotonic()
+        self.worker = InferenceWorker(**worker_options)
+        self.load_seconds = time.monotonic() - start
+        self.idle_timeout = idle_timeout
+        self.inference_lock = Lock()  # One predict() at a time on the worker
+        self.lock = Lock()  # Guards the metrics only, so /health answers while a request runs
+        self.active = 0
+        self.started = time.time()
+        self.last_request = time.monotonic()
+        self.metrics = {"requests": 0, "paragraphs": 0, "errors": 0, "busy_seconds": 0.0}
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+
+    def handler(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/health":
+                    return self.reply(404, {"error": "not found"})
+                self.reply(200, daemon.health())
+
+            def do_POST(self):
+                if self.path != "/classify":
+                    return self.reply(404, {"error": "not found"})
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    scores = daemon.classify(request["paragraphs"], request.get("top_k", 1))
+                except Exception as e:
+                    with daemon.lock:
+                        daemon.metrics["errors"] += 1
+                    return self.reply(500, {"error": f"{type(e).__name__}: {e}"})
+                self.reply(200, {"scores": scores})
+
+            def reply(self, status: int, body: dict):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def classify(self, paragraphs: list, top_k) -> list:
+        with self.lock:
+            self.active += 1
+        try:
+            with self.inference_lock:
+                start = time.monotonic()
+                scores = self.worker.predict(paragraphs, top_k=top_k)
+                busy = time.monotonic() - start
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.last_request = time.monotonic()
+        with self.lock:
+            self.metrics["requests"] += 1
+            self.metrics["paragraphs"] += len(paragraphs)
+            self.metrics["busy_seconds"] += busy
+        return scores
+
+    def health(self) -> dict:
+        with self.lock:
+            metrics = dict(self.metrics)
+            active = self.active
+            idle = 0.0 if active else time.monotonic() - self.last_request
+        busy = metrics.pop("busy_seconds")
+        return {
+            "status": "ok",
+            "active_requests": active,
+            "model": self.worker.model_name,
+            "backend": self.worker.backend,
+            "device": str(self.worker.device),
+            "model_load_seconds": round(self.load_seconds, 2),
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "idle_seconds": round(idle, 1),
+            **metrics,
+            "para_per_sec": round(metrics["paragraphs"] / busy, 1) if busy else None,
+        }
+
+    def watch_idle(self):
+        while True:
+            time.sleep(min(30, self.idle_timeout))
+            with self.lock:
+                idle = 0.0 if self.active else time.monotonic() - self.last_request
+            if idle >= self.idle_timeout:
+                print(f"Idle for {idle:.0f}s, shutting down")
+                self.server.shutdown()
+                return
+
+    def serve(self):
+        host, port = self.server.server_address[:2]
+        print(f"Model loaded in {self.load_seconds:.1f}s, serving on http://{host}:{port}")
+        Thread(target=self.watch_idle, daemon=True).start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+
+class DaemonClient:
+    """
+    Same predict()/stream() interface as InferenceWorker, backed by a running ModelDaemon.
+    """
+
+    def __init__(self, host=DAEMON_HOST, port=DAEMON_PORT, chunk_size=CHUNK_SIZE):
+        self.url = f"http://{host}:{port}"
+        self.chunk_size = chunk_size
+        self.backend = "daemon"
+
+    def health(self):
+        """
+        The daemon's /health report, or None when no daemon is answering.
+        """
+        try:
+            with urllib.request.urlopen(f"{self.url}/health", timeout=HEALTH_TIMEOUT) as response:
+                return json.loads(response.read())
+        except (urllib.error.URLError, OSError, ValueError):
+            return None
+
+    def request(self, paragraphs: list, top_k) -> list:
+        data = json.dumps({"paragraphs": paragraphs, "top_k": top_k}).encode('utf-8')
+        request = urllib.request.Request(f"{self.url}/classify", data=data,
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+            return json.loads(response.read())["scores"]
+
+    def predict(self, paragraphs: list, top_k=1) -> list:
+        return [scores for _, scores in self.stream(paragraphs, top_k=top_k)]
+
+    def stream(self, paragraphs: list, top_k=1):
+        for start in range(0, len(paragraphs), self.chunk_size):
+            for i, scores in enumerate(self.request(paragraphs[start:start + self.chunk_size], top_k)):
+                yield start + i, scores
+
+def find_daemon(model_name: str, backend: str):
+    """
+    A DaemonClient if a daemon is running the given model on the given
+    backend, otherwise None.
+    """
+    client = DaemonClient()
+    health = client.health()
+    if health is None:
+        return None
+    if (health.get("model"), health.get("backend")) != (model_name, backend):
+        print(f"Model daemon at {client.url} runs {health.get('model')} ({health.get('backend')}), "
+              f"not {model_name} ({backend}); loading the model instead")
+        return None
+    return client
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "health":
+        print(json.dumps(DaemonClient().health(), indent=2))
+    else:
+        ModelDaemon().serve()
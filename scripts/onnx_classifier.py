@@ -0,0 +1,141 @@
+import os
+import time
+import numpy as np
+from book_text import read_book, split_into_chapters, split_into_paragraphs
+
+# ONNX Runtime settings
+MODEL_NAME = "michellejieli/emotion_text_classifier"
+ONNX_DIR = 'models/emotion_text_classifier_onnx'
+INTRA_OP_THREADS = os.cpu_count() or 1  # Threads per matmul; sweep with compare_backends() on a new machine
+OPSET_VERSION = 14
+
+# Comparison settings
+COMPARE_SAMPLE_PATH = 'data/sample_texts/jk_rowling_sample.txt'
+COMPARE_PARAGRAPHS = 200
+
+def export_quantized(model_name=MODEL_NAME, output_dir=ONNX_DIR) -> str:
+    """
+    Exports the PyTorch model to ONNX and quantizes its weights to int8.
+    Returns the path of the quantized model.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+
+    example = tokenizer(["An example paragraph to trace the model with."], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    quantized_path = os.path.join(output_dir, "model.int8.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (example["input_ids"], example["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"},
+            },
+            opset_version=OPSET_VERSION,
+        )
+    quantize_dynamic(fp32_path, quantized_path, weight_type=QuantType.QInt8)
+
+    # The tokenizer and id2label travel with the model so serving needs no hub access
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+    return quantized_path
+
+class OnnxClassifier:
+    """
+    Int8 ONNX Runtime stand-in for the transformers text-classification pipeline:
+    called with a list of texts it returns, per text, the top_k {label, score}
+    dicts with the same labels the PyTorch model produces.
+    """
+
+    def __init__(self, model_dir=ONNX_DIR, intra_op_threads=INTRA_OP_THREADS):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        model_path = os.path.join(model_dir, "model.int8.onnx")
+        if not os.path.exists(model_path):
+            print(f"No quantized model in {model_dir}, exporting {MODEL_NAME}")
+            model_path = export_quantized(output_dir=model_dir)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.labels = AutoConfig.from_pretrained(model_dir).id2label
+
+    def __call__(self, texts, batch_size=None, truncation=True, top_k=1):
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        encoded = self.tokenizer(texts, padding=True, truncation=truncation, return_tensors="np")
+        feed = {name: values.astype(np.int64) for name, values in encoded.items() if name in self.input_names}
+        logits = self.session.run(["logits"], feed)[0]
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+        outputs = []
+        for row in probabilities:
+            ranked = np.argsort(-row)[:top_k]
+            outputs.append([{"label": self.labels[int(i)], "score": float(row[i])} for i in ranked])
+        return outputs[0] if single else outputs
+
+def sample_paragraphs(path=COMPARE_SAMPLE_PATH, limit=COMPARE_PARAGRAPHS) -> list:
+    paragraphs = [p for chapter in split_into_chapters(read_book(path)) for p in split_into_paragraphs(chapter)]
+    return paragraphs[:limit]
+
+def compare_backends(paragraphs: list, thread_counts=None) -> list:
+    """
+    Throughput of the PyTorch pipeline against the int8 ONNX model at several
+    intra-op thread counts, with how often the ONNX label matches PyTorch's.
+    """
+    from oss_classify_emotions import InferenceWorker, map_emotion
+
+    def timed(worker):
+        start = time.perf_counter()
+        scores = worker.predict(paragraphs)
+        return scores, len(paragraphs) / (time.perf_counter() - start)
+
+    reference, reference_rate = timed(InferenceWorker(backend="pytorch"))
+    reference_labels = [s[0]['label'] if s else None for s in reference]
+    rows = [{"backend": "pytorch", "threads": None, "para_per_sec": reference_rate,
+             "label_agreement": 1.0, "emotion_agreement": 1.0}]
+
+    cores = os.cpu_count() or 1
+    for threads in thread_counts or sorted({1, 2, max(1, cores // 2), cores}):
+        scores, rate = timed(InferenceWorker(backend="onnx", intra_op_threads=threads))
+        labels = [s[0]['label'] if s else None for s in scores]
+        rows.append({
+            "backend": "onnx-int8",
+            "threads": threads,
+            "para_per_sec": rate,
+            "label_agreement": np.mean([a == b for a, b in zip(labels, reference_labels)]),
+            "emotion_agreement": np.mean([a is not None and b is not None and map_emotion(a) == map_emotion(b)
+                                          for a, b in zip(labels, reference_labels)]),
+        })
+
+    print(f"\n{len(paragraphs)} paragraphs")
+    print("Backend     threads  para/s   label agreement  emotion agreement")
+    for row in rows:
+        threads = row['threads'] if row['threads'] is not None else '-'
+        print(f"{row['backend']:<11} {threads:>7}  {row['para_per_sec']:>6.1f}   "
+              f"{row['label_agreement']:>15.1%}  {row['emotion_agreement']:>17.1%}")
+    return rows
+
+if __name__ == "__main__":
+    export_quantized()
+    compare_backends(sample_paragraphs())
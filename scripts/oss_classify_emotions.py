@@ -1,12 +1,11 @@
 import enum
 from typing_extensions import TypedDict
-import re
-import json
 from tqdm import tqdm
 import os
-import concurrent.futures
-from transformers import pipeline
-import multiprocessing
+from threading import Lock
+from journal import Journal, journal_path
+from analysis_scope import AnalysisScope
+from book_text import read_book, split_into_chapters, split_into_paragraphs
 
 # Define the emotions as an Enum
 class Emotion(enum.Enum):
@@ -22,8 +21,102 @@ class EmotionClassification(TypedDict):
     paragraph: str
     emotion: str
 
-# Initialize the classifier
-classifier = pipeline("sentiment-analysis", model="michellejieli/emotion_text_classifier", device="mps")
+# Inference settings
+MODEL_NAME = "michellejieli/emotion_text_classifier"
+BATCH_SIZE = 32
+SORT_WINDOW = BATCH_SIZE * 8  # Paragraphs sorted by length together; results stream out per window
+LOCAL_BACKEND = "pytorch"  # "onnx" runs the int8-quantized export from onnx_classifier.py on the CPU
+USE_DAEMON = True  # Send paragraphs to model_daemon.py when it is running instead of loading the model
+
+def pick_device():
+    """Use a GPU when one is available, otherwise the CPU."""
+    import torch
+    if torch.cuda.is_available():
+        return 0
+    if getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        return "mps"
+    return -1
+
+class InferenceWorker:
+    """
+    Long-lived classifier: loads the model once and classifies paragraphs in
+    batches, sorting each window of paragraphs by length so batches need
+    little padding. Results come back in input order.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, device=None, batch_size=BATCH_SIZE, sort_window=SORT_WINDOW,
+                 backend=LOCAL_BACKEND, **backend_options):
+        self.batch_size = batch_size
+        self.sort_window = sort_window
+        self.model_name = model_name
+        self.backend = backend
+        if backend == "onnx":
+            from onnx_classifier import OnnxClassifier
+            self.device = -1
+            self.classifier = OnnxClassifier(**backend_options)
+        else:
+            from transformers import pipeline
+            self.device = pick_device() if device is None else device
+            self.classifier = pipeline("sentiment-analysis", model=model_name, device=self.device)
+
+    def predict(self, paragraphs: list, top_k=1) -> list:
+        """
+        Label scores for each paragraph, in input order. top_k=None returns every label.
+        """
+        return [scores for _, scores in self.stream(paragraphs, top_k=top_k)]
+
+    def stream(self, paragraphs: list, top_k=1):
+        """
+        Yields (index, label scores) in input order as each window finishes.
+        """
+        for window_start in range(0, len(paragraphs), self.sort_window):
+            window = paragraphs[window_start:window_start + self.sort_window]
+            order = sorted(range(len(window)), key=lambda i: len(window[i]))
+            results = [None] * len(window)
+            for batch_start in range(0, len(order), self.batch_size):
+                batch = order[batch_start:batch_start + self.batch_size]
+                for i, scores in zip(batch, self.run_batch([window[i] for i in batch], top_k)):
+                    results[i] = scores
+            for i, scores in enumerate(results):
+                yield window_start + i, scores
+
+    def run_batch(self, texts: list, top_k) -> list:
+        """
+        Label scores for each text, or None for a text the classifier fails on
+        even by itself, so callers can leave it for a later run.
+        """
+        try:
+            outputs = self.classifier(texts, batch_size=len(texts), truncation=True, top_k=top_k)
+        except Exception as e:
+            print(f"Warning: Batch of {len(texts)} paragraphs failed, classifying one by one: {str(e)}")
+            outputs = []
+            for text in texts:
+                try:
+                    outputs.append(self.classifier(text, truncation=True, top_k=top_k))
+                except Exception as e:
+                    print(f"Warning: Emotion classification failed for paragraph: {str(e)}")
+                    outputs.append(None)
+        # A single label comes back as a bare dict for some pipeline versions
+        return [output if isinstance(output, list) or output is None else [output] for output in outputs]
+
+worker = None
+worker_lock = Lock()
+
+def get_worker() -> InferenceWorker:
+    """
+    The process-wide InferenceWorker, loaded on first use. A running model
+    daemon is used in its place so the model is not loaded again.
+    """
+    global worker
+    with worker_lock:
+        if worker is None and USE_DAEMON:
+            from model_daemon import find_daemon
+            worker = find_daemon(MODEL_NAME, LOCAL_BACKEND)
+            if worker is not None:
+                print(f"Using model daemon at {worker.url}")
+        if worker is None:
+            worker = InferenceWorker()
+    return worker
 
 def map_emotion(classifier_emotion: str) -> str:
     """Map classifier emotions to our standardized enum emotions."""
@@ -39,83 +132,62 @@ def map_emotion(classifier_emotion: str) -> str:
     return emotion_mapping.get(classifier_emotion.lower(), Emotion.NEUTRAL.value)
 
 def classify_emotion(paragraph):
-    try:
-        result = classifier(paragraph)[0]
-        return {
-            "paragraph": paragraph,
-            "emotion": map_emotion(result['label'])
-        }
-    except Exception as e:
-        print(f"Warning: Emotion classification failed for paragraph: {str(e)}")
-        return {
-            "paragraph": paragraph,
-            "emotion": Emotion.NEUTRAL.value
-        }
+    scores = get_worker().predict([paragraph])[0]
+    if scores is None:
+        raise ValueError("The local classifier failed on this paragraph")
+    return {
+        "paragraph": paragraph,
+        "emotion": map_emotion(scores[0]['label'])
+    }
 
 # ... reuse existing file/chapter processing functions ...
-def read_book(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return file.read()
-
-def split_into_chapters(text):
-    chapters = re.split(r'\bCHAPTER\b', text)
-    chapters = [chapter.strip() for chapter in chapters if chapter.strip()]
-    chapters = [chapter for chapter in chapters if len(chapter) >= 1000]
-    return chapters
-
-def split_into_paragraphs(chapter_text):
-    paragraphs = chapter_text.split('\n\n')
-    paragraphs = [para.strip() for para in paragraphs if para.strip()]
-    paragraphs = [para for para in paragraphs if len(para) >= 50]
-    return paragraphs
-
-def process_books(input_dir, output_dir):
+def process_books(input_dir, output_dir, scope: AnalysisScope = None):
     os.makedirs(output_dir, exist_ok=True)
+    scope = scope or AnalysisScope.load()
     
     book_files = [f for f in os.listdir(input_dir) if f.endswith('.txt')]
     
     for book_file in tqdm(book_files, desc="Processing Books"):
         book_path = os.path.join(input_dir, book_file)
-        book_emotions = []
+        journal = Journal(journal_path(output_dir, book_file, "_emotions_oss"))
+        chapter_sizes = []
         
         book_text = read_book(book_path)
         chapters = split_into_chapters(book_text)
         
         for idx, chapter in enumerate(tqdm(chapters, desc=f"Processing {book_file} Chapters", leave=False), start=1):
             paragraphs = split_into_paragraphs(chapter)
-            chapter_emotions = []
+            chapter_sizes.append((idx, len(paragraphs)))
             
-            # Use ProcessPoolExecutor instead of ThreadPoolExecutor to avoid semaphore leaks
-            with concurrent.futures.ProcessPoolExecutor(1) as executor:
-                future_to_para = {executor.submit(classify_emotion, para): para 
-                                for para in paragraphs}
-                
-                for future in tqdm(
-                    concurrent.futures.as_completed(future_to_para),
-                    total=len(paragraphs),
-                    desc=f"Chapter {idx} Paragraphs",
-                    unit="para",
-                    leave=False
-                ):
-                    classification = future.result()
-                    chapter_emotions.append(classification)
+            # Skip paragraphs outside the analysis scope or already classified by an earlier run
+            pending = journal.pending(idx, scope.select(idx, paragraphs))
+            if not pending:
+                continue
             
-            chapter_data = {
-                'chapter': idx,
-                'emotions': chapter_emotions
-            }
-            book_emotions.append(chapter_data)
+            # Classify in length-sorted batches; results stream back in paragraph order
+            indices = list(pending)
+            for position, scores in tqdm(
+                get_worker().stream(list(pending.values())),
+                total=len(pending),
+                desc=f"Chapter {idx} Paragraphs",
+                unit="para",
+                leave=False
+            ):
+                if scores is None:
+                    continue  # Not journaled, so the next run tries it again
+                index = indices[position]
+                journal.record(idx, index, {
+                    "paragraph": pending[index],
+                    "emotion": map_emotion(scores[0]['label'])
+                })
         
         book_output = os.path.join(output_dir, f"{os.path.splitext(book_file)[0]}_emotions_oss.json")
-        with open(book_output, 'w', encoding='utf-8') as f:
-            json.dump(book_emotions, f, indent=2)
+        journal.compact(book_output, chapter_sizes, 'emotions')
+        journal.close()
     
     return True
 
 if __name__ == "__main__":
-    # Ensure proper multiprocessing behavior on macOS
-    multiprocessing.set_start_method('spawn')
-    
     input_directory = 'data/sample_texts'
     output_directory = 'data/emotions'
     
@@ -0,0 +1,45 @@
+import os
+
+# Which backend the classifier scripts talk to: "live" for the real APIs,
+# "fake" for the in-process stand-ins in fake_backends.py
+BACKEND = os.getenv("CLASSIFIER_BACKEND", "live")
+
+def use_fake_backend() -> bool:
+    return BACKEND == "fake"
+
+def get_openai_client(api_version: str = "2024-08-01-preview"):
+    """
+    Azure OpenAI client, or a fake with the same chat.completions interface.
+    """
+    if use_fake_backend():
+        from fake_backends import FakeBackendConfig, FakeOpenAIClient
+        return FakeOpenAIClient(FakeBackendConfig.from_env())
+
+    from openai import AzureOpenAI
+    return AzureOpenAI(
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=api_version,
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+    )
+
+def get_gemini_model(model_name: str = "gemini-1.5-pro-latest"):
+    """
+    Gemini generative model, or a fake answering enum-schema requests.
+    """
+    if use_fake_backend():
+        from fake_backends import FakeBackendConfig, FakeGeminiModel
+        return FakeGeminiModel(FakeBackendConfig.from_env())
+
+    import google.generativeai as genai
+    return genai.GenerativeModel(model_name)
+
+def get_hume_client(api_key: str):
+    """
+    Async Hume client, or a fake implementing the batch job endpoints.
+    """
+    if use_fake_backend():
+        from fake_backends import FakeBackendConfig, FakeHumeClient
+        return FakeHumeClient(FakeBackendConfig.from_env())
+
+    from hume.client import AsyncHumeClient
+    return AsyncHumeClient(api_key=api_key)
@@ -0,0 +1,346 @@
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import Condition, Lock, Thread
+from tqdm import tqdm
+from concurrency import classify_failure
+
+# Retry settings
+MAX_ATTEMPTS = 5
+BASE_DELAY = 1  # Seconds; backoff doubles per attempt with full jitter
+MAX_DELAY = 60
+
+# Circuit breaker settings
+FAILURE_THRESHOLD = 10  # Consecutive provider failures before the circuit opens
+COOLDOWN = 30  # Seconds the circuit stays open before a probe request is let through
+PROBE_WAIT = 0.5  # How often callers re-check while a probe is in flight
+
+class InvalidResponseError(ValueError):
+    """Raised when a provider answers with something that is not a valid label."""
+
+class RetriesExhausted(Exception):
+    """Raised on a scheduled request's future once it has failed for good."""
+
+    def __init__(self, error: Exception, attempts: int):
+        super().__init__(f"{type(error).__name__}: {error} (after {attempts} attempts)")
+        self.error = error
+        self.attempts = attempts
+
+def is_provider_failure(error: Exception) -> bool:
+    """
+    Failures that say the provider is unhealthy: 429s, 5xx, timeouts and dropped connections.
+    """
+    return classify_failure(error) != "ignored" or "Connection" in type(error).__name__
+
+def is_retryable(error: Exception) -> bool:
+    return is_provider_failure(error) or isinstance(error, InvalidResponseError)
+
+def retry_after_seconds(error: Exception):
+    """
+    Seconds the provider asked us to wait, from Retry-After / retry-after-ms headers.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, error: Exception = None, base_delay=BASE_DELAY, max_delay=MAX_DELAY) -> float:
+    """
+    Full-jitter exponential backoff, never shorter than the provider's Retry-After.
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    retry_after = retry_after_seconds(error) if error is not None else None
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+class CircuitBreaker:
+    """
+    Opens after FAILURE_THRESHOLD consecutive provider failures so the whole run
+    pauses instead of burning retries. After the cooldown a single probe request
+    is let through; its success closes the circuit, its failure re-opens it.
+    """
+
+    def __init__(self, name: str = "", failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.lock = Lock()
+        self.failures = 0
+        self.open_until = None
+        self.probing = False
+
+    def is_open(self) -> bool:
+        with self.lock:
+            return self.open_until is not None and time.monotonic() < self.open_until
+
+    def time_until_closed(self) -> float:
+        """
+        0 when a request may go ahead, otherwise how long to wait before asking again.
+        """
+        with self.lock:
+            if self.open_until is None:
+                return 0.0
+            remaining = self.open_until - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self.probing:
+                return PROBE_WAIT
+            self.probing = True
+            return 0.0
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            if self.open_until is not None:
+                print(f"Circuit for {self.name} closed, resuming")
+            self.open_until = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or (self.open_until is None and self.failures >= self.failure_threshold):
+                self.open_until = time.monotonic() + self.cooldown
+                self.probing = False
+                print(f"Circuit for {self.name} open after {self.failures} consecutive failures, "
+                      f"pausing for {self.cooldown}s")
+
+class RetryScheduler:
+    """
+    Runs requests on an executor and re-queues failures on a delay queue instead
+    of sleeping inside the worker thread. While the circuit is open, requests
+    wait on the same queue until it may close, so no worker is parked on the
+    breaker. submit() returns a Future that resolves
+    with the result, or fails with RetriesExhausted once MAX_ATTEMPTS are used up
+    or the error is not worth retrying.
+    """
+
+    def __init__(self, executor, breaker: CircuitBreaker = None, max_attempts=MAX_ATTEMPTS,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.executor = executor
+        self.breaker = breaker or CircuitBreaker()
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delayed = []  # heap of (due time, sequence, task)
+        self.sequence = itertools.count()
+        self.condition = Condition()
+        self.closed = False
+        self.dispatcher = Thread(target=self.dispatch, daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        task = {"fn": fn, "args": args, "kwargs": kwargs, "attempt": 1, "future": Future()}
+        self.launch(task)
+        return task["future"]
+
+    def launch(self, task: dict):
+        # Hold requests on the delay queue while the provider's circuit is open
+        delay = self.breaker.time_until_closed()
+        if delay > 0:
+            self.defer(task, delay)
+            return
+        inner = self.executor.submit(self.run, task)
+        inner.add_done_callback(lambda done: self.on_done(task, done))
+
+    def run(self, task: dict):
+        return task["fn"](*task["args"], **task["kwargs"])
+
+    def defer(self, task: dict, delay: float):
+        with self.condition:
+            heapq.heappush(self.delayed, (time.monotonic() + delay, next(self.sequence), task))
+            self.condition.notify()
+
+    def on_done(self, task: dict, done: Future):
+        error = done.exception()
+        if error is None:
+            self.breaker.record_success()
+            task["future"].set_result(done.result())
+            return
+
+        if is_provider_failure(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()  # The provider answered, just not usefully
+
+        if not is_retryable(error) or task["attempt"] >= self.max_attempts or self.closed:
+            task["future"].set_exception(RetriesExhausted(error, task["attempt"]))
+            return
+
+        delay = backoff_delay(task["attempt"], error, self.base_delay, self.max_delay)
+        task["attempt"] += 1
+        self.defer(task, delay)
+
+    def dispatch(self):
+        while True:
+            with self.condition:
+                while not self.delayed and not self.closed:
+                    self.condition.wait()
+                if self.closed and not self.delayed:
+                    return
+                due, _, task = self.delayed[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                    continue
+                heapq.heappop(self.delayed)
+            self.launch(task)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.dispatcher.join()
+
+class DeadLetterFile:
+    """
+    JSONL file of paragraphs that failed for good. New failures are appended to
+    the entries earlier runs left, and an entry is only dropped once its
+    paragraph is in the journal, so a failure stays on record even if a later
+    run's scope no longer covers it. With only=True, select() narrows a
+    chapter's pending paragraphs to the dead-lettered ones, so a run retries
+    just those (DEAD_LETTERS_ONLY=1).
+    """
+
+    def __init__(self, path: str, only=None):
+        self.path = path
+        self.only = os.getenv("DEAD_LETTERS_ONLY") == "1" if only is None else only
+        self.count = 0
+        self.entries = {}  # (chapter, index) -> latest entry
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[(entry["chapter"], entry["index"])] = entry
+            if self.entries:
+                print(f"{len(self.entries)} paragraphs were dead-lettered by earlier runs, see {path}")
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def select(self, chapter: int, pending: dict) -> dict:
+        """
+        The pending {index: paragraph} items to classify: all of them, or with
+        only=True just those dead-lettered with the same text.
+        """
+        if not self.only:
+            return pending
+        return {
+            index: paragraph for index, paragraph in pending.items()
+            if self.entries.get((chapter, index), {}).get("paragraph") == paragraph
+        }
+
+    def add(self, chapter: int, index: int, paragraph: str, error: Exception):
+        attempts = getattr(error, "attempts", 1)
+        cause = getattr(error, "error", error)
+        entry = {
+            "chapter": chapter,
+            "index": index,
+            "paragraph": paragraph,
+            "error": f"{type(cause).__name__}: {cause}",
+            "attempts": attempts,
+            "failed_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+        self.entries[(chapter, index)] = entry
+        self.count += 1
+
+    def close(self, journal=None):
+        """
+        Rewrites the file without the entries the journal now holds, or removes it once none are left.
+        """
+        self.file.close()
+        if journal is not None:
+            self.entries = {
+                key: entry for key, entry in self.entries.items()
+                if not journal.has(entry["chapter"], entry["index"], entry["paragraph"])
+            }
+        if not self.entries:
+            os.remove(self.path)
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(entry) + '\n' for entry in self.entries.values())
+        os.replace(tmp_path, self.path)
+        if self.count:
+            print(f"{self.count} paragraphs failed, see {self.path}")
+        else:
+            print(f"{len(self.entries)} paragraphs are still dead-lettered, see {self.path}")
+
+def dead_letter_path(output_dir: str, book_file: str, suffix: str) -> str:
+    return os.path.join(output_dir, f"{os.path.splitext(book_file)[0]}{suffix}.deadletter.jsonl")
+
+def run_chapter_jobs(journal, dead_letters: DeadLetterFile, chapter: int, pending: dict, fn, max_workers: int,
+                     breaker: CircuitBreaker = None, dedup=None, desc=None, postfix=None) -> int:
+    """
+    Classifies a chapter's pending {index: paragraph} items with fn(paragraph)
+    on a RetryScheduler, journaling each result as it arrives and dead-lettering
+    paragraphs whose retries run out. With a Deduplicator, one paragraph per
+    near-duplicate cluster is sent and its result fanned out to the cluster;
+    clusters resolved earlier are journaled without a request. postfix() is
+    shown on the progress bar. Returns the number of requests that succeeded.
+    """
+    pending = dead_letters.select(chapter, pending)
+    if dedup is not None:
+        groups = dedup.group(pending)
+        for cluster in [c for c in groups if dedup.known(c)]:
+            for index in groups.pop(cluster):
+                journal.record(chapter, index, dedup.fan_out(cluster, pending[index]))
+    else:
+        groups = {index: [index] for index in pending}
+
+    succeeded = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        scheduler = RetryScheduler(executor, breaker)
+        future_to_group = {scheduler.submit(fn, pending[indices[0]]): group for group, indices in groups.items()}
+
+        progress = tqdm(
+            as_completed(future_to_group),
+            total=len(groups),
+            desc=desc or f"Chapter {chapter} Paragraphs",
+            unit="para",
+            leave=False
+        )
+        for future in progress:
+            group = future_to_group[future]
+            try:
+                result = future.result()
+            except RetriesExhausted as e:
+                for index in groups[group]:
+                    dead_letters.add(chapter, index, pending[index], e)
+            else:
+                if dedup is not None:
+                    dedup.resolve(group, result)
+                for index in groups[group]:
+                    journal.record(chapter, index, dedup.fan_out(group, pending[index]) if dedup is not None else result)
+                succeeded += 1
+            if postfix is not None:
+                progress.set_postfix(postfix())
+        scheduler.close()
+    return succeeded
@@ -0,0 +1,261 @@
+import importlib
+import os
+import concurrent.futures
+import time
+from collections import deque
+from threading import Lock
+from tqdm import tqdm
+from journal import Journal, journal_path
+from analysis_scope import AnalysisScope
+from retry import CircuitBreaker, DeadLetterFile, dead_letter_path, is_provider_failure, run_chapter_jobs
+from book_text import read_book, split_into_chapters, split_into_paragraphs
+
+# Emotion backends the router may use: name -> (module, classify function)
+BACKENDS = {
+    "gpt": ("gpt_classify_emotions", "rate_limited_classify"),
+    "gemini": ("gemini_classify_emotions", "rate_limited_classify"),
+    "oss": ("oss_classify_emotions", "classify_emotion"),
+}
+ROUTED_BACKENDS = ["gpt", "gemini"]  # Add "oss" to let the local model take hedges too
+
+# Hedging settings
+HEDGE_PERCENTILE = 95  # Fire a hedge once the primary is slower than this percentile of its latency
+HEDGE_DEFAULT_DELAY = 5.0  # Hedge delay until MIN_SAMPLES latencies have been observed
+HEDGE_MIN_DELAY = 0.5
+HEDGE_TO_ALTERNATE = True  # Hedge to the next best backend rather than the same one
+MIN_SAMPLES = 20
+LATENCY_WINDOW = 200  # Recent latencies kept per backend
+MIN_BUDGET_FRACTION = 0.05  # Backends with less of their per-minute quota left are skipped
+ROUTER_WORKERS = 32  # Paragraphs routed at once
+
+class Backend:
+    """
+    One emotion classifier plus what the router has observed about it.
+    """
+
+    def __init__(self, name: str):
+        module_name, function_name = BACKENDS[name]
+        self.name = name
+        self.module = importlib.import_module(module_name)
+        self.classify = getattr(self.module, function_name)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.outcomes = deque(maxlen=LATENCY_WINDOW)  # True for each recent success, False for each failure
+        self.lock = Lock()
+        self.stats = {"requests": 0, "failures": 0, "wins": 0, "hedges_fired": 0, "hedge_wins": 0, "failovers": 0}
+
+    def percentile(self, percentile: float):
+        with self.lock:
+            if len(self.latencies) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+    def expected_latency(self) -> float:
+        """
+        Median success latency divided by the recent success rate, roughly the
+        wait for a valid answer. Untried backends score 0 so they get explored;
+        one whose recent calls all failed scores infinity.
+        """
+        with self.lock:
+            outcomes = list(self.outcomes)
+            ordered = sorted(self.latencies)
+        if not outcomes:
+            return 0.0
+        successes = outcomes.count(True)
+        if successes == 0:
+            return float('inf')
+        median = ordered[len(ordered) // 2] if ordered else 0.0
+        return median * len(outcomes) / successes
+
+    def budget_fraction(self) -> float:
+        """
+        Share of the backend's per-minute request quota still unused.
+        """
+        limit = getattr(self.module, "MAX_REQUESTS_PER_MIN", None)
+        if not limit:
+            return 1.0
+        now = time.time()
+        with self.module.request_lock:
+            recent = sum(1 for t in self.module.request_times if now - t <= 60)
+        return max(0.0, 1 - recent / limit)
+
+    def available(self) -> bool:
+        breaker = getattr(self.module, "breaker", None)
+        if breaker is not None and breaker.is_open():
+            return False
+        return self.budget_fraction() >= MIN_BUDGET_FRACTION
+
+    def max_in_flight(self) -> int:
+        limiter = getattr(self.module, "limiter", None)
+        return limiter.max_limit if limiter is not None else 1
+
+    def has_spare_slot(self) -> bool:
+        """
+        Whether a request would get a limiter slot straight away, rather than queue for one.
+        """
+        limiter = getattr(self.module, "limiter", None)
+        if limiter is None:
+            return True
+        with limiter.lock:
+            return limiter.in_flight < limiter.current_limit
+
+    def call(self, paragraph: str) -> dict:
+        with self.lock:
+            self.stats["requests"] += 1
+        breaker = getattr(self.module, "breaker", None)
+        start = time.monotonic()
+        try:
+            result = self.classify(paragraph)
+        except Exception as e:
+            with self.lock:
+                self.stats["failures"] += 1
+                self.outcomes.append(False)
+            if breaker is not None and is_provider_failure(e):
+                breaker.record_failure()
+            raise
+        with self.lock:
+            self.latencies.append(time.monotonic() - start)
+            self.outcomes.append(True)
+        if breaker is not None:
+            breaker.record_success()
+        return {**result, "provider": self.name}
+
+class HedgedRouter:
+    """
+    Sends each paragraph to the backend with the lowest expected latency (median
+    over success rate) that still has rate budget. If it has not answered by its
+    HEDGE_PERCENTILE latency, a duplicate goes to the next best backend and the
+    first valid answer wins. A request that fails is passed to the next ranked
+    backend straight away rather than waiting for the hedge. Hedges are only
+    fired while their backend's limiter has a free slot, so they never queue
+    behind primaries, and requests still queued when a paragraph is answered
+    are cancelled.
+    """
+
+    def __init__(self, backend_names=ROUTED_BACKENDS, callers=ROUTER_WORKERS):
+        self.backends = [Backend(name) for name in backend_names]
+        # Every caller's queued request, plus whatever the backends' limiters let run
+        # at once, including hedges and the losers still finishing
+        workers = callers + sum(backend.max_in_flight() for backend in self.backends)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def ranked(self) -> list:
+        available = [b for b in self.backends if b.available()] or self.backends
+        return sorted(available, key=lambda b: b.expected_latency())
+
+    def hedge_delay(self, backend: Backend) -> float:
+        observed = backend.percentile(HEDGE_PERCENTILE)
+        if observed is None:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, observed)
+
+    def classify(self, paragraph: str) -> dict:
+        ranked = self.ranked()
+        primary = ranked[0]
+        alternates = deque(ranked[1:])
+
+        futures = {self.executor.submit(primary.call, paragraph): primary}
+        hedge_future = None
+        hedge_at = time.monotonic() + self.hedge_delay(primary)
+        hedged = False
+
+        # Take the first valid answer; only fail once every request has failed
+        errors = []
+        while futures:
+            timeout = None if hedged else max(0.0, hedge_at - time.monotonic())
+            done, _ = concurrent.futures.wait(futures, timeout=timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                hedge = alternates[0] if HEDGE_TO_ALTERNATE and alternates else primary
+                if not hedge.has_spare_slot():
+                    # A hedge that has to queue for a slot would only add load; look again shortly
+                    hedge_at = time.monotonic() + HEDGE_MIN_DELAY
+                    continue
+                if hedge is not primary:
+                    alternates.popleft()
+                hedge_future = self.executor.submit(hedge.call, paragraph)
+                futures[hedge_future] = hedge
+                hedged = True
+                with hedge.lock:
+                    hedge.stats["hedges_fired"] += 1
+                continue
+
+            for future in done:
+                backend = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    # Fail over now; the fresh request replaces the hedge
+                    if alternates:
+                        fallback = alternates.popleft()
+                        futures[self.executor.submit(fallback.call, paragraph)] = fallback
+                        hedged = True
+                        with fallback.lock:
+                            fallback.stats["failovers"] += 1
+                    continue
+                with backend.lock:
+                    backend.stats["wins"] += 1
+                    if future is hedge_future:
+                        backend.stats["hedge_wins"] += 1
+                # Losers that have not started yet never run; running ones finish on their own
+                for loser in futures:
+                    loser.cancel()
+                return result
+        raise errors[-1]
+
+    def report(self):
+        print("\nBackend   requests  failures  p50     p95     wins  hedges  hedge wins  failovers")
+        for backend in self.backends:
+            stats = backend.stats
+            p50 = backend.percentile(50)
+            p95 = backend.percentile(95)
+            print(f"{backend.name:<9} {stats['requests']:>8}  {stats['failures']:>8}  "
+                  f"{(f'{p50:.2f}s' if p50 is not None else '-'):>6}  {(f'{p95:.2f}s' if p95 is not None else '-'):>6}  "
+                  f"{stats['wins']:>4}  {stats['hedges_fired']:>6}  {stats['hedge_wins']:>10}  {stats['failovers']:>9}")
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+def process_books(input_dir, output_dir, router: HedgedRouter = None, scope: AnalysisScope = None):
+    os.makedirs(output_dir, exist_ok=True)
+    scope = scope or AnalysisScope.load()
+    router = router or HedgedRouter()
+    breaker = CircuitBreaker("router")
+
+    book_files = [f for f in os.listdir(input_dir) if f.endswith('.txt')]
+
+    for book_file in tqdm(book_files, desc="Processing Books"):
+        book_path = os.path.join(input_dir, book_file)
+        journal = Journal(journal_path(output_dir, book_file, "_emotions_routed"))
+        dead_letters = DeadLetterFile(dead_letter_path(output_dir, book_file, "_emotions_routed"))
+        chapter_sizes = []
+
+        book_text = read_book(book_path)
+        chapters = split_into_chapters(book_text)
+
+        for idx, chapter in enumerate(tqdm(chapters, desc=f"Processing {book_file} Chapters", leave=False), start=1):
+            paragraphs = split_into_paragraphs(chapter)
+            chapter_sizes.append((idx, len(paragraphs)))
+
+            # Skip paragraphs outside the analysis scope or already classified by an earlier run
+            pending = journal.pending(idx, scope.select(idx, paragraphs))
+            run_chapter_jobs(journal, dead_letters, idx, pending, router.classify, ROUTER_WORKERS, breaker)
+
+        book_output = os.path.join(output_dir, f"{os.path.splitext(book_file)[0]}_emotions_routed.json")
+        journal.compact(book_output, chapter_sizes, 'emotions')
+        journal.close()
+        dead_letters.close(journal)
+
+    router.report()
+    router.close()
+    return True
+
+if __name__ == "__main__":
+    input_directory = 'data/sample_texts'
+    output_directory = 'data/emotions'
+
+    success = process_books(input_directory, output_directory)
+
+    if success:
+        print("Successfully processed all books and classified emotions")
@@ -1,23 +1,21 @@
-import json
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+from json_stream import iter_entries
+from aggregation_cache import cached_aggregation
 import glob
 
+@cached_aggregation("analyze_aspects", version=1)
 def analyze_aspects(filename):
-    with open(filename) as f:
-        data = json.load(f)
-        
     aspect_counts = {}
     total_paragraphs = 0
     
-    # Count aspects
-    for chapter in data:  # Data is array of chapters
-        for classification in chapter.get('classifications', []):
-            aspect = classification.get('aspect')
-            if aspect and aspect != "Unknown":
-                aspect_counts[aspect] = aspect_counts.get(aspect, 0) + 1
-                total_paragraphs += 1
+    # Count aspects, streaming the entries without loading the file or the paragraph text
+    for _, _, classification in iter_entries(filename, 'classifications'):
+        aspect = classification.get('aspect')
+        if aspect and aspect != "Unknown":
+            aspect_counts[aspect] = aspect_counts.get(aspect, 0) + 1
+            total_paragraphs += 1
     
     # Convert to percentages
     aspect_percentages = {k: (v/total_paragraphs)*100 for k,v in aspect_counts.items()}
@@ -0,0 +1,70 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+from concurrency import AdaptiveLimiter, classify_failure  # noqa: E402
+from fake_backends import FakeAPIError  # noqa: E402
+
+def saturate(limiter: AdaptiveLimiter):
+    """
+    Marks every slot but one as taken, as if the limit were what holds requests back.
+    """
+    limiter.in_flight = limiter.current_limit - 1
+
+def test_limit_grows_by_one_after_a_saturated_window_of_successes():
+    limiter = AdaptiveLimiter("test", initial_limit=4, max_limit=5)
+    saturate(limiter)
+    for _ in range(3):
+        limiter.record(0.0, 1.0, "success")
+    assert limiter.current_limit == 4
+    limiter.record(0.0, 1.0, "success")
+    assert limiter.current_limit == 5
+
+    saturate(limiter)
+    for _ in range(10):
+        limiter.record(0.0, 1.0, "success")
+    assert limiter.current_limit == 5  # Capped at max_limit
+
+def test_limit_does_not_grow_while_slots_sit_idle():
+    limiter = AdaptiveLimiter("test", initial_limit=4)
+    for _ in range(20):
+        limiter.record(0.0, 1.0, "success")
+    assert limiter.current_limit == 4
+
+def test_one_burst_of_failures_halves_the_limit_once():
+    limiter = AdaptiveLimiter("test", initial_limit=16)
+    limiter.record(1.0, 1.0, "throttled")
+    assert limiter.current_limit == 8
+    # Requests that started before the cut do not cut again
+    limiter.record(1.0, 1.0, "overloaded")
+    assert limiter.current_limit == 8
+    limiter.record(limiter.last_decrease, 1.0, "overloaded")
+    assert limiter.current_limit == 4
+
+    for _ in range(10):
+        limiter.record(limiter.last_decrease, 1.0, "throttled")
+    assert limiter.current_limit == limiter.min_limit
+
+def test_latency_spike_counts_as_overload():
+    limiter = AdaptiveLimiter("test", initial_limit=10, latency_spike_factor=3.0)
+    limiter.record(0.0, 1.0, "success")
+    limiter.record(0.0, 5.0, "success")
+    assert limiter.counts["slow"] == 1
+    assert limiter.current_limit == 5
+
+def test_slot_classifies_failures_and_frees_the_slot():
+    limiter = AdaptiveLimiter("test", initial_limit=8)
+    with pytest.raises(FakeAPIError):
+        with limiter.slot():
+            assert limiter.in_flight == 1
+            raise FakeAPIError(429, "Too many requests")
+    assert limiter.in_flight == 0
+    assert limiter.counts["throttled"] == 1
+    assert limiter.current_limit == 4
+
+    assert classify_failure(FakeAPIError(502, "Bad gateway")) == "overloaded"
+    assert classify_failure(TimeoutError()) == "overloaded"
+    assert classify_failure(ValueError("bad request")) == "ignored"
@@ -0,0 +1,57 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+from dedup import Deduplicator, MinHashLSH  # noqa: E402
+
+PARAGRAPH = ("The keeper climbed the narrow stairs of the lighthouse every evening, counting the steps "
+             "aloud and pausing at the window to watch the fishing boats come home across the harbour.")
+REPRINT = PARAGRAPH.replace("harbour.", "harbour!").upper()  # Case and punctuation are ignored
+EDITED = PARAGRAPH.replace("harbour.", "bay.")
+OTHER = ("Nobody in the village remembered when the bakery had last closed early, yet on that grey "
+         "Tuesday its shutters were down before noon and a handwritten note hung on the door.")
+
+def test_near_duplicates_share_a_cluster():
+    lsh = MinHashLSH()
+    cluster = lsh.assign(PARAGRAPH)
+    assert lsh.assign(REPRINT) == cluster
+    assert lsh.assign(EDITED) == cluster
+    assert lsh.assign(OTHER) != cluster
+    assert lsh.clusters == 2
+
+def test_least_recently_matched_cluster_is_evicted():
+    evicted = []
+    lsh = MinHashLSH(max_clusters=2, on_evict=evicted.append)
+    first = lsh.assign(PARAGRAPH)
+    second = lsh.assign(OTHER)
+    assert lsh.assign(REPRINT) == first  # first is now the most recently matched
+
+    third = lsh.assign("A completely unrelated paragraph about the price of tea in the capital that spring.")
+    assert evicted == [second]
+    assert set(lsh.live) == {first, third}
+    assert lsh.assign(OTHER) not in (first, second, third)  # Forgotten, so it starts a new cluster
+    assert evicted == [second, first]
+    assert len(lsh.signatures) <= 2
+
+def test_deduplicator_classifies_each_cluster_once_and_forgets_evicted_results():
+    dedup = Deduplicator(max_clusters=2)
+    groups = dedup.group({0: PARAGRAPH, 1: OTHER, 2: REPRINT})
+    assert sorted(groups.values()) == [[0, 2], [1]]
+
+    paragraph_cluster = next(cluster for cluster, indices in groups.items() if 0 in indices)
+    dedup.resolve(paragraph_cluster, {"paragraph": PARAGRAPH, "emotion": "Joy"})
+    assert dedup.known(paragraph_cluster)
+    assert dedup.fan_out(paragraph_cluster, REPRINT) == {"paragraph": REPRINT, "emotion": "Joy"}
+
+    # Two new clusters push the resolved one out of the index, and its result with it
+    dedup.group({3: "The tide came in twice that night, each time higher than the almanac promised it would.",
+                 4: "Her brother kept a ledger of every letter he never sent, dated and signed in green ink."})
+    assert not dedup.known(paragraph_cluster)
+    assert dedup.report().endswith("(2 least recently seen clusters forgotten)")
+
+def test_disabled_deduplicator_keeps_every_paragraph_apart():
+    dedup = Deduplicator(enabled=False)
+    groups = dedup.group({0: PARAGRAPH, 1: PARAGRAPH})
+    assert sorted(groups.values()) == [[0], [1]]
+    assert dedup.report() == "2 paragraphs in 2 clusters, 0 duplicate classifications skipped"
@@ -0,0 +1,65 @@
+import os
+import random
+import sys
+from collections import Counter
+from math import sqrt
+from statistics import NormalDist
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+from estimate_distribution import max_width, multinomial_intervals, stratified_order  # noqa: E402
+
+LABELS = ["Joy", "Sad", "Powerful", "Scared", "Mad", "Neutral"]
+
+def test_interval_is_a_bonferroni_adjusted_wilson_interval():
+    counts = Counter({"Joy": 30, "Sad": 70})
+    intervals = multinomial_intervals(counts, ["Joy", "Sad"], population=10 ** 9, confidence=0.95)
+
+    z = NormalDist().inv_cdf(1 - 0.05 / 4)  # Two labels share the 5%
+    n, p = 100, 0.3
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half_width = sqrt(p * (1 - p) / n + z * z / (4 * n * n)) * z / (1 + z * z / n)
+    share, low, high = intervals["Joy"]
+    assert share == p
+    assert abs(low - (center - half_width)) < 1e-6
+    assert abs(high - (center + half_width)) < 1e-6
+
+def test_more_labels_widen_and_more_samples_narrow_the_intervals():
+    two = multinomial_intervals(Counter({"Joy": 50, "Sad": 50}), ["Joy", "Sad"], population=10 ** 6)
+    six = multinomial_intervals(Counter({"Joy": 50, "Sad": 50}), LABELS, population=10 ** 6)
+    larger = multinomial_intervals(Counter({"Joy": 500, "Sad": 500}), ["Joy", "Sad"], population=10 ** 6)
+    assert max_width(six) > max_width(two) > max_width(larger)
+
+def test_finite_population_correction_collapses_a_census():
+    counts = Counter({"Joy": 40, "Sad": 60})
+    census = multinomial_intervals(counts, ["Joy", "Sad"], population=100)
+    assert census == {"Joy": (0.4, 0.4, 0.4), "Sad": (0.6, 0.6, 0.6)}
+
+    half = multinomial_intervals(counts, ["Joy", "Sad"], population=200)
+    infinite = multinomial_intervals(counts, ["Joy", "Sad"], population=10 ** 9)
+    assert max_width(half) < max_width(infinite)
+
+def test_no_samples_means_no_information():
+    assert multinomial_intervals(Counter(), LABELS, population=50) == {label: (0.0, 0.0, 1.0) for label in LABELS}
+
+def test_intervals_cover_every_share_together_at_the_stated_confidence():
+    rng = random.Random(7)
+    population = [label for label, share in zip(LABELS, [30, 25, 15, 12, 10, 8]) for _ in range(share * 20)]
+    truth = {label: count / len(population) for label, count in Counter(population).items()}
+
+    trials, covered = 400, 0
+    for _ in range(trials):
+        intervals = multinomial_intervals(Counter(rng.sample(population, 300)), LABELS, len(population))
+        covered += all(low <= truth[label] <= high for label, (_, low, high) in intervals.items())
+    assert covered / trials >= 0.93
+
+def test_stratified_order_samples_chapters_in_proportion():
+    sizes = [(1, 100), (2, 300), (3, 600)]
+    order = stratified_order(sizes, seed=3)
+    assert sorted(order) == [(chapter, index) for chapter, size in sizes for index in range(size)]
+    assert order == stratified_order(sizes, seed=3)
+
+    prefix = Counter(chapter for chapter, _ in order[:100])
+    assert abs(prefix[1] - 10) <= 2
+    assert abs(prefix[2] - 30) <= 2
+    assert abs(prefix[3] - 60) <= 2
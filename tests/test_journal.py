@@ -0,0 +1,45 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+from journal import Journal  # noqa: E402
+
+def test_reopened_journal_resumes_and_drops_a_torn_line(tmp_path):
+    path = str(tmp_path / "book_emotions.journal.jsonl")
+    journal = Journal(path)
+    journal.record(1, 0, {"paragraph": "first", "emotion": "Joy"})
+    journal.record(1, 1, {"paragraph": "second", "emotion": "Sad"})
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"chapter": 1, "index": 2, "parag')  # Crash mid-write
+
+    journal = Journal(path)
+    assert journal.resumed == 2
+    assert journal.pending(1, {0: "first", 1: "second changed", 2: "third"}) == {1: "second changed", 2: "third"}
+    journal.record(1, 2, {"paragraph": "third", "emotion": "Mad"})
+    journal.close()
+
+    with open(path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert [line["index"] for line in lines] == [0, 1, 2]
+
+def test_compact_writes_chapters_in_paragraph_order(tmp_path):
+    journal = Journal(str(tmp_path / "book.journal.jsonl"))
+    journal.record(2, 1, {"paragraph": "c", "emotion": "Mad", "provider": "gpt"})
+    journal.record(1, 1, {"paragraph": "b", "emotion": "Sad", "provider": "gpt"})
+    journal.record(1, 0, {"paragraph": "a", "emotion": "Joy", "provider": "gpt"})
+    output = str(tmp_path / "book_emotions.json")
+
+    book = journal.compact(output, [(1, 2), (2, 3), (3, 1)], "emotions", fields=["paragraph", "emotion"])
+    journal.close()
+
+    with open(output, encoding="utf-8") as f:
+        assert json.load(f) == book
+    assert book == [
+        {"chapter": 1, "emotions": [{"paragraph": "a", "emotion": "Joy"}, {"paragraph": "b", "emotion": "Sad"}]},
+        {"chapter": 2, "emotions": [{"paragraph": "c", "emotion": "Mad"}]},
+        {"chapter": 3, "emotions": []},
+    ]
+    assert not os.path.exists(output + ".tmp")
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("pyarrow")
+pytest.importorskip("plotly")  # model_agreement maps Hume labels through feeling_wheel_v3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+os.environ["CLASSIFIER_BACKEND"] = "fake"
+os.environ["FAKE_LATENCY_MS"] = "1"
+os.environ["FAKE_JOB_LATENCY_MS"] = "1"
+
+import classify_emotions  # noqa: E402
+import gpt_classify_emotions  # noqa: E402
+import label_store  # noqa: E402
+from analysis_scope import AnalysisScope  # noqa: E402
+from model_agreement import agreement_report  # noqa: E402
+
+# A title page long enough to be a Hume "chapter" but shorter than the
+# 1000 characters the GPT driver requires, so the two number chapters differently
+TITLE_PAGE = "The Lantern Keeper, a novel in three short chapters, first printed in a small run."
+
+def chapter_text(number: int) -> str:
+    return "\n\n".join(
+        f"In chapter {number}, paragraph {i}, the keeper climbed the stairs again and watched the harbour lights. "
+        f"Nothing about evening {number * 10 + i} was quite like the one before it."
+        for i in range(8)
+    )
+
+def write_book(input_dir):
+    os.makedirs(input_dir)
+    chapters = "\n\n".join(f"CHAPTER {number}\n\n{chapter_text(number)}" for number in range(1, 4))
+    with open(os.path.join(input_dir, "lantern.txt"), "w", encoding="utf-8") as f:
+        f.write(f"{TITLE_PAGE}\n\n{chapters}")
+
+def test_hume_and_gpt_outputs_of_one_book_join(tmp_path):
+    input_dir, output_dir, store_dir = tmp_path / "books", tmp_path / "emotions", tmp_path / "store"
+    write_book(input_dir)
+    scope = AnalysisScope()
+
+    gpt_classify_emotions.process_books(str(input_dir), str(output_dir), scope=scope)
+    asyncio.run(classify_emotions.process_books(str(input_dir), str(output_dir), None, scope=scope))
+    for suffix in ("_emotions_gpt", "_emotions_hume"):
+        label_store.convert_file(str(output_dir / f"lantern{suffix}.json"), str(store_dir))
+
+    report = agreement_report(str(store_dir), models=["gpt", "hume"])
+
+    assert report["paragraphs"] == 25  # The title page only Hume classifies
+    # Keyed by chapter, no paragraph would be labelled by both; a few Hume
+    # emotions have no primary emotion and count as unlabelled
+    assert report["fully_labelled"] >= 20
+    assert report["pairwise"][0]["paragraphs"] == report["fully_labelled"]
+    # Per-chapter agreement uses the GPT driver's chapter numbers, the first model listed
+    assert sorted(chapter["chapter"] for chapter in report["chapters"]) == [1, 2, 3]
@@ -0,0 +1,137 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+import retry  # noqa: E402
+from fake_backends import FakeAPIError  # noqa: E402
+from journal import Journal  # noqa: E402
+from retry import (  # noqa: E402
+    CircuitBreaker, DeadLetterFile, InvalidResponseError, RetriesExhausted, RetryScheduler,
+    backoff_delay, retry_after_seconds,
+)
+
+def test_backoff_is_jittered_capped_and_never_shorter_than_retry_after():
+    delays = [backoff_delay(3, base_delay=1, max_delay=5) for _ in range(200)]
+    assert all(0 <= delay <= 5 for delay in delays)
+    assert len(set(delays)) > 1
+
+    throttled = FakeAPIError(429, "Too many requests", retry_after=7)
+    assert retry_after_seconds(throttled) == 7
+    assert all(backoff_delay(1, throttled, base_delay=1, max_delay=5) >= 7 for _ in range(50))
+
+def test_retry_after_ms_wins_over_retry_after():
+    error = FakeAPIError(429, "Too many requests", retry_after=7)
+    error.response.headers["retry-after-ms"] = "250"
+    assert retry_after_seconds(error) == 0.25
+    assert retry_after_seconds(ValueError("no response")) is None
+
+def test_breaker_opens_lets_one_probe_through_and_closes(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(retry.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", failure_threshold=3, cooldown=30)
+
+    for _ in range(2):
+        breaker.record_failure()
+    assert not breaker.is_open()
+    breaker.record_failure()
+    assert breaker.is_open()
+    assert breaker.time_until_closed() == 30
+
+    now[0] += 30
+    assert breaker.time_until_closed() == 0  # The probe
+    assert breaker.time_until_closed() == retry.PROBE_WAIT  # Everyone else waits for it
+    breaker.record_failure()  # The probe failed, so the circuit re-opens
+    assert breaker.time_until_closed() == 30
+
+    now[0] += 30
+    assert breaker.time_until_closed() == 0
+    breaker.record_success()
+    assert not breaker.is_open()
+    assert breaker.time_until_closed() == 0
+
+def flaky(failures: list):
+    """
+    A request that raises each error in failures in turn, then succeeds.
+    """
+    calls = []
+
+    def call(paragraph):
+        calls.append(paragraph)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return {"paragraph": paragraph, "emotion": "Joy"}
+    return call, calls
+
+def test_scheduler_retries_until_success_and_honours_retry_after():
+    call, calls = flaky([FakeAPIError(503, "Unavailable"), FakeAPIError(429, "Slow down", retry_after=0.2)])
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        scheduler = RetryScheduler(executor, CircuitBreaker("test"), base_delay=0.01, max_delay=0.01)
+        start = time.monotonic()
+        result = scheduler.submit(call, "a paragraph").result(timeout=5)
+        elapsed = time.monotonic() - start
+        scheduler.close()
+
+    assert result["emotion"] == "Joy"
+    assert len(calls) == 3
+    assert elapsed >= 0.2
+
+def test_scheduler_gives_up_on_client_errors_and_after_max_attempts():
+    bad_request, bad_request_calls = flaky([ValueError("bad request")])
+    invalid, invalid_calls = flaky([InvalidResponseError("Happy")] * 3)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        scheduler = RetryScheduler(executor, CircuitBreaker("test"), max_attempts=3, base_delay=0.01, max_delay=0.01)
+        with pytest.raises(RetriesExhausted) as not_retried:
+            scheduler.submit(bad_request, "a").result(timeout=5)
+        with pytest.raises(RetriesExhausted) as exhausted:
+            scheduler.submit(invalid, "b").result(timeout=5)
+        scheduler.close()
+
+    assert (not_retried.value.attempts, len(bad_request_calls)) == (1, 1)
+    assert (exhausted.value.attempts, len(invalid_calls)) == (3, 3)
+    assert isinstance(exhausted.value.error, InvalidResponseError)
+
+def test_open_breaker_holds_requests_without_a_worker():
+    breaker = CircuitBreaker("test", failure_threshold=1, cooldown=0.3)
+    breaker.record_failure()
+    call, calls = flaky([])
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        scheduler = RetryScheduler(executor, breaker)
+        future = scheduler.submit(call, "a")
+        # The only worker is free while the request waits for the circuit
+        assert executor.submit(lambda: "free").result(timeout=0.1) == "free"
+        assert calls == []
+        assert future.result(timeout=5)["emotion"] == "Joy"
+        scheduler.close()
+    assert not breaker.is_open()
+
+def test_dead_letters_stay_until_journaled_and_can_be_rerun_alone(tmp_path):
+    path = str(tmp_path / "book_emotions.deadletter.jsonl")
+    journal = Journal(str(tmp_path / "book_emotions.journal.jsonl"))
+    dead_letters = DeadLetterFile(path, only=False)
+    dead_letters.add(1, 0, "first", RetriesExhausted(FakeAPIError(500, "Oops"), 5))
+    dead_letters.add(1, 1, "second", RetriesExhausted(FakeAPIError(500, "Oops"), 5))
+    dead_letters.close(journal)
+
+    rerun = DeadLetterFile(path, only=True)
+    assert rerun.select(1, {0: "first", 1: "second", 2: "third"}) == {0: "first", 1: "second"}
+    assert rerun.select(1, {0: "first edited"}) == {}
+    journal.record(1, 0, {"paragraph": "first", "emotion": "Joy"})
+    rerun.close(journal)
+    journal.close()
+
+    with open(path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert [(entry["chapter"], entry["index"], entry["attempts"]) for entry in entries] == [(1, 1, 5)]
+    assert entries[0]["error"] == "FakeAPIError: Error code: 500 - Oops"
+
+    journal = Journal(str(tmp_path / "book_emotions.journal.jsonl"))
+    journal.record(1, 1, {"paragraph": "second", "emotion": "Sad"})
+    DeadLetterFile(path, only=False).close(journal)
+    journal.close()
+    assert not os.path.exists(path)